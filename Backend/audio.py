@@ -0,0 +1,185 @@
+import io
+import os
+import asyncio
+import wave
+import tempfile
+import logging
+
+from executor import run_blocking, run_subprocess
+from vad import VAD_ENABLED, trim_silence
+from telemetry import AUDIO_SECONDS, stage
+
+logger = logging.getLogger(__name__)
+
+TARGET_SAMPLE_RATE = 16000
+TARGET_CHANNELS = 1
+SAMPLE_WIDTH = 2  # 16-bit PCM
+PCM_READ_SIZE = TARGET_SAMPLE_RATE * SAMPLE_WIDTH // 10  # 100 ms
+
+# Format sent to Whisper: "wav" (no re-encode), "flac" (lossless, ~50% smaller) or "opus" (smallest)
+WHISPER_UPLOAD_FORMAT = os.getenv("WHISPER_UPLOAD_FORMAT", "wav").lower()
+
+UPLOAD_ENCODERS = {
+    "flac": (["-c:a", "flac", "-f", "flac"], "audio.flac"),
+    "opus": (["-c:a", "libopus", "-b:a", "24k", "-application", "voip", "-f", "ogg"], "audio.ogg"),
+}
+
+
+def is_wav(content):
+    return len(content) >= 12 and content[:4] == b"RIFF" and content[8:12] == b"WAVE"
+
+
+def read_target_pcm(content):
+    """
+    Return the raw PCM frames if the content is already a 16 kHz mono 16-bit WAV,
+    otherwise None (the caller then has to resample).
+    """
+    if not is_wav(content):
+        return None
+    try:
+        with wave.open(io.BytesIO(content), "rb") as wav:
+            if (wav.getframerate(), wav.getnchannels(), wav.getsampwidth()) != (TARGET_SAMPLE_RATE, TARGET_CHANNELS, SAMPLE_WIDTH):
+                return None
+            return wav.readframes(wav.getnframes())
+    except (wave.Error, EOFError):
+        # Float or extensible WAVs are not handled by the wave module; let ffmpeg decode them
+        return None
+
+
+def pcm_seconds(pcm):
+    return len(pcm) / (TARGET_SAMPLE_RATE * SAMPLE_WIDTH)
+
+
+def pcm_to_wav(pcm):
+    """Wrap 16 kHz mono 16-bit PCM in a WAV container, in memory"""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(TARGET_CHANNELS)
+        wav.setsampwidth(SAMPLE_WIDTH)
+        wav.setframerate(TARGET_SAMPLE_RATE)
+        wav.writeframes(pcm)
+    return buffer.getvalue()
+
+
+async def decode_to_pcm(content):
+    """
+    Decode any audio container to 16 kHz mono 16-bit PCM.
+    WAVs already in the target format are decoded in-process; everything else
+    is piped through ffmpeg stdin/stdout without touching the disk.
+    """
+    pcm = read_target_pcm(content)
+    if pcm is not None:
+        return pcm
+    output_args = ["-ar", str(TARGET_SAMPLE_RATE), "-ac", str(TARGET_CHANNELS), "-f", "s16le", "pipe:1"]
+    try:
+        return await run_subprocess(
+            "ffmpeg",
+            "ffmpeg", "-hide_banner", "-loglevel", "error", "-i", "pipe:0", *output_args,
+            input=content,
+        )
+    except RuntimeError:
+        # Containers with the index at the end (e.g. MP4/M4A from Safari) need a seekable input
+        logger.info("Piped decode failed, retrying ffmpeg from a seekable temp file")
+    with tempfile.NamedTemporaryFile(suffix=".audio") as tmp_in:
+        tmp_in.write(content)
+        tmp_in.flush()
+        return await run_subprocess(
+            "ffmpeg",
+            "ffmpeg", "-hide_banner", "-loglevel", "error", "-i", tmp_in.name, *output_args,
+        )
+
+
+async def encode_for_upload(pcm, upload_format=None):
+    """Encode PCM for the Whisper upload; returns (audio_bytes, filename)"""
+    upload_format = (upload_format or WHISPER_UPLOAD_FORMAT).lower()
+    AUDIO_SECONDS.inc(pcm_seconds(pcm), kind="uploaded")
+    encoder = UPLOAD_ENCODERS.get(upload_format)
+    if encoder is None:
+        return pcm_to_wav(pcm), "audio.wav"
+    codec_args, filename = encoder
+    encoded = await run_subprocess(
+        "ffmpeg",
+        "ffmpeg", "-hide_banner", "-loglevel", "error",
+        "-f", "s16le", "-ar", str(TARGET_SAMPLE_RATE), "-ac", str(TARGET_CHANNELS), "-i", "pipe:0",
+        *codec_args, "pipe:1",
+        input=pcm,
+    )
+    return encoded, filename
+
+
+async def prepare_audio_for_whisper(content, upload_format=None):
+    """
+    Transcode an uploaded recording into the payload sent to Whisper, with silence trimmed.
+    Returns (audio_bytes, filename, speech) where `speech` holds the VAD stats; when
+    speech["has_speech"] is False nothing is encoded and audio_bytes is None.
+    """
+    with stage("decode"):
+        pcm = await decode_to_pcm(content)
+    AUDIO_SECONDS.inc(pcm_seconds(pcm), kind="received")
+    if VAD_ENABLED:
+        with stage("vad"):
+            pcm, speech = await run_blocking("vad", trim_silence, pcm, TARGET_SAMPLE_RATE)
+        if not speech["has_speech"]:
+            logger.info("No speech detected in %.2fs of audio", speech["duration_seconds"])
+            return None, None, speech
+    else:
+        duration = round(pcm_seconds(pcm), 2)
+        speech = {"duration_seconds": duration, "speech_seconds": None, "speech_ratio": None, "uploaded_seconds": duration, "has_speech": True}
+    with stage("encode"):
+        audio_bytes, filename = await encode_for_upload(pcm, upload_format)
+    logger.debug("Prepared %s for Whisper: %d bytes in, %d bytes out, speech %s", filename, len(content), len(audio_bytes), speech)
+    return audio_bytes, filename, speech
+
+
+class StreamingDecoder:
+    """
+    Decode audio that arrives in chunks (e.g. MediaRecorder timeslices) to
+    16 kHz mono 16-bit PCM as it arrives. "pcm16" input (already 16 kHz mono
+    s16le) is passed through; anything else is fed to a long-lived ffmpeg
+    process over stdin and read back from stdout.
+    """
+
+    def __init__(self, input_format="pcm16"):
+        self.input_format = input_format.lower()
+        self._process = None
+        self._queue = None
+
+    async def start(self):
+        if self.input_format == "pcm16":
+            self._queue = asyncio.Queue()
+            return
+        self._process = await asyncio.create_subprocess_exec(
+            "ffmpeg", "-hide_banner", "-loglevel", "error", "-i", "pipe:0",
+            "-ar", str(TARGET_SAMPLE_RATE), "-ac", str(TARGET_CHANNELS), "-f", "s16le", "pipe:1",
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+
+    async def write(self, data):
+        if self._queue is not None:
+            self._queue.put_nowait(data)
+            return
+        self._process.stdin.write(data)
+        await self._process.stdin.drain()
+
+    async def close(self):
+        """Signal the end of the input; read() returns b"" once everything is decoded"""
+        if self._queue is not None:
+            self._queue.put_nowait(b"")
+        elif self._process.stdin and not self._process.stdin.is_closing():
+            self._process.stdin.close()
+
+    async def read(self):
+        if self._queue is not None:
+            pcm = await self._queue.get()
+        else:
+            pcm = await self._process.stdout.read(PCM_READ_SIZE)
+        AUDIO_SECONDS.inc(pcm_seconds(pcm), kind="received")
+        return pcm
+
+    async def aclose(self):
+        """Release the ffmpeg process (safe to call more than once)"""
+        if self._process is not None and self._process.returncode is None:
+            self._process.kill()
+            await self._process.wait()
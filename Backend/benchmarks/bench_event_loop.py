@@ -0,0 +1,83 @@
+"""
+Event-loop isolation benchmark.
+
+Measures /transcribe latency on its own and again while /upload_documents
+OCR jobs run concurrently. With the blocking work moved to the executor
+layer the two p99 figures should stay close. Requires ffmpeg and tesseract.
+
+    cd Backend && python -m benchmarks.bench_event_loop --requests 200 --ocr-jobs 4
+"""
+import time
+import asyncio
+import argparse
+
+import httpx
+
+from benchmarks.common import FakeAsyncOpenAI, make_wav, make_text_image, summarize
+
+import main
+
+
+async def transcribe_load(client, requests, concurrency, audio):
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.post(
+                "/transcribe",
+                files={"file": ("clip.wav", audio, "audio/wav")},
+                data={"language": "english"},
+            )
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one() for _ in range(requests)))
+    return latencies
+
+
+async def ocr_load(client, stop, image):
+    completed = 0
+    while not stop.is_set():
+        response = await client.post(
+            "/upload_documents",
+            files=[("files", ("scan.png", image, "image/png"))],
+            data={"query": "", "language": "english", "chat_history": "[]"},
+        )
+        response.raise_for_status()
+        completed += 1
+    return completed
+
+
+async def run(args):
+    main.openai_client = FakeAsyncOpenAI(latency=args.api_latency)
+    audio = make_wav(3.0, sample_rate=44100, channels=2)
+    image = make_text_image()
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        baseline = await transcribe_load(client, args.requests, args.concurrency, audio)
+
+        stop = asyncio.Event()
+        ocr_tasks = [asyncio.create_task(ocr_load(client, stop, image)) for _ in range(args.ocr_jobs)]
+        loaded = await transcribe_load(client, args.requests, args.concurrency, audio)
+        stop.set()
+        ocr_completed = sum(await asyncio.gather(*ocr_tasks))
+
+    print(summarize("/transcribe (idle)", baseline))
+    print(summarize(f"/transcribe ({args.ocr_jobs} OCR jobs)", loaded))
+    print(f"OCR uploads completed during load: {ocr_completed}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--ocr-jobs", type=int, default=4)
+    parser.add_argument("--api-latency", type=float, default=0.05, help="simulated OpenAI latency in seconds")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(run(parse_args()))
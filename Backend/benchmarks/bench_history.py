@@ -0,0 +1,94 @@
+"""
+Chat-history benchmark.
+
+Replays a long conversation turn by turn and builds the chat messages for
+each turn, once sending the whole history verbatim (the previous
+behaviour) and once with token-budgeted compaction. Reports prompt tokens
+and build time at a few points of the conversation; with compaction the
+token count should level off instead of growing with every turn.
+
+The history is kept as a session keeps it, trimmed to SESSION_MAX_TURNS /
+SESSION_MAX_CHARS, and the background summarize calls are counted: past the
+trim threshold each turn should still only summarize the turns that are new
+since the last summary, not the whole history again.
+
+    cd Backend && python -m benchmarks.bench_history --turns 150
+"""
+import time
+import asyncio
+import argparse
+
+from benchmarks.common import FakeAsyncOpenAI
+
+import main
+import history
+from session_store import SESSION_MAX_TURNS, trim_session
+
+
+def count_tokens(messages):
+    return sum(history.count_tokens(message["content"]) for message in messages)
+
+
+def make_turn(index):
+    user_text = f"Question {index}: can you explain step {index} of the setup process in more detail?"
+    assistant_text = " ".join(
+        f"Step {index}.{n} configures the service and checks that the previous step completed." for n in range(12)
+    )
+    return {"user": user_text, "ai": assistant_text}
+
+
+def verbatim_messages(prompt, chat_history):
+    messages = [{"role": "system", "content": "You are a helpful AI assistant."}]
+    for chat in chat_history:
+        messages.append({"role": "user", "content": chat["user"]})
+        messages.append({"role": "assistant", "content": chat["ai"]})
+    messages.append({"role": "user", "content": prompt})
+    return messages
+
+
+async def run(args):
+    main.openai_client = FakeAsyncOpenAI(latency=0.01)
+    summarize = main.summarize_history
+    calls = {"count": 0, "turns": 0}
+
+    async def counted_summarize(previous_summary, turns):
+        calls["count"] += 1
+        calls["turns"] += len(turns)
+        return await summarize(previous_summary, turns)
+
+    main.summarize_history = counted_summarize
+    session = {"chat_history": [], "document_ids": []}
+    chat_history = session["chat_history"]
+    checkpoints = {1, 10, 25, 50, 75, SESSION_MAX_TURNS, args.turns}
+    for turn in range(1, args.turns + 1):
+        prompt = f"Question {turn}: what comes next?"
+
+        start = time.perf_counter()
+        full = verbatim_messages(prompt, chat_history)
+        full_elapsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        compacted = main.build_chat_messages(prompt, chat_history)
+        compact_elapsed = time.perf_counter() - start
+
+        if turn in checkpoints:
+            print(
+                f"turn {turn:>4}  verbatim tokens={count_tokens(full):>7} build={full_elapsed * 1000:6.2f}ms  "
+                f"compacted tokens={count_tokens(compacted):>6} build={compact_elapsed * 1000:6.2f}ms  "
+                f"summarize calls={calls['count']:>4} turns summarized={calls['turns']:>5}"
+            )
+        chat_history.append(make_turn(turn))
+        trim_session(session)
+        # Give background summarization a chance to finish, as the gap between real turns would
+        await asyncio.sleep(args.think_time)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=150, help="conversation length (past the SESSION_MAX_TURNS trim)")
+    parser.add_argument("--think-time", type=float, default=0.02, help="seconds between turns")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(run(parse_args()))
@@ -0,0 +1,114 @@
+"""
+Local intent gate benchmark.
+
+Checks intent.classify against the labelled turns in intent_cases.tsv
+(English, Hindi, Arabic and romanized Hindi) and times it per call, next to
+the previous gate (a linear scan over a list of acknowledgements plus
+ASCII-only gibberish heuristics). The previous gate only told trivial turns
+from queries, so both are also scored on that split.
+
+    cd Backend && python -m benchmarks.bench_intent --min-accuracy 0.95
+"""
+import os
+import sys
+import time
+import argparse
+
+from benchmarks.common import percentile
+
+from intent import QUERY, UNCLEAR, classify
+
+CASES_PATH = os.path.join(os.path.dirname(__file__), "intent_cases.tsv")
+
+# The gate as it was before the intent module, for comparison
+LEGACY_ACKS = [
+    'ok', 'okay', 'thank you', 'thanks', 'thx', 'k', 'kk', 'cool', 'great', 'nice', 'alright', 'sure', 'fine', 'noted', 'got it', 'roger', 'yup', 'yes', 'ya', 'yaar', 'acha', 'shukriya', 'dhanyavad', 'done', 'welcome', 'no', 'bye', 'see you', 'see ya', 'goodbye', 'good bye', 'ciao', 'tata', 'tc', 'take care', 'hmm', 'uhh', 'umm', 'err', 'ahh', 'ohh'
+]
+LEGACY_GIBBERISH = [
+    'otay', 'emjgr', 'thik', 'hmm', 'uhh', 'umm', 'err', 'ahh', 'ohh',
+    'xyz', 'abc', 'qwe', 'asd', 'zxc', 'dfg', 'hjk', 'vbn', 'mnb',
+    'test', 'testing', '123', 'hello', 'hi', 'hey'
+]
+
+
+def legacy_classify(text):
+    normalized = text.strip().lower()
+    if any(normalized == ack or normalized.startswith(ack + ' ') for ack in LEGACY_ACKS):
+        return "ack"
+    if len(normalized) <= 2 or normalized in LEGACY_GIBBERISH:
+        return UNCLEAR
+    if not any(vowel in normalized for vowel in 'aeiou') and normalized not in ['by', 'my', 'try', 'why', 'sky', 'dry', 'fly', 'cry']:
+        return UNCLEAR
+    consonant_count = 0
+    for char in normalized:
+        if char in 'bcdfghjklmnpqrstvwxyz':
+            consonant_count += 1
+            if consonant_count > 3:
+                return UNCLEAR
+        else:
+            consonant_count = 0
+    return QUERY
+
+
+def load_cases(path):
+    cases = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip() and not line.startswith("#"):
+                text, expected = line.rstrip("\n").split("\t")
+                cases.append((text, expected))
+    return cases
+
+
+def timings(classifier, cases, rounds):
+    samples = []
+    for _ in range(rounds):
+        for text, _ in cases:
+            start = time.perf_counter()
+            classifier(text)
+            samples.append(time.perf_counter() - start)
+    return samples
+
+
+def run(args):
+    cases = load_cases(args.cases)
+    exact = 0
+    split = {"intent": 0, "legacy": 0}
+    mistakes = []
+    for text, expected in cases:
+        got, legacy = classify(text), legacy_classify(text)
+        exact += got == expected
+        split["intent"] += (got == QUERY) == (expected == QUERY)
+        split["legacy"] += (legacy == QUERY) == (expected == QUERY)
+        if got != expected:
+            mistakes.append((text, expected, got))
+
+    for text, expected, got in mistakes:
+        print(f"  miss: {text!r} expected={expected} got={got}")
+    accuracy = exact / len(cases)
+    print(f"\n{len(cases)} cases")
+    print(f"intent accuracy:                {accuracy:.1%}")
+    print(f"trivial/query split, intent:    {split['intent'] / len(cases):.1%}")
+    print(f"trivial/query split, legacy:    {split['legacy'] / len(cases):.1%}\n")
+
+    for name, classifier in (("intent.classify", classify), ("legacy gate", legacy_classify)):
+        samples = timings(classifier, cases, args.rounds)
+        print(
+            f"{name:<20} n={len(samples):<6} p50={percentile(samples, 50) * 1e6:6.1f}us "
+            f"p95={percentile(samples, 95) * 1e6:6.1f}us p99={percentile(samples, 99) * 1e6:6.1f}us"
+        )
+    return accuracy
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cases", default=CASES_PATH, help="TSV of text<TAB>expected intent")
+    parser.add_argument("--rounds", type=int, default=200, help="timing passes over the cases")
+    parser.add_argument("--min-accuracy", type=float, default=0.0, help="exit with status 1 below this accuracy")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if run(args) < args.min_accuracy:
+        sys.exit(1)
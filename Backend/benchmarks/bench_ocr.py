@@ -0,0 +1,64 @@
+"""
+OCR benchmark.
+
+Compares the previous OCR path (full-resolution image, PSM 6 then PSM 3,
+original bytes base64-encoded for the vision model) with the OCR
+subsystem (normalized, binarized image, adaptive PSM, result cache,
+downscaled JPEG thumbnail). Requires tesseract.
+
+    cd Backend && python -m benchmarks.bench_ocr --width 4000 --height 3000
+"""
+import io
+import time
+import base64
+import argparse
+
+import pytesseract
+from PIL import Image
+
+from benchmarks.common import make_text_image
+
+import ocr
+from extractors import extract_image
+
+LEGACY_BLOCK_CONFIG = ocr.BLOCK_CONFIG
+LEGACY_PAGE_CONFIG = ocr.PAGE_CONFIG
+
+
+def legacy_ocr(content):
+    image = Image.open(io.BytesIO(content)).convert("RGB")
+    text = pytesseract.image_to_string(image, config=LEGACY_BLOCK_CONFIG).strip()
+    if not text:
+        text = pytesseract.image_to_string(image, config=LEGACY_PAGE_CONFIG).strip()
+    return text, base64.b64encode(content).decode("utf-8")
+
+
+def measure(name, func, content, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        text, payload = func(content)
+    elapsed = (time.perf_counter() - start) / iterations
+    print(f"{name:<28} {elapsed * 1000:9.1f}ms/image  text={len(text):>6} chars  vision_payload={len(payload or ''):>9}B")
+
+
+def run(args):
+    content = make_text_image(size=(args.width, args.height))
+    print(f"input: {args.width}x{args.height} PNG, {len(content)} bytes")
+    measure("legacy", legacy_ocr, content, args.iterations)
+    ocr.ocr_cache = ocr.OCRCache(0)
+    measure("preprocessed (cold)", extract_image, content, args.iterations)
+    ocr.ocr_cache = ocr.OCRCache(16)
+    extract_image(content)
+    measure("preprocessed (cached)", extract_image, content, args.iterations)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--width", type=int, default=4000)
+    parser.add_argument("--height", type=int, default=3000)
+    parser.add_argument("--iterations", type=int, default=3)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    run(parse_args())
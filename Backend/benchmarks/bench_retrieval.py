@@ -0,0 +1,73 @@
+"""
+Document-context benchmark.
+
+Builds the messages for a document query over 1, 10 and 100 synthetic
+documents, once with every document stuffed into the system prompt (the
+previous behaviour) and once with top-k chunk retrieval. Reports prompt
+tokens (as history.count_tokens counts them: tiktoken when its encoding can be
+loaded, otherwise ~4 characters per token) and
+the time spent assembling the prompt.
+
+    cd Backend && python -m benchmarks.bench_retrieval
+"""
+import time
+import random
+import asyncio
+import argparse
+
+from benchmarks.common import FakeAsyncOpenAI
+
+import main
+import history
+import retrieval
+from extractors import join_pages
+
+TOPICS = ["refund", "warranty", "shipping", "invoice", "termination", "liability", "payment", "privacy"]
+
+
+def count_tokens(messages):
+    text = "".join(message["content"] for message in messages if isinstance(message["content"], str))
+    return history.count_tokens(text)
+
+
+def make_document(index, pages, rng):
+    page_texts = []
+    for page in range(pages):
+        topic = rng.choice(TOPICS)
+        sentences = [
+            f"Clause {index}.{page}.{n}: the {topic} policy states that {rng.choice(TOPICS)} terms apply within {rng.randint(1, 90)} days."
+            for n in range(25)
+        ]
+        page_texts.append(" ".join(sentences))
+    content, page_offsets = join_pages(page_texts)
+    document = {"filename": f"contract_{index}.pdf", "content": content, "page_offsets": page_offsets, "is_image": False}
+    document["chunks"] = retrieval.chunk_document(document)
+    return document
+
+
+async def measure(documents, full_context):
+    main.FULL_CONTEXT_CHARS = float("inf") if full_context else retrieval.FULL_CONTEXT_CHARS
+    start = time.perf_counter()
+    messages, _ = await main.build_document_messages("What is the refund window for invoices?", documents, [])
+    elapsed = time.perf_counter() - start
+    return count_tokens(messages), elapsed
+
+
+async def run(args):
+    main.openai_client = FakeAsyncOpenAI()
+    rng = random.Random(0)
+    for count in (1, 10, 100):
+        documents = [make_document(i, args.pages, rng) for i in range(count)]
+        for label, full_context in (("full documents", True), ("top-k chunks", False)):
+            tokens, elapsed = await measure(documents, full_context)
+            print(f"{count:>4} docs / {label:<15} prompt_tokens={tokens:>9} build={elapsed * 1000:8.1f}ms")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=5, help="pages per synthetic document")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(run(parse_args()))
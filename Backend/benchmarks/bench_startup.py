@@ -0,0 +1,146 @@
+"""
+Cold start and per-worker memory.
+
+For each worker count, starts `uvicorn main:app --workers N` and measures the
+time until the first response, then the RSS of every worker once idle and
+again after one document upload (which loads the PDF/DOCX extractors).
+`import main` is also timed in a fresh interpreter. Uses only endpoints every
+revision has, so it can be run on two revisions to compare them.
+
+    cd Backend && python -m benchmarks.bench_startup --workers 1 4 --rounds 3
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import statistics
+import subprocess
+
+import httpx
+
+from benchmarks import fixtures
+from benchmarks.bench_suite import BACKEND_DIR, free_port, rss_mb
+from benchmarks.bench_upload import child_pids
+
+IMPORT_SCRIPT = "import time; start = time.perf_counter(); import main; print(time.perf_counter() - start)"
+
+
+def worker_pids(pid, workers):
+    """The server process with one worker, else the spawned worker processes"""
+    if workers == 1:
+        return [pid]
+    return [child for child in child_pids(pid)[1:] if b"multiprocessing" in read_cmdline(child) and b"resource_tracker" not in read_cmdline(child)]
+
+
+def read_cmdline(pid):
+    try:
+        with open(f"/proc/{pid}/cmdline", "rb") as f:
+            return f.read()
+    except OSError:
+        return b""
+
+
+def import_seconds(env):
+    output = subprocess.run([sys.executable, "-c", IMPORT_SCRIPT], cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True)
+    return float(output.stdout.strip().splitlines()[-1])
+
+
+async def first_response(client, process, started, timeout=120):
+    """Seconds from `started` until the server answers any request"""
+    while time.perf_counter() - started < timeout:
+        if process.poll() is not None:
+            raise RuntimeError("backend exited during startup")
+        try:
+            await client.get("/healthz")
+            return time.perf_counter() - started
+        except httpx.TransportError:
+            await asyncio.sleep(0.01)
+    raise RuntimeError("backend did not start")
+
+
+async def settle(pids, seconds=1.0):
+    # Let every worker finish starting before reading its RSS
+    await asyncio.sleep(seconds)
+    return [round(rss_mb(pid), 1) for pid in pids]
+
+
+async def start_round(workers, env, documents):
+    port = free_port()
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=60) as client:
+            startup = await first_response(client, process, started)
+            pids = []
+            for _ in range(100):
+                pids = worker_pids(process.pid, workers)
+                if len(pids) == workers:
+                    break
+                await asyncio.sleep(0.1)
+            idle = await settle(pids)
+            # One upload per worker (connections are spread across them) loads the extractors
+            for _ in range(workers * 2):
+                files = [("files", (name, content)) for name, content in documents.items()]
+                (await client.post("/upload_documents", files=files, data={"query": ""})).raise_for_status()
+            loaded = await settle(pids, 0.2)
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+    return {"startup_s": startup, "idle_rss_mb": idle, "after_upload_rss_mb": loaded}
+
+
+async def run(args):
+    env = dict(os.environ, OPENAI_API_KEY=os.getenv("OPENAI_API_KEY", "benchmark-key"))
+    directory = fixtures.generate(args.fixtures_cache)
+    all_documents = fixtures.load_documents(directory)
+    documents = {name: all_documents[name] for name in ("contract_2_pages.pdf", "policy.docx") if name in all_documents}
+
+    imports = [import_seconds(env) for _ in range(args.rounds)]
+    results = {"import_main_s": round(statistics.median(imports), 3), "workers": {}}
+    print(f"import main: {results['import_main_s'] * 1000:.0f}ms (median of {args.rounds})\n")
+    print(f"{'workers':<8} {'first response':>15} {'idle RSS/worker':>16} {'after upload':>13} {'total idle':>11}")
+    for workers in args.workers:
+        rounds = [await start_round(workers, env, documents) for _ in range(args.rounds)]
+        idle = [statistics.mean(r["idle_rss_mb"]) for r in rounds]
+        loaded = [statistics.mean(r["after_upload_rss_mb"]) for r in rounds]
+        metrics = {
+            "startup_s": round(statistics.median(r["startup_s"] for r in rounds), 3),
+            "idle_rss_mb_per_worker": round(statistics.median(idle), 1),
+            "after_upload_rss_mb_per_worker": round(statistics.median(loaded), 1),
+            "idle_rss_mb_total": round(statistics.median(sum(r["idle_rss_mb"]) for r in rounds), 1),
+        }
+        results["workers"][str(workers)] = metrics
+        print(
+            f"{workers:<8} {metrics['startup_s'] * 1000:>13.0f}ms {metrics['idle_rss_mb_per_worker']:>14.1f}MB "
+            f"{metrics['after_upload_rss_mb_per_worker']:>11.1f}MB {metrics['idle_rss_mb_total']:>9.1f}MB"
+        )
+    return results
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", nargs="*", type=int, default=[1, 4])
+    parser.add_argument("--rounds", type=int, default=3, help="starts per worker count (the median is reported)")
+    parser.add_argument("--fixtures-cache", default=os.path.join(BACKEND_DIR, "benchmarks", ".fixtures"))
+    parser.add_argument("--output", help="write the results as JSON")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    results = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+"""
+End-to-end latency/throughput benchmark, fully offline.
+
+Starts the local OpenAI stand-in (benchmarks.fake_openai_server) and the
+backend (uvicorn main:app pointed at it through OPENAI_BASE_URL), then drives
+/transcribe, /generate_response, /tts, /upload_documents, /query_documents and
+/query_documents/batch with the fixture corpora at a fixed concurrency.
+Reports p50/p95/p99 latency, throughput, errors and the backend's peak RSS per
+endpoint, and can save the results as a baseline or compare against one (exit
+status 1 on regression).
+
+    cd Backend && python -m benchmarks.bench_suite --concurrency 8 --requests 100 --save-baseline baseline.json
+    cd Backend && python -m benchmarks.bench_suite --concurrency 8 --requests 100 --baseline baseline.json
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import itertools
+import subprocess
+
+import httpx
+
+from benchmarks import fixtures
+from benchmarks.common import percentile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENDPOINTS = ["transcribe", "generate_response", "generate_response_stream", "tts", "upload_documents", "query_documents", "query_documents_batch"]
+BATCH_QUERIES = 10  # questions per /query_documents/batch request
+# Metrics compared against the baseline, and whether higher is better
+COMPARED_METRICS = {"p50_ms": False, "p95_ms": False, "p99_ms": False, "throughput_rps": True, "peak_rss_mb": False}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def rss_mb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+def start_servers(args):
+    fake_port, backend_port = free_port(), free_port()
+    fake = subprocess.Popen(
+        [
+            sys.executable, "-m", "benchmarks.fake_openai_server", "--port", str(fake_port),
+            "--latency", str(args.latency), "--tokens-per-second", str(args.tokens_per_second),
+            "--tts-seconds-per-char", str(args.tts_seconds_per_char), "--error-rate", str(args.error_rate),
+        ],
+        cwd=BACKEND_DIR,
+    )
+    env = dict(
+        os.environ,
+        OPENAI_BASE_URL=f"http://127.0.0.1:{fake_port}/v1",
+        OPENAI_API_KEY="benchmark-key",
+        **{f"OPENAI_RPM_{model}": "1000000" for model in ("GPT_4O_MINI", "GPT_4O", "WHISPER_1", "TTS_1", "TEXT_EMBEDDING_3_SMALL")},
+    )
+    backend = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(backend_port), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        env=env,
+        stdout=None if args.verbose else subprocess.DEVNULL,
+        stderr=None if args.verbose else subprocess.DEVNULL,
+    )
+    return fake, backend, f"http://127.0.0.1:{backend_port}"
+
+
+async def wait_ready(client, backend, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if backend.poll() is not None:
+            raise RuntimeError("backend exited during startup")
+        try:
+            if (await client.get("/openapi.json")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.25)
+    raise RuntimeError("backend did not become ready")
+
+
+def request_factories(audio, documents, document_ids):
+    """One callable per endpoint, taking (client, request_number) and returning the response"""
+    audio_files = itertools.cycle(audio.items())
+    document_files = itertools.cycle(documents.items())
+
+    async def transcribe(client, n):
+        name, content = next(audio_files)
+        return await client.post("/transcribe", files={"file": (name, content)}, data={"language": "english"})
+
+    async def generate_response(client, n):
+        return await client.post("/generate_response", json={"prompt": f"What is the refund policy? ({n})", "language": "english"})
+
+    async def generate_response_stream(client, n):
+        payload = {"prompt": f"What is the refund policy? ({n})", "language": "english", "stream": True}
+        async with client.stream("POST", "/generate_response", json=payload) as response:
+            await response.aread()
+            return response
+
+    async def tts(client, n):
+        # Distinct text per request, so the TTS cache does not answer every call
+        text = f"Request {n}. Refunds are issued within ten business days. The warranty covers defects for two years."
+        return await client.post("/tts", json={"prompt": text, "language": "english", "audio_format": "mp3"})
+
+    async def upload_documents(client, n):
+        name, content = next(document_files)
+        return await client.post("/upload_documents", files=[("files", (name, content))], data={"query": ""})
+
+    async def query_documents(client, n):
+        payload = {"query": f"How long do refunds take? ({n})", "document_ids": document_ids, "language": "english"}
+        return await client.post("/query_documents", json=payload)
+
+    async def query_documents_batch(client, n):
+        queries = [f"What does section {i} say about refunds? ({n})" for i in range(BATCH_QUERIES)]
+        return await client.post("/query_documents/batch", json={"queries": queries, "document_ids": document_ids, "language": "english"})
+
+    return {name: function for name, function in locals().items() if name in ENDPOINTS}
+
+
+async def upload_for_queries(client, documents):
+    name, content = next(iter(documents.items()))
+    response = await client.post("/upload_documents", files=[("files", (name, content))], data={"query": ""})
+    response.raise_for_status()
+    return [document["document_id"] for document in response.json()["documents"]]
+
+
+async def run_endpoint(client, send, pid, args):
+    latencies = []
+    errors = 0
+    peak_rss = rss_mb(pid)
+    counter = itertools.count()
+    running = True
+
+    async def sample_rss():
+        nonlocal peak_rss
+        while running:
+            peak_rss = max(peak_rss, rss_mb(pid))
+            await asyncio.sleep(0.05)
+
+    async def worker():
+        nonlocal errors
+        while (n := next(counter)) < args.requests:
+            start = time.perf_counter()
+            try:
+                response = await send(client, n)
+                ok = response.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors += 1
+
+    sampler = asyncio.create_task(sample_rss())
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+    running = False
+    await sampler
+    return {
+        "requests": args.requests,
+        "errors": errors,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "peak_rss_mb": round(peak_rss, 1),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Print the change per metric; returns the list of regressions beyond `tolerance`"""
+    regressions = []
+    print(f"\n{'endpoint':<26} {'metric':<15} {'baseline':>10} {'current':>10} {'change':>8}")
+    for endpoint, metrics in results["endpoints"].items():
+        before = baseline.get("endpoints", {}).get(endpoint)
+        if not before:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            old, new = before.get(metric), metrics[metric]
+            if not old:
+                continue
+            change = (new - old) / old
+            worse = -change if higher_is_better else change
+            flag = "  REGRESSION" if worse > tolerance else ""
+            if flag:
+                regressions.append(f"{endpoint} {metric}")
+            print(f"{endpoint:<26} {metric:<15} {old:>10} {new:>10} {change:>+8.1%}{flag}")
+    return regressions
+
+
+async def run(args):
+    directory = args.fixtures or fixtures.generate(args.fixtures_cache)
+    audio, documents = fixtures.load_audio(directory), fixtures.load_documents(directory)
+    fake, backend, base_url = start_servers(args)
+    results = {
+        "settings": {key: getattr(args, key) for key in ("concurrency", "requests", "latency", "tokens_per_second", "tts_seconds_per_char", "error_rate")},
+        "endpoints": {},
+    }
+    try:
+        timeout = httpx.Timeout(120.0)
+        limits = httpx.Limits(max_connections=args.concurrency * 2)
+        async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+            await wait_ready(client, backend)
+            results["startup_rss_mb"] = round(rss_mb(backend.pid), 1)
+            document_ids = await upload_for_queries(client, documents)
+            factories = request_factories(audio, documents, document_ids)
+            for endpoint in args.endpoints:
+                metrics = await run_endpoint(client, factories[endpoint], backend.pid, args)
+                results["endpoints"][endpoint] = metrics
+                print(
+                    f"{endpoint:<26} n={metrics['requests']:<5} errors={metrics['errors']:<4} "
+                    f"p50={metrics['p50_ms']:8.1f}ms p95={metrics['p95_ms']:8.1f}ms p99={metrics['p99_ms']:8.1f}ms "
+                    f"{metrics['throughput_rps']:7.2f} req/s rss={metrics['peak_rss_mb']:.0f}MB"
+                )
+    finally:
+        for process in (backend, fake):
+            process.terminate()
+            process.wait(timeout=10)
+    return results
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoints", nargs="*", choices=ENDPOINTS, default=ENDPOINTS)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=100, help="requests per endpoint")
+    parser.add_argument("--latency", type=float, default=0.2, help="fake provider latency per call (s)")
+    parser.add_argument("--tokens-per-second", type=float, default=60.0, help="fake chat streaming rate")
+    parser.add_argument("--tts-seconds-per-char", type=float, default=0.004)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of fake 429/500 responses")
+    parser.add_argument("--fixtures", help="directory with audio/ and documents/ subdirectories (default: synthetic corpora)")
+    parser.add_argument("--fixtures-cache", default=os.path.join(BACKEND_DIR, "benchmarks", ".fixtures"))
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--save-baseline", help="write the results as a baseline file")
+    parser.add_argument("--baseline", help="compare against a saved baseline")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed relative regression (default 10%%)")
+    parser.add_argument("--verbose", action="store_true", help="show backend output")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    results = asyncio.run(run(args))
+    for path in filter(None, (args.output, args.save_baseline)):
+        with open(path, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
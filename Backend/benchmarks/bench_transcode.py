@@ -0,0 +1,93 @@
+"""
+Transcoding benchmark.
+
+Compares the old temp-file + ffmpeg path with the in-memory pipeline for
+WAV inputs that already match 16 kHz mono (no resampling), WAVs that need
+resampling (ffmpeg over pipes) and each upstream upload format. Reports
+wall time, CPU time (including ffmpeg children), bytes written to disk
+and the size of the payload sent to Whisper. Requires ffmpeg.
+
+    cd Backend && python -m benchmarks.bench_transcode --iterations 20
+"""
+import os
+import time
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+from benchmarks.common import make_wav
+
+from audio import decode_to_pcm, encode_for_upload
+
+
+def legacy_transcode(content):
+    """The previous implementation: two temp files and a forked ffmpeg"""
+    with tempfile.NamedTemporaryFile(delete=False) as tmp_in:
+        tmp_in.write(content)
+        tmp_in_path = tmp_in.name
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as tmp_out:
+        tmp_out_path = tmp_out.name
+    try:
+        subprocess.run(
+            ["ffmpeg", "-y", "-loglevel", "error", "-i", tmp_in_path, "-ar", "16000", "-ac", "1", tmp_out_path],
+            check=True,
+        )
+        with open(tmp_out_path, "rb") as f:
+            payload = f.read()
+        return payload, len(content) + len(payload)
+    finally:
+        os.remove(tmp_in_path)
+        os.remove(tmp_out_path)
+
+
+async def pipeline_transcode(content, upload_format):
+    pcm = await decode_to_pcm(content)
+    payload, _ = await encode_for_upload(pcm, upload_format)
+    return payload, 0
+
+
+def cpu_seconds():
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+async def measure(name, iterations, func):
+    wall_start, cpu_start = time.perf_counter(), cpu_seconds()
+    disk_bytes = payload_bytes = 0
+    for _ in range(iterations):
+        payload, written = await func()
+        disk_bytes += written
+        payload_bytes = len(payload)
+    wall = (time.perf_counter() - wall_start) / iterations
+    cpu = (cpu_seconds() - cpu_start) / iterations
+    print(f"{name:<40} wall={wall * 1000:8.1f}ms cpu={cpu * 1000:8.1f}ms "
+          f"disk={disk_bytes // iterations:>9}B payload={payload_bytes:>9}B")
+
+
+async def run(args):
+    inputs = {
+        "16k mono wav": make_wav(args.seconds),
+        "44.1k stereo wav": make_wav(args.seconds, sample_rate=44100, channels=2),
+    }
+    for label, content in inputs.items():
+        async def legacy(content=content):
+            return await asyncio.to_thread(legacy_transcode, content)
+
+        await measure(f"{label} / legacy temp files", args.iterations, legacy)
+        for upload_format in ("wav", "flac", "opus"):
+            async def piped(content=content, upload_format=upload_format):
+                return await pipeline_transcode(content, upload_format)
+
+            await measure(f"{label} / in-memory -> {upload_format}", args.iterations, piped)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--seconds", type=float, default=5.0, help="length of the synthetic clip")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(run(parse_args()))
@@ -0,0 +1,69 @@
+"""
+Text-to-speech benchmark.
+
+Synthesizes answers of 1, 5 and 20 sentences once as a single speech
+request (the previous behaviour) and once through the sentence-chunked
+engine, and reports time to first audio and total wall time. The fake
+speech endpoint takes a fixed latency plus a cost per input character,
+like the real one.
+
+    cd Backend && python -m benchmarks.bench_tts --parallelism 4
+"""
+import time
+import asyncio
+import argparse
+
+from benchmarks.common import FakeAsyncOpenAI
+
+import main
+import tts
+
+SENTENCES = [
+    "The warranty covers manufacturing defects for two years from the date of purchase.",
+    "Refunds are issued to the original payment method within ten business days.",
+    "धनवापसी दस कार्य दिवसों के भीतर मूल भुगतान विधि में जारी की जाती है।",
+    "يتم إصدار المبالغ المستردة خلال عشرة أيام عمل؟",
+]
+
+
+def make_answer(sentence_count, run):
+    # A run marker keeps the TTS cache from serving earlier runs
+    return " ".join(f"({run}.{i}) {SENTENCES[i % len(SENTENCES)]}" for i in range(sentence_count))
+
+
+async def single_request(text):
+    start = time.perf_counter()
+    await main.synthesize_speech(text, "en")
+    elapsed = time.perf_counter() - start
+    return elapsed, elapsed
+
+
+async def chunked(text):
+    start = time.perf_counter()
+    first = None
+    async for _ in main.tts_chunks(text, "en"):
+        if first is None:
+            first = time.perf_counter() - start
+    return first, time.perf_counter() - start
+
+
+async def run(args):
+    main.openai_client = FakeAsyncOpenAI(latency=args.latency, tts_seconds_per_char=args.seconds_per_char)
+    tts.TTS_PARALLELISM = args.parallelism
+    for run_index, count in enumerate((1, 5, 20)):
+        text = make_answer(count, run_index)
+        for label, func in (("single request", single_request), ("sentence chunks", chunked)):
+            first, total = await func(f"{label}: {text}")
+            print(f"{count:>3} sentences / {label:<16} first_audio={first * 1000:8.1f}ms total={total * 1000:8.1f}ms")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--parallelism", type=int, default=tts.TTS_PARALLELISM, help="chunks synthesized concurrently")
+    parser.add_argument("--latency", type=float, default=0.3, help="fixed speech request latency (s)")
+    parser.add_argument("--seconds-per-char", type=float, default=0.004, help="synthesis time per input character (s)")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(run(parse_args()))
@@ -0,0 +1,140 @@
+"""
+Peak memory per upload, fully offline.
+
+Starts the local OpenAI stand-in and the backend (as bench_suite does), then
+posts documents of increasing size to /upload_documents one at a time. Before
+each request the kernel's peak-RSS counter (VmHWM) of the backend and its
+worker processes is reset through /proc/<pid>/clear_refs, so the peak reported
+is that of the request alone, above the idle RSS. Run it on two revisions to
+compare ingestion paths.
+
+    cd Backend && python -m benchmarks.bench_upload --sizes 1 10 40 --repeats 3
+"""
+import os
+import json
+import time
+import asyncio
+import argparse
+import statistics
+
+import httpx
+
+from benchmarks import fixtures
+from benchmarks.bench_suite import rss_mb, start_servers, wait_ready
+
+MB = 1024 * 1024
+
+
+def child_pids(pid):
+    """The process and its descendants (the CPU pool workers)"""
+    pids = [pid]
+    for parent in pids:
+        try:
+            for task in os.listdir(f"/proc/{parent}/task"):
+                with open(f"/proc/{parent}/task/{task}/children") as f:
+                    pids.extend(int(child) for child in f.read().split())
+        except OSError:
+            pass
+    return pids
+
+
+def status_mb(pid, field):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+def reset_peaks(pids):
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/clear_refs", "w") as f:
+                f.write("5")
+        except OSError:
+            pass
+
+
+def make_upload(kind, size_mb):
+    if kind == "pdf":
+        return "report.pdf", fixtures.make_text_pdf(20, padding=int(size_mb * MB))
+    return "notes.txt", ("\n".join(fixtures.paragraph(i) for i in range(50)) + "\n").encode("utf-8") * max(1, int(size_mb * MB) // 5000)
+
+
+async def measure(client, pid, name, content, repeats):
+    peaks = {"server": [], "workers": []}
+    latencies = []
+    for _ in range(repeats):
+        pids = child_pids(pid)
+        idle = {p: rss_mb(p) for p in pids}
+        reset_peaks(pids)
+        start = time.perf_counter()
+        response = await client.post("/upload_documents", files=[("files", (name, content))], data={"query": ""})
+        latencies.append(time.perf_counter() - start)
+        response.raise_for_status()
+        peaks["server"].append(status_mb(pid, "VmHWM") - idle[pid])
+        peaks["workers"].append(sum(max(0.0, status_mb(p, "VmHWM") - idle[p]) for p in pids[1:]))
+    return {
+        "body_mb": round(len(content) / MB, 1),
+        "server_peak_mb": round(statistics.median(peaks["server"]), 1),
+        "workers_peak_mb": round(statistics.median(peaks["workers"]), 1),
+        "latency_ms": round(statistics.median(latencies) * 1000, 1),
+    }
+
+
+async def run(args):
+    fake, backend, base_url = start_servers(args)
+    results = {}
+    try:
+        async with httpx.AsyncClient(base_url=base_url, timeout=httpx.Timeout(300.0)) as client:
+            await wait_ready(client, backend)
+            print(f"idle backend RSS {rss_mb(backend.pid):.0f}MB\n")
+            print(f"{'upload':<16} {'body':>8} {'server peak':>12} {'workers peak':>13} {'latency':>10}")
+            for kind in args.kinds:
+                for size in args.sizes:
+                    name, content = make_upload(kind, size)
+                    metrics = await measure(client, backend.pid, name, content, args.repeats)
+                    results[f"{kind}_{size:g}mb"] = metrics
+                    print(
+                        f"{kind + ' ' + format(size, 'g') + 'MB':<16} {metrics['body_mb']:>6.1f}MB "
+                        f"{metrics['server_peak_mb']:>10.1f}MB {metrics['workers_peak_mb']:>11.1f}MB {metrics['latency_ms']:>8.1f}ms"
+                    )
+    finally:
+        for process in (backend, fake):
+            process.terminate()
+            process.wait(timeout=10)
+    return results
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--kinds", nargs="*", choices=["pdf", "txt"], default=["pdf", "txt"])
+    parser.add_argument("--sizes", nargs="*", type=float, default=[1, 10, 40], help="upload sizes in MB")
+    parser.add_argument("--repeats", type=int, default=3, help="uploads per size (the median is reported)")
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--verbose", action="store_true", help="show backend output")
+    args = parser.parse_args()
+    # Settings start_servers expects; the fake provider only serves embeddings here
+    args.latency, args.tokens_per_second, args.tts_seconds_per_char, args.error_rate = 0.0, 1000.0, 0.0, 0.0
+    return args
+
+
+def main():
+    args = parse_args()
+    # The backend inherits the environment; let the largest upload through
+    limit_mb = str(int(max(args.sizes)) + 10)
+    os.environ.setdefault("UPLOAD_LIMIT_MB_PDF", limit_mb)
+    os.environ.setdefault("UPLOAD_LIMIT_MB_TXT", limit_mb)
+    # Every repeat uploads the same bytes; measure extraction, not the extraction cache
+    os.environ.setdefault("EXTRACTION_CACHE_MEMORY_BYTES", "0")
+    results = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
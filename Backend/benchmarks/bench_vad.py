@@ -0,0 +1,88 @@
+"""
+Voice activity detection benchmark.
+
+Runs recordings through the Whisper preparation step with and without
+silence trimming and reports the seconds that would be uploaded, the VAD
+time, and the modelled Whisper latency (a fixed overhead plus a cost per
+uploaded second, since Whisper latency scales with audio duration). Pass
+recorded clips with --clips (any format ffmpeg can decode); without them
+a set of synthetic utterances with leading/trailing silence, pauses and
+background noise is used.
+
+    cd Backend && python -m benchmarks.bench_vad --clips samples/*.webm
+"""
+import time
+import asyncio
+import argparse
+
+from benchmarks.common import make_utterance_wav
+
+import audio
+from vad import trim_silence
+
+SYNTHETIC_CLIPS = {
+    "short question": [("silence", 0.8), ("speech", 1.6), ("silence", 1.2)],
+    "hesitant speaker": [("silence", 1.5), ("speech", 1.2), ("silence", 2.0), ("speech", 2.0), ("silence", 1.5)],
+    "push-to-talk held": [("silence", 0.5), ("speech", 3.0), ("silence", 6.0)],
+    "noise only": [("silence", 4.0)],
+    "silence only": [("silence", 3.0)],
+}
+
+
+def load_clips(args):
+    if args.clips:
+        clips = {}
+        for path in args.clips:
+            with open(path, "rb") as f:
+                clips[path] = f.read()
+        return clips
+    return {
+        name: make_utterance_wav(segments, noise=1500 if name == "noise only" else args.noise)
+        for name, segments in SYNTHETIC_CLIPS.items()
+    }
+
+
+def whisper_latency(seconds, args):
+    return args.whisper_overhead + seconds * args.whisper_per_second if seconds else 0.0
+
+
+async def run(args):
+    totals = {"original": 0.0, "uploaded": 0.0, "latency_before": 0.0, "latency_after": 0.0}
+    for name, content in load_clips(args).items():
+        pcm = await audio.decode_to_pcm(content)
+        start = time.perf_counter()
+        _, speech = trim_silence(pcm, audio.TARGET_SAMPLE_RATE)
+        vad_ms = (time.perf_counter() - start) * 1000
+
+        uploaded = speech["uploaded_seconds"] if speech["has_speech"] else 0.0
+        before = whisper_latency(speech["duration_seconds"], args)
+        after = whisper_latency(uploaded, args)
+        totals["original"] += speech["duration_seconds"]
+        totals["uploaded"] += uploaded
+        totals["latency_before"] += before
+        totals["latency_after"] += after
+        verdict = "upload" if speech["has_speech"] else "rejected"
+        print(
+            f"{name:<20} {verdict:<8} audio={speech['duration_seconds']:6.2f}s uploaded={uploaded:6.2f}s "
+            f"speech_ratio={speech['speech_ratio']:5.2f} vad={vad_ms:6.2f}ms "
+            f"whisper~{before * 1000:6.0f}ms -> {after * 1000:6.0f}ms"
+        )
+
+    saved = 1 - totals["uploaded"] / totals["original"] if totals["original"] else 0.0
+    print(
+        f"\ntotal audio={totals['original']:.2f}s uploaded={totals['uploaded']:.2f}s ({saved:.0%} less), "
+        f"modelled whisper time {totals['latency_before']:.2f}s -> {totals['latency_after']:.2f}s"
+    )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clips", nargs="*", help="recorded audio files (default: synthetic utterances)")
+    parser.add_argument("--noise", type=int, default=300, help="background noise amplitude for synthetic clips")
+    parser.add_argument("--whisper-overhead", type=float, default=0.4, help="modelled fixed Whisper latency (s)")
+    parser.add_argument("--whisper-per-second", type=float, default=0.06, help="modelled Whisper latency per audio second (s)")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(run(parse_args()))
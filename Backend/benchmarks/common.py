@@ -0,0 +1,161 @@
+"""
+Shared helpers for the benchmark scripts.
+
+The benchmarks import main.py in-process, so they must be run from the
+Backend directory (e.g. `python -m benchmarks.bench_event_loop`).
+"""
+import os
+import io
+import re
+import json
+import math
+import wave
+import struct
+import random
+import asyncio
+from types import SimpleNamespace
+
+os.environ.setdefault("OPENAI_API_KEY", "benchmark-key")
+# The fake provider has no rate limits; keep the gateway's token buckets out of the measurements
+for _model in ("GPT_4O_MINI", "GPT_4O", "WHISPER_1", "TTS_1"):
+    os.environ.setdefault(f"OPENAI_RPM_{_model}", "1000000")
+
+
+class _FakeTranscriptions:
+    def __init__(self, latency):
+        self.latency = latency
+
+    async def create(self, **kwargs):
+        await asyncio.sleep(self.latency)
+        return SimpleNamespace(text="what does the document say about refunds", language=kwargs.get("language", "en"))
+
+
+class _FakeSpeech:
+    def __init__(self, latency, seconds_per_char=0.0):
+        self.latency = latency
+        self.seconds_per_char = seconds_per_char
+
+    async def create(self, **kwargs):
+        # Real synthesis time grows with the length of the input
+        await asyncio.sleep(self.latency + self.seconds_per_char * len(kwargs.get("input", "")))
+        return SimpleNamespace(content=make_wav(0.5))
+
+
+class _FakeUsage(SimpleNamespace):
+    def model_dump(self, **kwargs):
+        return dict(vars(self))
+
+
+class _FakeCompletions:
+    answer = "This is a benchmark answer. It has two sentences."
+
+    def __init__(self, latency, token_delay=0.005):
+        self.latency = latency
+        self.token_delay = token_delay
+
+    async def create(self, **kwargs):
+        await asyncio.sleep(self.latency)
+        if kwargs.get("stream"):
+            return self._stream()
+        content = self.answer
+        if (kwargs.get("response_format") or {}).get("type") == "json_object":
+            # Packed questions: one answer per numbered line of the last message
+            questions = len(re.findall(r"^\d+\. ", kwargs["messages"][-1]["content"], re.MULTILINE))
+            content = json.dumps({"answers": [self.answer] * questions})
+        message = SimpleNamespace(content=content)
+        usage = _FakeUsage(prompt_tokens=10, completion_tokens=len(content.split(" ")), total_tokens=10 + len(content.split(" ")))
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage)
+
+    async def _stream(self):
+        words = self.answer.split(" ")
+        for i, word in enumerate(words):
+            await asyncio.sleep(self.token_delay)
+            delta = SimpleNamespace(content=word if i == 0 else " " + word)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)], usage=None)
+        usage = _FakeUsage(prompt_tokens=10, completion_tokens=len(words), total_tokens=10 + len(words))
+        yield SimpleNamespace(choices=[], usage=usage)
+
+
+class FakeAsyncOpenAI:
+    """Minimal stand-in for AsyncOpenAI with a fixed latency per call"""
+
+    def __init__(self, latency=0.05, tts_seconds_per_char=0.0):
+        self.audio = SimpleNamespace(
+            transcriptions=_FakeTranscriptions(latency),
+            speech=_FakeSpeech(latency, tts_seconds_per_char),
+        )
+        self.chat = SimpleNamespace(completions=_FakeCompletions(latency))
+
+
+def make_wav(seconds, sample_rate=16000, channels=1, frequency=440.0, silence=False):
+    """
+    Generate a 16-bit PCM WAV in memory: a tone pulsed at a syllable-like rate
+    (so voice activity detection treats it as speech), or silence
+    """
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        frames = bytearray()
+        for i in range(int(seconds * sample_rate)):
+            t = i / sample_rate
+            value = 0 if silence else int(8000 * abs(math.sin(2 * math.pi * 2.5 * t)) * math.sin(2 * math.pi * frequency * t))
+            frames += struct.pack("<h", value) * channels
+        wav.writeframes(bytes(frames))
+    return buffer.getvalue()
+
+
+def make_utterance_wav(segments, sample_rate=16000, noise=0):
+    """
+    A 16 kHz mono WAV made of (kind, seconds) segments, kind being "speech" or
+    "silence", with optional background noise (peak amplitude on the 16-bit scale)
+    """
+    rng = random.Random(0)
+    frames = bytearray()
+    offset = 0
+    for kind, seconds in segments:
+        for i in range(int(seconds * sample_rate)):
+            t = (offset + i) / sample_rate
+            value = rng.randint(-noise, noise) if noise else 0
+            if kind == "speech":
+                value += int(8000 * abs(math.sin(2 * math.pi * 2.5 * t)) * math.sin(2 * math.pi * 220 * t))
+            frames += struct.pack("<h", max(-32768, min(32767, value)))
+        offset += int(seconds * sample_rate)
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(bytes(frames))
+    return buffer.getvalue()
+
+
+def make_text_image(text="Invoice 1234 total 99.00", size=(1600, 1200)):
+    """Render text onto a PNG so the OCR path has something to read"""
+    from PIL import Image, ImageDraw
+
+    image = Image.new("RGB", size, "white")
+    draw = ImageDraw.Draw(image)
+    for row in range(0, size[1] - 40, 60):
+        draw.text((40, row + 20), text, fill="black")
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(name, samples):
+    return (
+        f"{name:<32} n={len(samples):<5} "
+        f"p50={percentile(samples, 50) * 1000:8.1f}ms "
+        f"p95={percentile(samples, 95) * 1000:8.1f}ms "
+        f"p99={percentile(samples, 99) * 1000:8.1f}ms"
+    )
@@ -0,0 +1,197 @@
+"""
+Local stand-in for the OpenAI API, for offline benchmarks.
+
+Implements the endpoints the backend uses (transcriptions, chat completions
+with and without streaming, speech and embeddings) with configurable latency,
+token rate and error injection. Point the backend at it with
+OPENAI_BASE_URL=http://127.0.0.1:<port>/v1.
+
+    cd Backend && python -m benchmarks.fake_openai_server --port 9009 --latency 0.2 --tokens-per-second 60
+"""
+import re
+import time
+import json
+import base64
+import random
+import struct
+import asyncio
+import hashlib
+import argparse
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+import uvicorn
+
+from benchmarks.common import make_wav
+
+ANSWER = (
+    "According to the documents, refunds are issued within ten business days. "
+    "The warranty covers manufacturing defects for two years. "
+    "Please let me know if you need more details."
+)
+NUMBERED_LINE_RE = re.compile(r"^\d+\. ", re.MULTILINE)
+
+
+class FakeSettings:
+    latency = 0.2  # seconds before any response starts
+    tokens_per_second = 60.0  # chat streaming rate
+    transcription_seconds_per_mb = 0.5  # extra transcription time per MB of audio
+    tts_seconds_per_char = 0.004
+    error_rate = 0.0  # fraction of requests answered with a 429 or 500
+
+
+settings = FakeSettings()
+app = FastAPI()
+counters = {"requests": 0, "errors_injected": 0}
+
+
+async def simulate(extra_seconds=0.0):
+    """Apply latency; returns an error response when one is injected"""
+    counters["requests"] += 1
+    await asyncio.sleep(settings.latency + extra_seconds)
+    if settings.error_rate and random.random() < settings.error_rate:
+        counters["errors_injected"] += 1
+        if random.random() < 0.5:
+            return JSONResponse(
+                {"error": {"message": "Rate limit reached (fake)", "type": "requests", "code": "rate_limit_exceeded"}},
+                status_code=429,
+                headers={"retry-after-ms": "200"},
+            )
+        return JSONResponse({"error": {"message": "Internal error (fake)", "type": "server_error"}}, status_code=500)
+    return None
+
+
+def usage(prompt_tokens, completion_tokens):
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+
+
+def prompt_token_count(messages):
+    text = "".join(m["content"] if isinstance(m.get("content"), str) else json.dumps(m.get("content")) for m in messages)
+    return len(text) // 4 + 1
+
+
+@app.post("/v1/audio/transcriptions")
+async def transcriptions(request: Request):
+    form = await request.form()
+    upload = form["file"]
+    size = len(await upload.read())
+    error = await simulate(size / 1_000_000 * settings.transcription_seconds_per_mb)
+    if error:
+        return error
+    language = form.get("language") or "en"
+    text = "What does the document say about refunds?"
+    if form.get("response_format") == "verbose_json":
+        return {"task": "transcribe", "language": language, "duration": round(size / 32000, 2), "text": text, "segments": []}
+    return {"text": text}
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    error = await simulate()
+    if error:
+        return error
+    words = ANSWER.split(" ")
+    prompt_tokens = prompt_token_count(body.get("messages", []))
+    created = int(time.time())
+    if not body.get("stream"):
+        content = ANSWER
+        if (body.get("response_format") or {}).get("type") == "json_object":
+            # Packed questions: one answer per numbered line of the last message
+            questions = len(NUMBERED_LINE_RE.findall(body["messages"][-1]["content"]))
+            content = json.dumps({"answers": [ANSWER] * questions})
+            words = words * questions
+        return {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": created,
+            "model": body["model"],
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": usage(prompt_tokens, len(words)),
+        }
+
+    async def events():
+        for i, word in enumerate(words):
+            await asyncio.sleep(1 / settings.tokens_per_second)
+            chunk = {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": body["model"],
+                "choices": [{"index": 0, "delta": {"content": word if i == 0 else " " + word}, "finish_reason": None}],
+            }
+            yield f"data: {json.dumps(chunk)}\n\n"
+        if (body.get("stream_options") or {}).get("include_usage"):
+            chunk = {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": body["model"],
+                "choices": [],
+                "usage": usage(prompt_tokens, len(words)),
+            }
+            yield f"data: {json.dumps(chunk)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+_speech_audio = {}
+
+
+@app.post("/v1/audio/speech")
+async def speech(request: Request):
+    body = await request.json()
+    error = await simulate(len(body.get("input", "")) * settings.tts_seconds_per_char)
+    if error:
+        return error
+    response_format = body.get("response_format", "mp3")
+    if response_format not in _speech_audio:
+        wav = make_wav(1.0, sample_rate=24000)
+        _speech_audio[response_format] = wav[44:] if response_format == "pcm" else wav
+    return Response(_speech_audio[response_format], media_type="application/octet-stream")
+
+
+@app.post("/v1/embeddings")
+async def embeddings(request: Request):
+    body = await request.json()
+    error = await simulate()
+    if error:
+        return error
+    texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+    data = []
+    for index, text in enumerate(texts):
+        seed = int.from_bytes(hashlib.sha256(str(text).encode("utf-8")).digest()[:8], "big")
+        rng = random.Random(seed)
+        vector = [rng.uniform(-1, 1) for _ in range(64)]
+        if body.get("encoding_format") == "base64":
+            embedding = base64.b64encode(struct.pack(f"<{len(vector)}f", *vector)).decode("ascii")
+        else:
+            embedding = vector
+        data.append({"object": "embedding", "index": index, "embedding": embedding})
+    return {"object": "list", "data": data, "model": body["model"], "usage": usage(len(texts), 0)}
+
+
+@app.get("/stats")
+async def stats():
+    return counters
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9009)
+    parser.add_argument("--latency", type=float, default=settings.latency, help="seconds before each response")
+    parser.add_argument("--tokens-per-second", type=float, default=settings.tokens_per_second, help="chat streaming rate")
+    parser.add_argument("--tts-seconds-per-char", type=float, default=settings.tts_seconds_per_char)
+    parser.add_argument("--error-rate", type=float, default=settings.error_rate, help="fraction of 429/500 responses")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    settings.latency = args.latency
+    settings.tokens_per_second = args.tokens_per_second
+    settings.tts_seconds_per_char = args.tts_seconds_per_char
+    settings.error_rate = args.error_rate
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
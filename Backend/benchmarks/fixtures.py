@@ -0,0 +1,149 @@
+"""
+Fixture corpora for the benchmark suite.
+
+Generates (once, into a cache directory) audio clips, text PDFs, scanned
+PDFs, DOCX files and scanned images. Real recordings and documents can be
+used instead by pointing the suite at a directory with audio/ and documents/
+subdirectories.
+
+    cd Backend && python -m benchmarks.fixtures --output benchmarks/.fixtures
+"""
+import os
+import io
+import zlib
+import argparse
+
+from benchmarks.common import make_utterance_wav, make_text_image
+
+AUDIO_EXTENSIONS = {".wav", ".webm", ".ogg", ".mp3", ".m4a", ".flac"}
+DOCUMENT_EXTENSIONS = {".pdf", ".docx", ".png", ".jpg", ".jpeg", ".txt"}
+
+PARAGRAPHS = [
+    "Refunds are issued to the original payment method within ten business days of the return being received.",
+    "The warranty covers manufacturing defects for two years from the date of purchase and excludes accidental damage.",
+    "Shipping is free for orders above fifty dollars; express delivery is available in most metropolitan areas.",
+    "Either party may terminate this agreement with thirty days written notice sent to the registered address.",
+    "Invoices are payable within thirty days; late payments accrue interest at one percent per month.",
+]
+
+
+def paragraph(index):
+    return f"Section {index}. {PARAGRAPHS[index % len(PARAGRAPHS)]}"
+
+
+def make_text_pdf(pages, lines_per_page=30, padding=0):
+    """
+    A minimal PDF with real text objects (Helvetica), so extraction does not need OCR.
+    `padding` adds an unreferenced stream of that many random bytes (like embedded images or fonts).
+    """
+    objects = []
+    page_ids = []
+    font_id = 3
+    objects.append(None)  # 1: catalog, filled in below
+    objects.append(None)  # 2: page tree
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    for page in range(pages):
+        lines = [paragraph(page * lines_per_page + line)[:95] for line in range(lines_per_page)]
+        text = "BT /F1 10 Tf 40 800 Td 14 TL " + " ".join(
+            "(" + line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") + ") '" for line in lines
+        ) + " ET"
+        stream = zlib.compress(text.encode("latin-1"))
+        objects.append(b"<< /Length %d /Filter /FlateDecode >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents %d 0 R "
+            b"/Resources << /Font << /F1 %d 0 R >> >> >>" % (content_id, font_id)
+        )
+        page_ids.append(len(objects))
+    if padding:
+        objects.append(b"<< /Length %d >>\nstream\n" % padding + os.urandom(padding) + b"\nendstream")
+    objects[0] = b"<< /Type /Catalog /Pages 2 0 R >>"
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids).encode("ascii")
+    objects[1] = b"<< /Type /Pages /Kids [" + kids + b"] /Count %d >>" % len(page_ids)
+
+    output = io.BytesIO()
+    output.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(output.tell())
+        output.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+    xref = output.tell()
+    output.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for offset in offsets:
+        output.write(b"%010d 00000 n \n" % offset)
+    output.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+    return output.getvalue()
+
+
+def make_scanned_pdf(pages):
+    """A PDF made of page images only, as produced by a scanner (exercises the OCR fallback)"""
+    from PIL import Image
+
+    images = [
+        Image.open(io.BytesIO(make_text_image(paragraph(page)[:60], size=(1240, 1754)))).convert("RGB")
+        for page in range(pages)
+    ]
+    output = io.BytesIO()
+    images[0].save(output, format="PDF", save_all=True, append_images=images[1:], resolution=150)
+    return output.getvalue()
+
+
+def make_docx(paragraphs):
+    from docx import Document
+
+    document = Document()
+    document.add_heading("Terms and conditions", level=1)
+    for index in range(paragraphs):
+        document.add_paragraph(paragraph(index))
+    output = io.BytesIO()
+    document.save(output)
+    return output.getvalue()
+
+
+def generate(output_dir):
+    """Write the synthetic corpora to output_dir (skipping files that already exist)"""
+    fixtures = {
+        "audio/short_question.wav": lambda: make_utterance_wav([("silence", 0.4), ("speech", 2.0), ("silence", 0.6)], noise=300),
+        "audio/long_question.wav": lambda: make_utterance_wav([("silence", 1.0), ("speech", 4.0), ("silence", 1.0), ("speech", 3.0), ("silence", 1.5)], noise=300),
+        "documents/contract_2_pages.pdf": lambda: make_text_pdf(2),
+        "documents/handbook_20_pages.pdf": lambda: make_text_pdf(20),
+        "documents/scanned_3_pages.pdf": lambda: make_scanned_pdf(3),
+        "documents/policy.docx": lambda: make_docx(40),
+        "documents/receipt_scan.png": lambda: make_text_image("Invoice 1234 total 99.00"),
+        "documents/notes.txt": lambda: "\n".join(paragraph(i) for i in range(50)).encode("utf-8"),
+    }
+    for name, build in fixtures.items():
+        path = os.path.join(output_dir, name)
+        if os.path.exists(path):
+            continue
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(build())
+    return output_dir
+
+
+def load(directory, subdirectory, extensions):
+    """Return {filename: bytes} for the fixture files in directory/subdirectory"""
+    folder = os.path.join(directory, subdirectory)
+    files = {}
+    for name in sorted(os.listdir(folder)):
+        if os.path.splitext(name)[1].lower() in extensions:
+            with open(os.path.join(folder, name), "rb") as f:
+                files[name] = f.read()
+    return files
+
+
+def load_audio(directory):
+    return load(directory, "audio", AUDIO_EXTENSIONS)
+
+
+def load_documents(directory):
+    return load(directory, "documents", DOCUMENT_EXTENSIONS)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", default=os.path.join(os.path.dirname(__file__), ".fixtures"))
+    directory = generate(parser.parse_args().output)
+    for name, content in {**load_audio(directory), **load_documents(directory)}.items():
+        print(f"{name:<28} {len(content):>9} bytes")
@@ -0,0 +1,209 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def new_document_id():
+    return uuid.uuid4().hex
+
+
+class DocumentStore:
+    """
+    Server-side storage for processed documents, keyed by document ID.
+
+    A document is the dict produced by /upload_documents (filename, content,
+    is_image, image_data, page_offsets, ...). Entries expire `ttl` seconds
+    after they were last stored or read. Subclasses implement the synchronous
+    `_put`/`_get`/`_delete`/`_evict_expired`; backends that touch the disk run
+    them on a worker thread so the event loop never blocks.
+    """
+
+    blocking = False
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+
+    async def _call(self, func, *args):
+        if self.blocking:
+            return await asyncio.to_thread(func, *args)
+        return func(*args)
+
+    async def put(self, document):
+        document_id = document.get("document_id") or new_document_id()
+        document = {**document, "document_id": document_id}
+        await self._call(self._put, document_id, document, time.time() + self.ttl)
+        return document_id
+
+    async def get(self, document_id):
+        return await self._call(self._get, document_id, time.time())
+
+    async def get_many(self, document_ids):
+        """Return documents in the requested order; missing or expired IDs are None"""
+        return [await self.get(document_id) for document_id in document_ids]
+
+    async def delete(self, document_id):
+        await self._call(self._delete, document_id)
+
+    async def evict_expired(self):
+        return await self._call(self._evict_expired, time.time())
+
+
+class MemoryDocumentStore(DocumentStore):
+    def __init__(self, ttl, max_documents=1000):
+        super().__init__(ttl)
+        self.max_documents = max_documents
+        self._documents = OrderedDict()
+
+    def _put(self, document_id, document, expires_at):
+        self._documents[document_id] = (expires_at, document)
+        self._documents.move_to_end(document_id)
+        while len(self._documents) > self.max_documents:
+            self._documents.popitem(last=False)
+
+    def _get(self, document_id, now):
+        entry = self._documents.get(document_id)
+        if entry is None:
+            return None
+        expires_at, document = entry
+        if expires_at < now:
+            del self._documents[document_id]
+            return None
+        self._documents[document_id] = (now + self.ttl, document)
+        self._documents.move_to_end(document_id)
+        return document
+
+    def _delete(self, document_id):
+        self._documents.pop(document_id, None)
+
+    def _evict_expired(self, now):
+        expired = [key for key, (expires_at, _) in self._documents.items() if expires_at < now]
+        for key in expired:
+            del self._documents[key]
+        return len(expired)
+
+
+class SQLiteDocumentStore(DocumentStore):
+    blocking = True
+
+    def __init__(self, ttl, path):
+        super().__init__(ttl)
+        self.path = path
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS documents ("
+                "document_id TEXT PRIMARY KEY, expires_at REAL NOT NULL, body TEXT NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS documents_expires_at ON documents (expires_at)")
+
+    def _connection(self):
+        # sqlite3 connections may not be shared across threads; keep one per worker thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _put(self, document_id, document, expires_at):
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO documents (document_id, expires_at, body) VALUES (?, ?, ?)",
+                (document_id, expires_at, json.dumps(document)),
+            )
+
+    def _get(self, document_id, now):
+        with self._connection() as conn:
+            row = conn.execute(
+                "SELECT body FROM documents WHERE document_id = ? AND expires_at >= ?", (document_id, now)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE documents SET expires_at = ? WHERE document_id = ?", (now + self.ttl, document_id))
+        return json.loads(row[0])
+
+    def _delete(self, document_id):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM documents WHERE document_id = ?", (document_id,))
+
+    def _evict_expired(self, now):
+        with self._connection() as conn:
+            return conn.execute("DELETE FROM documents WHERE expires_at < ?", (now,)).rowcount
+
+
+class DirectoryDocumentStore(DocumentStore):
+    """One JSON file per document; the file mtime is the last access time"""
+
+    blocking = True
+
+    def __init__(self, ttl, path):
+        super().__init__(ttl)
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, document_id):
+        # Only hex IDs are generated; reject anything that could escape the directory
+        if not document_id.isalnum():
+            raise KeyError(document_id)
+        return os.path.join(self.path, f"{document_id}.json")
+
+    def _put(self, document_id, document, expires_at):
+        path = self._file(document_id)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(document, f)
+        os.replace(tmp_path, path)
+
+    def _get(self, document_id, now):
+        try:
+            path = self._file(document_id)
+            if os.path.getmtime(path) + self.ttl < now:
+                os.remove(path)
+                return None
+            with open(path, encoding="utf-8") as f:
+                document = json.load(f)
+            os.utime(path)
+            return document
+        except (KeyError, FileNotFoundError):
+            return None
+
+    def _delete(self, document_id):
+        try:
+            os.remove(self._file(document_id))
+        except (KeyError, FileNotFoundError):
+            pass
+
+    def _evict_expired(self, now):
+        evicted = 0
+        for entry in os.scandir(self.path):
+            if entry.name.endswith(".json") and entry.stat().st_mtime + self.ttl < now:
+                try:
+                    os.remove(entry.path)
+                    evicted += 1
+                except FileNotFoundError:
+                    pass
+        return evicted
+
+
+def create_document_store():
+    """Build the store selected by DOCUMENT_STORE (memory, sqlite or directory)"""
+    backend = os.getenv("DOCUMENT_STORE", "memory").lower()
+    ttl = int(os.getenv("DOCUMENT_TTL_SECONDS", str(24 * 3600)))
+    if backend == "sqlite":
+        return SQLiteDocumentStore(ttl, os.getenv("DOCUMENT_STORE_PATH", "documents.sqlite3"))
+    if backend == "directory":
+        return DirectoryDocumentStore(ttl, os.getenv("DOCUMENT_STORE_PATH", "document_store"))
+    if backend != "memory":
+        logger.warning("Unknown DOCUMENT_STORE %r, falling back to memory", backend)
+    return MemoryDocumentStore(ttl, int(os.getenv("DOCUMENT_STORE_MAX_DOCUMENTS", "1000")))
+
+
+document_store = create_document_store()
@@ -0,0 +1,125 @@
+import os
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Per-stage concurrency limits, overridable with e.g. STAGE_LIMIT_OCR=4
+DEFAULT_STAGE_LIMITS = {
+    "ffmpeg": 4,
+    "vad": 4,
+    "transcribe": 8,
+    "chat": 16,
+    "tts": 8,
+    "ocr": 2,
+    "pdf": os.cpu_count() or 2,
+    "docx": 4,
+    "upload": 4,
+}
+
+BLOCKING_POOL_SIZE = int(os.getenv("BLOCKING_POOL_SIZE", "8"))
+CPU_POOL_SIZE = int(os.getenv("CPU_POOL_SIZE", str(os.cpu_count() or 2)))
+
+_stage_semaphores = {}
+_thread_pool = None
+_process_pool = None
+
+
+def get_stage_limit(stage):
+    return int(os.getenv(f"STAGE_LIMIT_{stage.upper()}", DEFAULT_STAGE_LIMITS.get(stage, 4)))
+
+
+def stage_semaphore(stage):
+    """Return the semaphore bounding concurrent work for a pipeline stage"""
+    semaphore = _stage_semaphores.get(stage)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(get_stage_limit(stage))
+        _stage_semaphores[stage] = semaphore
+    return semaphore
+
+
+def get_thread_pool():
+    global _thread_pool
+    if _thread_pool is None:
+        _thread_pool = ThreadPoolExecutor(max_workers=BLOCKING_POOL_SIZE, thread_name_prefix="blocking")
+    return _thread_pool
+
+
+def get_process_pool():
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(max_workers=CPU_POOL_SIZE)
+    return _process_pool
+
+
+async def run_in_pool(stage, pool, func, *args):
+    """
+    Run func on a pool within the stage's concurrency limit. The slot is held until
+    the job itself finishes: cancelling the caller cannot stop a job that has already
+    started, and releasing early would let more work run than the limit allows.
+    """
+    semaphore = stage_semaphore(stage)
+    await semaphore.acquire()
+    loop = asyncio.get_running_loop()
+    try:
+        future = pool.submit(func, *args)
+    except BaseException:
+        semaphore.release()
+        raise
+
+    def release(_):
+        try:
+            loop.call_soon_threadsafe(semaphore.release)
+        except RuntimeError:
+            # The loop has already been closed (shutdown)
+            pass
+
+    future.add_done_callback(release)
+    return await asyncio.wrap_future(future)
+
+
+async def run_blocking(stage, func, *args):
+    """Run blocking I/O-bound work (e.g. tesseract) on the thread pool"""
+    return await run_in_pool(stage, get_thread_pool(), func, *args)
+
+
+async def run_cpu(stage, func, *args):
+    """Run CPU-bound work (e.g. PDF parsing) on the process pool"""
+    return await run_in_pool(stage, get_process_pool(), func, *args)
+
+
+async def run_subprocess(stage, *cmd, input=None):
+    """
+    Run an external command without blocking the event loop.
+    Returns stdout bytes; raises RuntimeError on a non-zero exit code.
+    """
+    async with stage_semaphore(stage):
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=asyncio.subprocess.PIPE if input is not None else asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        try:
+            stdout, stderr = await process.communicate(input=input)
+        except BaseException:
+            # Cancelled (client gone, deadline): stop the process before giving up the slot
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+            raise
+    if process.returncode != 0:
+        logger.error("%s failed with exit code %s: %s", cmd[0], process.returncode, stderr.decode(errors="ignore")[-500:])
+        raise RuntimeError(f"{cmd[0]} exited with code {process.returncode}")
+    return stdout
+
+
+def shutdown_pools():
+    global _thread_pool, _process_pool
+    if _thread_pool is not None:
+        _thread_pool.shutdown(wait=False, cancel_futures=True)
+        _thread_pool = None
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
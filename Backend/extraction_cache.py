@@ -0,0 +1,153 @@
+import os
+import json
+import time
+import zlib
+import sqlite3
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def extraction_cache_key(content_sha256, file_type, extractor_version):
+    """Same bytes, same type and same extractor version give the same extracted text"""
+    return f"{file_type}:{extractor_version}:{content_sha256}"
+
+
+class ExtractionCache:
+    """
+    Two-tier cache of document extraction results (text, page offsets and image
+    thumbnail), keyed by extraction_cache_key.
+
+    Entries are stored as zlib-compressed JSON. The memory tier is an
+    OrderedDict bounded by total compressed bytes. The optional disk tier is a
+    SQLite database bounded separately and evicted least recently used first;
+    several workers can share it.
+    """
+
+    def __init__(self, memory_bytes, path=None, disk_bytes=0):
+        self.memory_bytes = memory_bytes
+        self.path = path
+        self.disk_bytes = disk_bytes
+        self._memory = OrderedDict()
+        self._memory_size = 0
+        self._disk_size = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if path:
+            with self._connection() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS extractions ("
+                    "key TEXT PRIMARY KEY, size INTEGER NOT NULL, accessed REAL NOT NULL, body BLOB NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS extractions_accessed ON extractions (accessed)")
+
+    def _connection(self):
+        # sqlite3 connections may not be shared across threads; keep one per worker thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    async def get(self, key):
+        blob = self._memory.get(key)
+        if blob is not None:
+            self._memory.move_to_end(key)
+            self.memory_hits += 1
+            return json.loads(zlib.decompress(blob))
+        if self.path:
+            try:
+                blob = await asyncio.to_thread(self._read_disk, key)
+            except sqlite3.Error as e:
+                logger.warning("Could not read extraction cache: %s", e)
+                blob = None
+            if blob is not None:
+                self.disk_hits += 1
+                self._store_memory(key, blob)
+                return json.loads(zlib.decompress(blob))
+        self.misses += 1
+        return None
+
+    async def put(self, key, result):
+        blob = zlib.compress(json.dumps(result).encode("utf-8"))
+        self._store_memory(key, blob)
+        if self.path:
+            try:
+                await asyncio.to_thread(self._write_disk, key, blob)
+            except sqlite3.Error as e:
+                logger.warning("Could not write extraction cache entry: %s", e)
+
+    def stats(self):
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory_size,
+            "disk_bytes": self._disk_size or 0,
+        }
+
+    def _store_memory(self, key, blob):
+        if len(blob) > self.memory_bytes:
+            return
+        if key in self._memory:
+            self._memory_size -= len(self._memory.pop(key))
+        self._memory[key] = blob
+        self._memory_size += len(blob)
+        while self._memory_size > self.memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted)
+            self.evictions += 1
+
+    def _read_disk(self, key):
+        with self._connection() as conn:
+            row = conn.execute("SELECT body FROM extractions WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE extractions SET accessed = ? WHERE key = ?", (time.time(), key))
+        return row[0]
+
+    def _write_disk(self, key, blob):
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO extractions (key, size, accessed, body) VALUES (?, ?, ?, ?)",
+                (key, len(blob), time.time(), blob),
+            )
+        with self._lock:
+            if self._disk_size is not None:
+                self._disk_size += len(blob)
+            if self._disk_size is None or self._disk_size > self.disk_bytes:
+                self._evict_disk()
+
+    def _evict_disk(self):
+        # Other workers may share the database, so the total is recounted before evicting
+        with self._connection() as conn:
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM extractions").fetchone()[0]
+            if total > self.disk_bytes:
+                evicted = []
+                for key, size in conn.execute("SELECT key, size FROM extractions ORDER BY accessed"):
+                    evicted.append((key,))
+                    total -= size
+                    if total <= self.disk_bytes:
+                        break
+                conn.executemany("DELETE FROM extractions WHERE key = ?", evicted)
+                self.evictions += len(evicted)
+        self._disk_size = total
+
+
+extraction_cache = ExtractionCache(
+    memory_bytes=int(os.getenv("EXTRACTION_CACHE_MEMORY_BYTES", str(64 * 1024 * 1024))),
+    path=os.getenv("EXTRACTION_CACHE_PATH") or None,
+    disk_bytes=int(os.getenv("EXTRACTION_CACHE_DISK_BYTES", str(1024 * 1024 * 1024))),
+)
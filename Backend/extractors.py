@@ -0,0 +1,243 @@
+import os
+import io
+import time
+import base64
+import asyncio
+import logging
+import tempfile
+from contextlib import contextmanager
+
+from executor import run_blocking, run_cpu
+from ocr import OCR_VERSION, ocr_image
+
+logger = logging.getLogger(__name__)
+
+# PyPDF2, python-docx and Pillow are imported on first use, so workers that only
+# serve chat and voice never load them
+
+VISION_IMAGE_MAX_SIDE = int(os.getenv("VISION_IMAGE_MAX_SIDE", "1024"))
+PDF_MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", "500"))
+PDF_TIME_BUDGET = float(os.getenv("PDF_TIME_BUDGET", "60"))  # seconds per document
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "16"))
+# Pages with less extracted text than this are treated as scanned if they contain an image
+MIN_PAGE_TEXT_CHARS = int(os.getenv("PDF_MIN_PAGE_TEXT_CHARS", "16"))
+# Text returned in place of OCR output when OCR fails (not worth caching)
+OCR_ERROR_PREFIX = "Error processing image:"
+
+# Part of the extraction cache key: bump when the output for a type changes (settings that change it are included)
+EXTRACTOR_VERSIONS = {
+    "pdf": f"1-ocr{OCR_VERSION}-{PDF_MAX_PAGES}-{MIN_PAGE_TEXT_CHARS}",
+    "docx": "1",
+    "image": f"1-ocr{OCR_VERSION}-{VISION_IMAGE_MAX_SIDE}",
+    "txt": "2",
+}
+
+
+def count_pdf_pages(pdf_path):
+    import PyPDF2
+
+    return len(PyPDF2.PdfReader(pdf_path).pages)
+
+
+def largest_page_image(page):
+    """Return the bytes of the largest embedded image on a page (the scan), or None"""
+    try:
+        images = list(page.images)
+    except Exception as e:
+        logger.warning(f"Could not read images from PDF page: {str(e)}")
+        return None
+    if not images:
+        return None
+    return max(images, key=lambda image: len(image.data)).data
+
+
+def extract_pdf_page_range(pdf_path, start, end, deadline=None):
+    """
+    Extract pages [start, end) of a PDF. Runs in a process-pool worker.
+    Returns a list of (text, scan_image) where scan_image holds the page image
+    bytes for image-only pages that need OCR, otherwise None. Stops early once
+    the wall-clock `deadline` has passed (the caller has given up by then), so
+    the result may cover fewer pages.
+    """
+    import PyPDF2
+
+    pdf_reader = PyPDF2.PdfReader(pdf_path)
+    results = []
+    for page_num in range(start, end):
+        if deadline is not None and time.time() > deadline:
+            break
+        page = pdf_reader.pages[page_num]
+        text = page.extract_text() or ""
+        scan_image = None
+        if len(text.strip()) < MIN_PAGE_TEXT_CHARS:
+            scan_image = largest_page_image(page)
+        results.append((text, scan_image))
+    return results
+
+
+@contextmanager
+def pdf_path(source):
+    """Path of a PDF given as a path (spooled upload) or as bytes (written to a temp file)"""
+    if isinstance(source, str):
+        yield source
+        return
+    with tempfile.NamedTemporaryFile(suffix=".pdf") as tmp_pdf:
+        tmp_pdf.write(source)
+        tmp_pdf.flush()
+        yield tmp_pdf.name
+
+
+async def extract_pdf_pages(source, on_progress=None):
+    """
+    Extract the text of every PDF page in parallel on the process pool.
+    `source` is a file path or the PDF bytes.
+
+    Image-only (scanned) pages are sent to Tesseract (failures are counted in
+    info["ocr_failed"] and come back empty). At most PDF_MAX_PAGES
+    pages are read and the whole document gets PDF_TIME_BUDGET seconds; pages
+    that are not finished in time come back empty. `on_progress(done, total)`
+    is called as page batches complete.
+    Returns (pages, info) where info summarizes what was extracted.
+    """
+    started = time.perf_counter()
+    # Workers read the PDF from a file instead of receiving a pickled copy each
+    with pdf_path(source) as path:
+        try:
+            page_count = await run_cpu("pdf", count_pdf_pages, path)
+        except Exception as e:
+            logger.error(f"Error extracting text from PDF: {str(e)}")
+            raise Exception(f"Failed to extract text from PDF: {str(e)}")
+
+        total = min(page_count, PDF_MAX_PAGES)
+        # Workers are separate processes; a wall-clock deadline is what they can check between pages
+        deadline = time.time() + PDF_TIME_BUDGET - (time.perf_counter() - started)
+        pages = [""] * total
+        done = 0
+        ocr_pages = 0
+        ocr_failed = 0
+
+        async def extract_batch(start, end):
+            nonlocal done, ocr_pages, ocr_failed
+            results = await run_cpu("pdf", extract_pdf_page_range, path, start, end, deadline)
+            ocr_jobs = []
+            for offset, (text, scan_image) in enumerate(results):
+                pages[start + offset] = text
+                if scan_image is not None:
+                    ocr_jobs.append((start + offset, scan_image))
+            ocr_texts = await asyncio.gather(*(run_blocking("ocr", ocr_scanned_page, image) for _, image in ocr_jobs))
+            for (page_num, _), text in zip(ocr_jobs, ocr_texts):
+                if text is None:
+                    ocr_failed += 1
+                    text = ""
+                pages[page_num] = text
+            ocr_pages += len(ocr_jobs)
+            done += len(results)
+            if on_progress:
+                on_progress(done, total)
+
+        tasks = [
+            asyncio.create_task(extract_batch(start, min(start + PDF_PAGES_PER_TASK, total)))
+            for start in range(0, total, PDF_PAGES_PER_TASK)
+        ]
+        finished, pending = await asyncio.wait(tasks, timeout=max(0.0, deadline - time.time())) if tasks else (set(), set())
+        for task in pending:
+            task.cancel()
+        for task in finished:
+            if task.exception() is not None:
+                logger.error(f"Error extracting PDF pages: {str(task.exception())}")
+
+    info = {
+        "page_count": page_count,
+        "extracted_pages": done,
+        "ocr_pages": ocr_pages,
+        "ocr_failed": ocr_failed,
+        "truncated": page_count > total or done < total,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+    if info["truncated"]:
+        logger.warning(f"PDF extraction truncated: {info}")
+    return pages, info
+
+
+def join_pages(pages):
+    """Join page texts and return (text, page_offsets) where page_offsets[i] is the start of page i"""
+    page_offsets = []
+    offset = 0
+    for page in pages:
+        page_offsets.append(offset)
+        offset += len(page) + 1
+    return "\n".join(pages), page_offsets
+
+
+def extract_text_from_docx(source):
+    """`source` is a file path or the DOCX bytes"""
+    import docx
+
+    try:
+        doc = docx.Document(source if isinstance(source, str) else io.BytesIO(source))
+        return " ".join([paragraph.text for paragraph in doc.paragraphs])
+    except Exception as e:
+        logger.error(f"Error extracting text from DOCX: {str(e)}")
+        raise Exception(f"Failed to extract text from DOCX: {str(e)}")
+
+
+def ocr_scanned_page(image_bytes):
+    """OCR text of a scanned page, or None if OCR failed"""
+    try:
+        return ocr_image(image_bytes)
+    except Exception as e:
+        logger.warning(f"OCR failed for scanned PDF page: {str(e)}")
+        return None
+
+
+def extract_text_from_image(file_content):
+    try:
+        extracted_text = ocr_image(file_content)
+
+        if not extracted_text:
+            return "No text could be extracted from this image. The image might not contain readable text or the text might be too blurry/unclear for OCR processing."
+
+        return extracted_text
+
+    except Exception as e:
+        logger.error(f"Error extracting text from image: {str(e)}")
+        # Don't raise an exception, return a helpful message instead
+        return f"{OCR_ERROR_PREFIX} Could not extract text from the image. Please ensure the image contains clear, readable text. Error details: {str(e)}"
+
+
+def extract_image(file_content):
+    """
+    Decode an uploaded image once and return (ocr_text, thumbnail_base64):
+    the OCR text for the document and a downscaled JPEG for the vision payload.
+    """
+    from PIL import Image
+
+    try:
+        image = Image.open(io.BytesIO(file_content))
+        image.load()
+    except Exception as e:
+        logger.error(f"Error opening image: {str(e)}")
+        return extract_text_from_image(file_content), None
+    try:
+        extracted_text = ocr_image(file_content, image)
+        if not extracted_text:
+            extracted_text = "No text could be extracted from this image. The image might not contain readable text or the text might be too blurry/unclear for OCR processing."
+    except Exception as e:
+        logger.error(f"Error extracting text from image: {str(e)}")
+        extracted_text = f"{OCR_ERROR_PREFIX} Could not extract text from the image. Please ensure the image contains clear, readable text. Error details: {str(e)}"
+    return extracted_text, make_image_thumbnail(file_content, image=image)
+
+
+def make_image_thumbnail(file_content, max_side=VISION_IMAGE_MAX_SIDE, image=None):
+    """Downscale an image to a JPEG thumbnail and return it base64-encoded"""
+    from PIL import Image, ImageOps
+
+    if image is None:
+        image = Image.open(io.BytesIO(file_content))
+    image = ImageOps.exif_transpose(image)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    image.thumbnail((max_side, max_side))
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=85)
+    return base64.b64encode(buffer.getvalue()).decode('utf-8')
@@ -0,0 +1,303 @@
+"""
+Provider gateway for OpenAI calls.
+
+Every API call goes through `gateway.call(model, func, **kwargs)`, which adds,
+per model: a token-bucket rate limit, retries with jittered exponential backoff
+that honour Retry-After, an overall deadline, a circuit breaker that fails fast
+while the provider is down, and optional request hedging for short,
+latency-critical calls such as TTS. When a call cannot be completed it raises
+ProviderUnavailable (a 503 with Retry-After) instead of a raw SDK error.
+"""
+import os
+import time
+import random
+import asyncio
+import logging
+import importlib
+
+import openai
+from fastapi import HTTPException
+
+from telemetry import OPENAI_CALL_SECONDS, record_usage
+
+logger = logging.getLogger(__name__)
+
+# HTTP pool shared by all calls
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+OPENAI_MAX_KEEPALIVE = int(os.getenv("OPENAI_MAX_KEEPALIVE", "40"))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "60"))
+OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "5"))
+OPENAI_READ_TIMEOUT = float(os.getenv("OPENAI_READ_TIMEOUT", "60"))
+
+# Requests per minute per model, overridable with e.g. OPENAI_RPM_WHISPER_1=100
+DEFAULT_RATE_LIMITS = {
+    "gpt-4o-mini": 500,
+    "gpt-4o": 500,
+    "whisper-1": 50,
+    "tts-1": 50,
+}
+DEFAULT_RPM = 500
+# The limits above are per deployment; each of WEB_CONCURRENCY workers (set by serve.py) gets an equal share
+GATEWAY_WORKERS = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+
+# Total time budget per call, retries included, overridable with e.g. OPENAI_DEADLINE_TTS_1=20
+DEFAULT_DEADLINES = {
+    "whisper-1": 60.0,
+    "tts-1": 30.0,
+}
+DEFAULT_DEADLINE = 90.0
+
+OPENAI_MAX_ATTEMPTS = int(os.getenv("OPENAI_MAX_ATTEMPTS", "4"))
+OPENAI_BACKOFF_BASE = float(os.getenv("OPENAI_BACKOFF_BASE", "0.5"))
+OPENAI_BACKOFF_CAP = float(os.getenv("OPENAI_BACKOFF_CAP", "8"))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.InternalServerError, openai.APIConnectionError)
+
+
+def model_setting(prefix, model, defaults, fallback):
+    override = os.getenv(f"{prefix}_{model.upper().replace('-', '_').replace('.', '_')}")
+    return float(override) if override else defaults.get(model, fallback)
+
+
+def create_http_client():
+    """
+    An explicitly sized keep-alive pool for the OpenAI client. Depending on the SDK
+    version the client is built on httpx or a fork of it, so the Limits class is
+    taken from the package the SDK's default client derives from.
+    """
+    client_base = openai.DefaultAsyncHttpxClient.__mro__[1]
+    http = importlib.import_module(client_base.__module__.split(".")[0])
+    return openai.DefaultAsyncHttpxClient(
+        limits=http.Limits(
+            max_connections=OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=OPENAI_MAX_KEEPALIVE,
+            keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY,
+        ),
+        timeout=openai.Timeout(OPENAI_READ_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT),
+    )
+
+
+class ProviderUnavailable(HTTPException):
+    """The provider is rate limiting, failing or too slow; clients should retry later"""
+
+    def __init__(self, detail, retry_after=None):
+        headers = {"Retry-After": str(max(1, round(retry_after)))} if retry_after else None
+        super().__init__(status_code=503, detail=detail, headers=headers)
+
+
+class TokenBucket:
+    """Requests-per-minute limiter; waiting callers are served in arrival order"""
+
+    def __init__(self, rpm, burst=None):
+        self.rate = rpm / 60.0
+        self.capacity = burst or max(1.0, rpm / 10.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, deadline):
+        async with self._lock:
+            self._refill()
+            if self.tokens < 1:
+                wait = (1 - self.tokens) / self.rate
+                if time.monotonic() + wait > deadline:
+                    raise ProviderUnavailable("Rate limit reached, please retry shortly", retry_after=wait)
+                await asyncio.sleep(wait)
+                self._refill()
+            self.tokens -= 1
+
+    def penalize(self, seconds):
+        """The provider asked us to back off: drain the bucket for `seconds`"""
+        self.tokens = min(self.tokens, -seconds * self.rate)
+
+
+class CircuitBreaker:
+    """Opens after consecutive failures; after a cool-down one probe call is let through"""
+
+    def __init__(self, name, threshold=CIRCUIT_FAILURE_THRESHOLD, reset_seconds=CIRCUIT_RESET_SECONDS):
+        self.name = name
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def before_call(self):
+        if self.opened_at is None:
+            return
+        remaining = self.opened_at + self.reset_seconds - time.monotonic()
+        if remaining > 0 or self._probing:
+            raise ProviderUnavailable("The AI provider is unavailable, please retry shortly", retry_after=max(remaining, 1))
+        self._probing = True
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def release(self):
+        """The call finished without telling us anything about the provider's health"""
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probing = False
+        if self.failures >= self.threshold:
+            if self.opened_at is None:
+                logger.warning("Opening %s circuit after %d consecutive failures", self.name, self.failures)
+            self.opened_at = time.monotonic()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if time.monotonic() >= self.opened_at + self.reset_seconds else "open"
+
+
+def retry_after_seconds(error):
+    """Server-requested delay from Retry-After / retry-after-ms headers, if any"""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        return None
+    return None
+
+
+def backoff_delay(attempt, retry_after=None):
+    """Full-jitter exponential backoff, never shorter than what the server asked for"""
+    delay = random.uniform(0, min(OPENAI_BACKOFF_CAP, OPENAI_BACKOFF_BASE * 2 ** attempt))
+    return max(delay, retry_after or 0)
+
+
+class OpenAIGateway:
+    def __init__(self):
+        self._buckets = {}
+        self._breakers = {}
+        self.calls = 0
+        self.retries = 0
+        self.hedges = 0
+        self.rejections = 0
+
+    def bucket(self, model):
+        if model not in self._buckets:
+            self._buckets[model] = TokenBucket(model_setting("OPENAI_RPM", model, DEFAULT_RATE_LIMITS, DEFAULT_RPM) / GATEWAY_WORKERS)
+        return self._buckets[model]
+
+    def breaker(self, model):
+        if model not in self._breakers:
+            self._breakers[model] = CircuitBreaker(model)
+        return self._breakers[model]
+
+    async def call(self, model, func, /, hedge_after=None, deadline=None, **kwargs):
+        """
+        Call `func(**kwargs)` (an SDK method) under the model's rate limit, circuit
+        breaker and deadline, retrying transient failures. With `hedge_after`, a
+        second identical request is started if the first has not answered within
+        that many seconds, and whichever finishes first wins.
+        """
+        self.calls += 1
+        started = time.monotonic()
+        outcome = "error"
+        budget = deadline or model_setting("OPENAI_DEADLINE", model, DEFAULT_DEADLINES, DEFAULT_DEADLINE)
+        deadline_at = time.monotonic() + budget
+        breaker = self.breaker(model)
+        try:
+            breaker.before_call()
+        except ProviderUnavailable:
+            self.rejections += 1
+            OPENAI_CALL_SECONDS.observe(0.0, model=model, outcome="rejected")
+            raise
+
+        attempt = 0
+        try:
+            while True:
+                await self.bucket(model).acquire(deadline_at)
+                remaining = deadline_at - time.monotonic()
+                try:
+                    if hedge_after is not None and hedge_after < remaining:
+                        result = await asyncio.wait_for(self._hedged(func, hedge_after, kwargs), remaining)
+                    else:
+                        result = await asyncio.wait_for(func(**kwargs), remaining)
+                    breaker.record_success()
+                    outcome = "ok"
+                    # Streamed responses report usage in their last chunk instead
+                    record_usage(model, getattr(result, "usage", None))
+                    return result
+                except asyncio.TimeoutError:
+                    breaker.record_failure()
+                    raise ProviderUnavailable(f"{model} did not respond within {budget:g} seconds")
+                except RETRYABLE_ERRORS as e:
+                    retry_after = retry_after_seconds(e)
+                    if isinstance(e, openai.RateLimitError) and retry_after:
+                        self.bucket(model).penalize(retry_after)
+                    delay = backoff_delay(attempt, retry_after)
+                    attempt += 1
+                    if breaker.state == "open":
+                        # Other calls' failures just opened the circuit; stop hammering the provider
+                        raise ProviderUnavailable("The AI provider is unavailable, please retry shortly", retry_after=breaker.reset_seconds)
+                    if attempt >= OPENAI_MAX_ATTEMPTS or time.monotonic() + delay >= deadline_at:
+                        # One failure per call, once its retries are exhausted, not one per attempt
+                        breaker.record_failure()
+                        logger.error("%s failed after %d attempt(s): %s", model, attempt, e)
+                        raise ProviderUnavailable(f"The AI provider is busy or failing ({model}), please retry shortly", retry_after=delay or None)
+                    self.retries += 1
+                    logger.warning("%s call failed (%s), retrying in %.2fs", model, type(e).__name__, delay)
+                    await asyncio.sleep(delay)
+                except openai.APIStatusError:
+                    # The provider answered (e.g. 400 for a bad request), so it is up
+                    breaker.record_success()
+                    raise
+        except ProviderUnavailable:
+            outcome = "unavailable"
+            raise
+        finally:
+            breaker.release()
+            OPENAI_CALL_SECONDS.observe(time.monotonic() - started, model=model, outcome=outcome)
+
+    async def _hedged(self, func, hedge_after, kwargs):
+        # Every request task is created inside the try, so a deadline or caller cancel never orphans one
+        pending = set()
+        try:
+            pending.add(asyncio.create_task(func(**kwargs)))
+            done, pending = await asyncio.wait(pending, timeout=hedge_after)
+            if done:
+                return done.pop().result()
+            self.hedges += 1
+            pending.add(asyncio.create_task(func(**kwargs)))
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                if not pending:
+                    raise done.pop().exception()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stats(self):
+        return {
+            "calls": self.calls,
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "rejections": self.rejections,
+            "circuits": {model: breaker.state for model, breaker in self._breakers.items()},
+            "tokens": {model: round(bucket.tokens, 2) for model, bucket in self._buckets.items()},
+        }
+
+
+gateway = OpenAIGateway()
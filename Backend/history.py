@@ -0,0 +1,206 @@
+import os
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Turns kept verbatim at the end of the history; older turns are folded into a summary
+HISTORY_RECENT_TURNS = int(os.getenv("HISTORY_RECENT_TURNS", "6"))
+HISTORY_SUMMARY_CACHE_SIZE = int(os.getenv("HISTORY_SUMMARY_CACHE_SIZE", "1024"))
+
+# Token budget for the history part of the prompt, per model
+MODEL_HISTORY_BUDGETS = {
+    "gpt-4o-mini": 6000,
+}
+DEFAULT_HISTORY_BUDGET = 4000
+
+# Turn key suffix carrying the hash of turns trimmed from the front of a session's history
+PREFIX_SUFFIX = "_prefix"
+
+# The tokenizer is loaded on the first count, not at import. tiktoken downloads its
+# encoding file on first use (without a timeout) unless it is already in
+# TIKTOKEN_CACHE_DIR, so on hosts without internet access fetch it at build time:
+#   TIKTOKEN_CACHE_DIR=/opt/tiktoken python -c "import tiktoken; tiktoken.get_encoding('o200k_base')"
+# and run the workers with the same TIKTOKEN_CACHE_DIR. TOKEN_COUNTER=estimate skips tiktoken.
+TOKEN_COUNTER = os.getenv("TOKEN_COUNTER", "tiktoken")
+_encoding = None
+_encoding_loaded = False
+_encoding_lock = threading.Lock()
+
+
+def get_encoding():
+    """The tiktoken encoding, loaded once; None if tiktoken is missing, disabled or its file cannot be loaded"""
+    global _encoding, _encoding_loaded
+    if _encoding_loaded:
+        return _encoding
+    with _encoding_lock:
+        if not _encoding_loaded:
+            if TOKEN_COUNTER == "tiktoken":
+                try:
+                    import tiktoken
+
+                    _encoding = tiktoken.get_encoding("o200k_base")
+                except Exception as e:
+                    logger.warning("tiktoken unavailable, estimating tokens from characters: %s", e)
+            _encoding_loaded = True
+    return _encoding
+
+
+def count_tokens(text):
+    """Token count with the local tokenizer, or a ~4 characters per token estimate without tiktoken"""
+    encoding = get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return len(text) // 4 + 1
+
+
+def history_budget(model):
+    override = os.getenv("HISTORY_TOKEN_BUDGET")
+    if override:
+        return int(override)
+    return MODEL_HISTORY_BUDGETS.get(model, DEFAULT_HISTORY_BUDGET)
+
+
+def turn_tokens(turn):
+    return count_tokens(turn[0]) + count_tokens(turn[1]) + 8  # role/message overhead
+
+
+def prefix_hashes(turns, start=None):
+    """
+    Chained hashes: hashes[k] identifies turns[:k], so any prefix can be looked up in O(1).
+    `start` is the hash of turns that came before `turns` (see drop_oldest_turns).
+    """
+    hashes = [start or hashlib.sha256(b"").hexdigest()]
+    for user_text, assistant_text in turns:
+        digest = hashlib.sha256(hashes[-1].encode("utf-8"))
+        digest.update(user_text.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(assistant_text.encode("utf-8"))
+        hashes.append(digest.hexdigest())
+    return hashes
+
+
+def history_prefix(chat_history, history_field):
+    """Hash of the `history_field` turns dropped from the front of the history, if any"""
+    if not chat_history:
+        return None
+    return chat_history[0].get(history_field + PREFIX_SUFFIX)
+
+
+def drop_oldest_turns(chat_history, count):
+    """
+    Remove the oldest `count` turns in place. The chained hash of what was dropped
+    is kept on the new first turn (as "<field>_prefix"), so the hashes of the turns
+    that remain, and with them the cached summaries, stay the same as before.
+    """
+    dropped = chat_history[:count]
+    del chat_history[:count]
+    if not dropped or not chat_history:
+        return
+    prefixes = {key: value for key, value in dropped[0].items() if key.endswith(PREFIX_SUFFIX)}
+    fields = {key for chat in dropped for key in chat if key != "user" and not key.endswith(PREFIX_SUFFIX)}
+    for field in fields:
+        turns = [(chat["user"], chat[field]) for chat in dropped if "user" in chat and field in chat]
+        prefixes[field + PREFIX_SUFFIX] = prefix_hashes(turns, prefixes.get(field + PREFIX_SUFFIX))[-1]
+    chat_history[0] = {**chat_history[0], **prefixes}
+
+
+class HistoryManager:
+    """
+    Compacts chat history to a token budget.
+
+    The last HISTORY_RECENT_TURNS turns are kept verbatim. Older turns are
+    folded into a rolling summary once they no longer fit the budget, cached under
+    the hash of the turns it covers, so each conversation only summarizes every
+    turn once. Summaries are produced
+    in the background: a turn never waits for one, it uses the newest cached
+    summary plus whatever older turns still fit the budget.
+    """
+
+    def __init__(self, cache_size=HISTORY_SUMMARY_CACHE_SIZE):
+        self.cache_size = cache_size
+        self._summaries = OrderedDict()
+        self._pending = {}
+
+    def compact(self, chat_history, history_field, model, summarize=None):
+        """
+        Return (summary, turns): an optional summary of earlier turns and the
+        (user, assistant) pairs to send verbatim.
+        """
+        turns = [
+            (chat["user"], chat[history_field])
+            for chat in chat_history
+            if "user" in chat and history_field in chat
+        ]
+        budget = history_budget(model)
+        split = max(0, len(turns) - HISTORY_RECENT_TURNS)
+        recent = turns[split:]
+        older = turns[:split]
+
+        # Even the recent turns may not fit when individual messages are huge
+        recent_tokens = [turn_tokens(turn) for turn in recent]
+        while recent and sum(recent_tokens) > budget:
+            older.append(recent.pop(0))
+            recent_tokens.pop(0)
+        remaining = budget - sum(recent_tokens)
+
+        # A trimmed session history still matches the summaries of its dropped turns
+        start = history_prefix(chat_history, history_field)
+        if not older and start is None:
+            return None, recent
+
+        hashes = prefix_hashes(older, start)
+        summary, covered = self._latest_summary(hashes)
+
+        if summary is not None:
+            remaining -= count_tokens(summary)
+
+        # Turns not covered by a summary yet are kept verbatim, newest first, while they fit
+        unsummarized = []
+        for turn in reversed(older[covered:]):
+            tokens = turn_tokens(turn)
+            if tokens > remaining:
+                break
+            unsummarized.insert(0, turn)
+            remaining -= tokens
+        # Summarize only when older turns no longer fit; a history within budget is sent as it is
+        if len(unsummarized) < len(older) - covered and summarize is not None:
+            self._schedule(hashes[-1], summary, older[covered:], summarize)
+        return summary, unsummarized + recent
+
+    def _latest_summary(self, hashes):
+        """Find the summary covering the longest prefix of the older turns (0: only dropped turns)"""
+        for covered in range(len(hashes) - 1, -1, -1):
+            summary = self._summaries.get(hashes[covered])
+            if summary is not None:
+                self._summaries.move_to_end(hashes[covered])
+                return summary, covered
+        return None, 0
+
+    def _schedule(self, key, previous_summary, turns, summarize):
+        if key in self._pending:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        task = loop.create_task(self._summarize(key, previous_summary, turns, summarize))
+        self._pending[key] = task
+
+    async def _summarize(self, key, previous_summary, turns, summarize):
+        try:
+            summary = await summarize(previous_summary, turns)
+            self._summaries[key] = summary
+            self._summaries.move_to_end(key)
+            while len(self._summaries) > self.cache_size:
+                self._summaries.popitem(last=False)
+        except Exception as e:
+            logger.warning("History summarization failed: %s", e)
+        finally:
+            self._pending.pop(key, None)
+
+
+history_manager = HistoryManager()
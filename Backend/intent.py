@@ -0,0 +1,288 @@
+"""
+Local intent gate for trivial turns.
+
+Acknowledgements, thanks, greetings, goodbyes, fillers and gibberish are
+recognised locally and answered from a fixed reply table instead of calling
+the model. Text is normalized (NFKC, case folding, Arabic and Devanagari
+spelling variants, punctuation, stretched letters) and matched against a
+token trie built once from multilingual lexicons (English, Hindi and Arabic,
+native script and romanized); an utterance is trivial only if lexicon phrases
+cover it completely. Anything else goes through script-aware gibberish
+checks, which err on the side of sending the text to the model.
+"""
+import re
+import unicodedata
+
+from telemetry import LOCAL_REPLIES
+
+QUERY = "query"
+ACK = "ack"
+THANKS = "thanks"
+GREETING = "greeting"
+FAREWELL = "farewell"
+UNCLEAR = "unclear"
+
+_FILLER = "filler"  # hmm, umm: answered like an acknowledgement
+_NOISE = "noise"  # test, asdf: answered like gibberish
+_PARTICLE = "particle"  # only allowed next to another phrase ("thanks a lot", "ok ji")
+
+# Longer texts are never trivial, so they skip the gate entirely
+MAX_LOCAL_CHARS = 80
+MAX_LOCAL_TOKENS = 8
+
+LEXICON = {
+    ACK: [
+        "ok", "okay", "okey", "okie", "k", "kk", "cool", "great", "nice", "alright", "all right", "sure",
+        "fine", "noted", "got it", "roger", "yup", "yep", "yes", "yeah", "ya", "no", "nope", "done",
+        "perfect", "awesome", "understood", "i see", "makes sense", "right", "lol",
+        "acha", "accha", "achha", "acchha", "theek hai", "thik hai", "theek", "thik", "haan", "han",
+        "nahi", "nahin", "samajh gaya", "samajh gayi",
+        "ठीक है", "ठीक", "अच्छा", "हाँ", "हां", "जी हाँ", "नहीं", "ओके", "बढ़िया", "समझ गया", "समझ गई",
+        "تمام", "حسنا", "طيب", "نعم", "لا", "اوكي", "أوكي", "ماشي", "أكيد", "فهمت", "ممتاز", "جميل", "اوك",
+    ],
+    THANKS: [
+        "thanks", "thank you", "thank u", "thankyou", "thx", "ty", "tysm", "many thanks",
+        "shukriya", "dhanyavad", "dhanyawad", "dhanyavaad", "shukran",
+        "धन्यवाद", "शुक्रिया", "थैंक यू", "थैंक्स",
+        "شكرا", "شكرا جزيلا", "مشكور", "ألف شكر", "يعطيك العافية",
+    ],
+    GREETING: [
+        "hello", "hi", "hii", "hey", "hiya", "yo", "good morning", "good afternoon", "good evening",
+        "namaste", "namaskar", "salam", "salaam", "assalamualaikum", "assalamu alaikum", "marhaba",
+        "नमस्ते", "नमस्कार", "हेलो", "हैलो", "प्रणाम",
+        "مرحبا", "أهلا", "أهلا وسهلا", "السلام عليكم", "سلام", "صباح الخير", "مساء الخير", "هلا",
+    ],
+    FAREWELL: [
+        "bye", "bye bye", "goodbye", "good bye", "see you", "see ya", "see you later", "ciao", "tata",
+        "tc", "take care", "good night", "alvida",
+        "अलविदा", "बाय", "फिर मिलेंगे", "शुभ रात्रि",
+        "مع السلامة", "وداعا", "إلى اللقاء", "تصبح على خير", "باي",
+    ],
+    _FILLER: [
+        "hmm", "hm", "uh", "uhh", "um", "umm", "err", "ah", "ahh", "oh", "ohh", "huh", "mm",
+        "हम्म", "उम्म", "ओह",
+        "امم", "آه",
+    ],
+    _NOISE: [
+        "test", "testing", "abc", "xyz", "qwe", "asd", "zxc", "dfg", "hjk", "vbn", "mnb", "asdf",
+        "qwerty", "otay", "emjgr",
+    ],
+    _PARTICLE: [
+        "so", "then", "again", "a lot", "very much", "so much", "please", "for", "the", "your", "help",
+        "sir", "maam", "bro", "dear", "man", "buddy", "yaar", "ji", "you", "too", "all", "everyone", "there",
+        "जी", "भाई", "सर", "आपका", "बहुत",
+        "لك", "كثيرا", "يا", "اخي",
+    ],
+}
+
+# When an utterance mixes phrases, the most specific one decides the reply
+PRIORITY = [FAREWELL, THANKS, GREETING, ACK, _FILLER, _NOISE]
+KIND = {FAREWELL: FAREWELL, THANKS: THANKS, GREETING: GREETING, ACK: ACK, _FILLER: ACK, _NOISE: UNCLEAR}
+
+# Arabic: drop harakat, Quranic marks and tatweel; unify alef, alef maqsura and ta marbuta
+# Devanagari: drop nukta, candrabindu -> anusvara
+_FOLD = str.maketrans({
+    **{chr(c): None for c in range(0x064B, 0x0660)},
+    "ٰ": None, "ـ": None,
+    "أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا", "ى": "ي", "ة": "ه",
+    **{chr(0x0660 + d): str(d) for d in range(10)},
+    **{chr(0x06F0 + d): str(d) for d in range(10)},
+    "़": None, "ँ": "ं",
+    "_": " ",
+})
+# Everything except word characters, whitespace and the Devanagari/Arabic letter and mark
+# ranges (\w alone would drop Devanagari vowel signs) is punctuation or a symbol
+_PUNCTUATION_RE = re.compile(r"[^\w\sऀ-ॣ०-ॿؠ-ٟٮ-ۓە-ۿ]")
+_STRETCH_RE = re.compile(r"(.)\1{2,}")  # "okkkk", "hmmmm", "شكراااا"
+
+_LATIN_VOWELS = set("aeiouyàáâãäåèéêëìíîïòóôõöùúûüý")
+_KEYBOARD_ROWS = ("qwertyuiop", "asdfghjkl", "zxcvbnm")
+# Devanagari signs that cannot start a word (vowel signs, virama, accents)
+_DEVANAGARI_DEPENDENT = set(map(chr, [*range(0x093A, 0x0950), *range(0x0951, 0x0958), 0x0962, 0x0963, 0x0902, 0x0903]))
+_VIRAMA = "्"
+
+
+def normalize(text):
+    text = unicodedata.normalize("NFKC", text).casefold().translate(_FOLD)
+    text = _PUNCTUATION_RE.sub(" ", text)
+    return _STRETCH_RE.sub(r"\1", text).split()
+
+
+def _build_trie():
+    trie = {}
+    for category, phrases in LEXICON.items():
+        for phrase in phrases:
+            node = trie
+            for token in normalize(phrase):
+                node = node.setdefault(token, {})
+            node[None] = category
+    return trie
+
+
+_TRIE = _build_trie()
+
+
+def _match_lexicon(tokens):
+    """
+    Categories of lexicon phrases covering all tokens, or None if the tokens
+    cannot be split into lexicon phrases
+    """
+    # best[i]: categories used to cover tokens[:i] (fewest phrases first)
+    best = [None] * (len(tokens) + 1)
+    best[0] = ()
+    for start in range(len(tokens)):
+        if best[start] is None:
+            continue
+        node = _TRIE
+        for end in range(start, len(tokens)):
+            node = node.get(tokens[end])
+            if node is None:
+                break
+            category = node.get(None)
+            if category is not None and (best[end + 1] is None or len(best[end + 1]) > len(best[start]) + 1):
+                best[end + 1] = best[start] + (category,)
+    return best[-1]
+
+
+def _script(char):
+    code = ord(char)
+    if 0x0900 <= code <= 0x097F:
+        return "devanagari"
+    if 0x0600 <= code <= 0x06FF or 0x0750 <= code <= 0x077F or 0x08A0 <= code <= 0x08FF:
+        return "arabic"
+    if char.isascii() or 0x00C0 <= code <= 0x024F:
+        return "latin"
+    return "other"
+
+
+def _is_suspicious_latin(word):
+    if len(word) >= 4 and any(word in row for row in _KEYBOARD_ROWS):
+        return True
+    run = longest = 0
+    for char in word:
+        run = 0 if char in _LATIN_VOWELS else run + 1
+        longest = max(longest, run)
+    # Short all-consonant words are usually acronyms (pdf, sql, html)
+    return longest >= 6 or (longest == len(word) and len(word) >= 5)
+
+
+def _is_suspicious_word(word):
+    scripts = {_script(char) for char in word if not char.isdigit()}
+    if len(scripts) > 1:
+        # Mixed scripts inside one word are transcription or keyboard noise
+        return True
+    script = scripts.pop() if scripts else None
+    if script == "latin":
+        return _is_suspicious_latin(word)
+    if script == "devanagari":
+        return word[0] in _DEVANAGARI_DEPENDENT or _VIRAMA + _VIRAMA in word
+    return False
+
+
+def classify(text):
+    """
+    Intent of a user turn: QUERY (send to the model), ACK, THANKS, GREETING,
+    FAREWELL or UNCLEAR (empty, gibberish or noise)
+    """
+    if len(text) > MAX_LOCAL_CHARS * 2:
+        return QUERY
+    tokens = normalize(text)
+    if not tokens:
+        return UNCLEAR
+    if len(tokens) > MAX_LOCAL_TOKENS or sum(map(len, tokens)) > MAX_LOCAL_CHARS:
+        return QUERY
+
+    categories = _match_lexicon(tokens)
+    if categories:
+        for category in PRIORITY:
+            if category in categories:
+                return KIND[category]
+        # Particles alone ("so", "please") are not a turn of their own
+
+    # Short texts are often real questions ("42", "2+2", "AI?", "C++", "كم؟"); only a lone letter is noise
+    stripped = text.strip()
+    if len(stripped) == 1 and stripped.isalpha():
+        return UNCLEAR
+    words = [token for token in tokens if not token.isdigit()]
+    if words and all(_is_suspicious_word(word) for word in words):
+        return UNCLEAR
+    return QUERY
+
+
+# Local replies per intent and context ("chat" or "documents"), in the languages the app supports
+REPLIES = {
+    "chat": {
+        ACK: {
+            "english": "Great! Let me know if there's anything else I can help with.",
+            "hindi": "ठीक है! अगर आपको किसी और चीज़ में मदद चाहिए तो बताइए।",
+            "arabic": "حسنًا! أخبرني إذا كان هناك أي شيء آخر يمكنني مساعدتك به.",
+        },
+        THANKS: {
+            "english": "You're welcome! Let me know if there's anything else I can help with.",
+            "hindi": "आपका स्वागत है! अगर आपको किसी और चीज़ में मदद चाहिए तो बताइए।",
+            "arabic": "على الرحب والسعة! أخبرني إذا كان هناك أي شيء آخر يمكنني مساعدتك به.",
+        },
+        GREETING: {
+            "english": "Hello! How can I help you today?",
+            "hindi": "नमस्ते! मैं आपकी क्या मदद कर सकता हूँ?",
+            "arabic": "مرحبًا! كيف يمكنني مساعدتك اليوم؟",
+        },
+        FAREWELL: {
+            "english": "Goodbye! Have a great day.",
+            "hindi": "अलविदा! आपका दिन शुभ हो।",
+            "arabic": "مع السلامة! أتمنى لك يومًا سعيدًا.",
+        },
+        UNCLEAR: {
+            "english": "Sorry, I didn't catch that. Could you please rephrase your question?",
+            "hindi": "माफ़ कीजिए, मैं समझ नहीं पाया। कृपया अपना प्रश्न दोबारा पूछें।",
+            "arabic": "عذرًا، لم أفهم ذلك. هل يمكنك إعادة صياغة سؤالك؟",
+        },
+    },
+    "documents": {
+        ACK: {
+            "english": "Let me know if you have a question about the document(s).",
+            "hindi": "अगर आपका दस्तावेज़ के बारे में कोई प्रश्न है तो बताइए।",
+            "arabic": "أخبرني إذا كان لديك سؤال حول الوثيقة.",
+        },
+        THANKS: {
+            "english": "You're welcome! Let me know if you have a question about the document(s).",
+            "hindi": "आपका स्वागत है! अगर आपका दस्तावेज़ के बारे में कोई प्रश्न है तो बताइए।",
+            "arabic": "على الرحب والسعة! أخبرني إذا كان لديك سؤال حول الوثيقة.",
+        },
+        GREETING: {
+            "english": "Hello! Ask me anything about your document(s).",
+            "hindi": "नमस्ते! अपने दस्तावेज़ के बारे में मुझसे कुछ भी पूछें।",
+            "arabic": "مرحبًا! اسألني أي شيء عن الوثيقة.",
+        },
+        UNCLEAR: {
+            "english": "Please clarify your question. I didn't understand your query. Please ask a clear question about the document(s).",
+            "hindi": "कृपया अपना प्रश्न स्पष्ट रूप से पूछें। आपका प्रश्न समझ में नहीं आया। कृपया दस्तावेज़ के बारे में कोई स्पष्ट प्रश्न पूछें।",
+            "arabic": "يرجى توضيح سؤالك. لم أفهم استفسارك. يرجى طرح سؤال واضح حول الوثيقة.",
+        },
+    },
+}
+REPLIES["documents"][FAREWELL] = REPLIES["chat"][FAREWELL]
+
+
+def awaiting_answer(chat_history, response_field="ai"):
+    """Whether the last assistant turn asked the user something ("yes"/"no" then answer it)"""
+    if not chat_history:
+        return False
+    last = (chat_history[-1].get(response_field) or "").rstrip()
+    return last.endswith(("?", "؟"))
+
+
+def local_reply(text, language="english", context="chat", chat_history=None):
+    """
+    The reply for a trivial turn, or None when the text should go to the model.
+    A bare acknowledgement right after the assistant asked a question is a real
+    answer, so it goes to the model too.
+    """
+    intent = classify(text)
+    if intent == QUERY:
+        return None
+    if intent == ACK and awaiting_answer(chat_history, "ai" if context == "chat" else "document"):
+        return None
+    LOCAL_REPLIES.inc(intent=intent)
+    replies = REPLIES[context][intent]
+    return replies.get(language.lower(), replies["english"])
@@ -0,0 +1,109 @@
+"""
+Worker lifecycle: liveness, readiness and graceful drain.
+
+A worker is ready once its lifespan startup has finished and until it starts
+draining. On SIGTERM it first drains: readiness fails (so the load balancer
+stops routing to it), new voice sessions are refused, idle voice streams are
+closed, and in-flight requests and WebSocket sessions get up to DRAIN_TIMEOUT
+seconds to finish (but the worker waits at least DRAIN_MIN_SECONDS, for load
+balancers to notice). Only then is the signal passed on to uvicorn, which
+stops accepting connections and shuts down.
+"""
+import os
+import time
+import signal
+import asyncio
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+DRAIN_MIN_SECONDS = float(os.getenv("DRAIN_MIN_SECONDS", "0"))
+DRAIN_TIMEOUT = float(os.getenv("DRAIN_TIMEOUT", "30"))
+# Probes are not counted as in-flight work
+UNTRACKED_PATHS = ("/healthz", "/readyz", "/metrics")
+
+
+class Lifecycle:
+    def __init__(self):
+        self.started_at = None
+        self.draining = False
+        self.in_flight = 0
+        self._drain_task = None
+        self._drain_started = asyncio.Event()
+
+    @property
+    def ready(self):
+        return self.started_at is not None and not self.draining
+
+    def startup(self):
+        self.started_at = time.monotonic()
+        self._install_drain_handler()
+
+    def status(self):
+        return {
+            "ready": self.ready,
+            "draining": self.draining,
+            "in_flight": self.in_flight,
+            "uptime_seconds": round(time.monotonic() - self.started_at, 1) if self.started_at is not None else 0.0,
+            "pid": os.getpid(),
+        }
+
+    async def wait_for_drain(self):
+        """Return once the worker starts draining (for long-lived connections to close when idle)"""
+        await self._drain_started.wait()
+
+    def _install_drain_handler(self):
+        # Signals can only be handled on the main thread (not under TestClient, for example)
+        if threading.current_thread() is not threading.main_thread():
+            return
+        server_handler = signal.getsignal(signal.SIGTERM)
+        if not callable(server_handler):
+            return
+        loop = asyncio.get_running_loop()
+
+        def handle_sigterm(sig, frame):
+            if self._drain_task is not None:
+                # A second SIGTERM skips the drain
+                server_handler(sig, frame)
+                return
+            self.draining = True
+            loop.call_soon_threadsafe(self._start_drain, server_handler, sig, frame)
+
+        signal.signal(signal.SIGTERM, handle_sigterm)
+
+    def _start_drain(self, server_handler, sig, frame):
+        self._drain_started.set()
+        self._drain_task = asyncio.get_running_loop().create_task(self._drain(server_handler, sig, frame))
+
+    async def _drain(self, server_handler, sig, frame):
+        started = time.monotonic()
+        logger.info("Draining: %d request(s) in flight", self.in_flight)
+        while time.monotonic() - started < DRAIN_TIMEOUT:
+            elapsed = time.monotonic() - started
+            if self.in_flight == 0 and elapsed >= DRAIN_MIN_SECONDS:
+                break
+            await asyncio.sleep(0.1)
+        if self.in_flight:
+            logger.warning("Drain timed out with %d request(s) in flight", self.in_flight)
+        logger.info("Drained in %.1fs, shutting down", time.monotonic() - started)
+        server_handler(sig, frame)
+
+
+lifecycle = Lifecycle()
+
+
+class LifecycleMiddleware:
+    """ASGI middleware counting in-flight requests and WebSocket sessions for the drain"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket") or scope["path"] in UNTRACKED_PATHS:
+            return await self.app(scope, receive, send)
+        lifecycle.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            lifecycle.in_flight -= 1
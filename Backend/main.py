@@ -1,38 +1,85 @@
 import os
-import tempfile
-import subprocess
+import json
+import codecs
+import asyncio
+import time
 import logging
-import io
-import base64
-from openai import OpenAI, APIError
-from fastapi import FastAPI, File, UploadFile, HTTPException
-from fastapi.responses import FileResponse
+from contextlib import asynccontextmanager
+from openai import AsyncOpenAI, APIError, BadRequestError
+from fastapi import FastAPI, File, UploadFile, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import List, Dict, Optional
-import uvicorn
 from dotenv import load_dotenv
-from langdetect import detect, DetectorFactory
-import PyPDF2
-import docx
-from PIL import Image
-import pytesseract
 
-# Ensure consistent language detection
-DetectorFactory.seed = 0
+# Load .env before the local modules below read their settings
+load_dotenv()
 
-logging.basicConfig(level=logging.DEBUG)
-logger = logging.getLogger(__name__)
+from telemetry import (
+    TelemetryMiddleware, configure_logging, current_trace, start_trace, stage, record_stage, record_usage,
+    render, render_stats, TTS_CHARACTERS, DOCUMENT_BYTES
+)
+from intent import QUERY, classify, local_reply
+from lifecycle import LifecycleMiddleware, lifecycle
+from gateway import gateway, create_http_client
+from executor import run_blocking, run_cpu, stage_semaphore, shutdown_pools
+from audio import StreamingDecoder, encode_for_upload, prepare_audio_for_whisper
+from vad import StreamingEndpointer
+from extractors import EXTRACTOR_VERSIONS, OCR_ERROR_PREFIX, PDF_MAX_PAGES, extract_pdf_pages, join_pages, extract_text_from_docx, extract_image
+from extraction_cache import extraction_cache, extraction_cache_key
+from uploads import AUDIO_TYPES, IMAGE_TYPES, UploadLimitMiddleware, read_upload, receive_upload
+from tts_cache import tts_cache
+from tts import STREAM_MEDIA_TYPES, chunk_text, split_sentences, synthesize_in_order, wav_header
+from document_store import document_store
+from session_store import session_store
+from prompts import assemble_document_messages, canonical_documents, document_fingerprint, document_set_fingerprint
+from response_cache import response_cache, response_cache_key
+from history import history_manager
+from retrieval import FULL_CONTEXT_CHARS, chunk_document, embed_chunks, retrieve_chunks, format_chunk_citation
 
-load_dotenv()
+configure_logging()
+logger = logging.getLogger(__name__)
 
 DURATION = 5
+DOCUMENT_EVICTION_INTERVAL = int(os.getenv("DOCUMENT_EVICTION_INTERVAL", "300"))
+UPLOAD_CONCURRENCY = int(os.getenv("UPLOAD_CONCURRENCY", "4"))
+UPLOAD_FILE_TIMEOUT = float(os.getenv("UPLOAD_FILE_TIMEOUT", "120"))  # seconds per file
+BATCH_MAX_QUERIES = int(os.getenv("BATCH_MAX_QUERIES", "100"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))  # model calls in flight per batch request
+BATCH_PACK_SIZE = int(os.getenv("BATCH_PACK_SIZE", "8"))  # questions per packed prompt
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-if not OPENAI_API_KEY:
-    raise ValueError("OPENAI_API_KEY environment variable is required")
 
-print("OpenAI API key configured")
-app = FastAPI()
+async def evict_expired_documents():
+    while True:
+        await asyncio.sleep(DOCUMENT_EVICTION_INTERVAL)
+        try:
+            evicted = await document_store.evict_expired()
+            if evicted:
+                logger.info(f"Evicted {evicted} expired document(s)")
+            evicted = await session_store.evict_expired()
+            if evicted:
+                logger.info(f"Evicted {evicted} idle session(s)")
+        except Exception as e:
+            logger.error(f"Error evicting expired documents: {str(e)}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Checked at startup rather than import, so tooling can import the app without a key
+    if not OPENAI_API_KEY:
+        raise ValueError("OPENAI_API_KEY environment variable is required")
+    logger.info("OpenAI API key configured")
+    eviction_task = asyncio.create_task(evict_expired_documents())
+    lifecycle.startup()
+    yield
+    eviction_task.cancel()
+    # Release the blocking/CPU worker pools on shutdown
+    shutdown_pools()
+
+app = FastAPI(lifespan=lifespan)
+
+# Added before CORS (so inside it) for oversized requests to still get CORS headers on their 413
+app.add_middleware(UploadLimitMiddleware)
 
 # CORS setup
 app.add_middleware(
@@ -41,221 +88,301 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Trace-Id", "Server-Timing"],
 )
+app.add_middleware(LifecycleMiddleware)
+# Added last so it wraps everything: trace IDs, stage timings and request durations
+app.add_middleware(TelemetryMiddleware)
 
-# OpenAI client
-openai_client = OpenAI(api_key=OPENAI_API_KEY)
+# OpenAI client (async so API calls never block the event loop). Retries are done by
+# the gateway, which also rate limits per model, so the SDK's own retries are off.
+# Without a key the app still imports; startup then fails in lifespan.
+openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY, http_client=create_http_client(), max_retries=0) if OPENAI_API_KEY else None
 
 class PromptRequest(BaseModel):
     prompt: str
+    session_id: Optional[str] = None  # Server-side history; replaces chat_history
     chat_history: List[Dict[str, str]] = []
     language: str = "english"  # default
+    stream: bool = False  # Relay token deltas as Server-Sent Events (/tts: stream audio chunks)
+    audio_format: str = "wav"  # /tts output: wav, mp3, opus, aac or pcm
     
 class DocumentRequest(BaseModel):
     query: str
-    documents: List[Dict]  # List of documents with content and metadata
+    document_ids: List[str] = []  # IDs returned by /upload_documents
+    documents: List[Dict] = []  # Legacy: full documents with content and metadata
+    session_id: Optional[str] = None  # Server-side history and uploaded documents
     chat_history: List[Dict[str, str]] = []
     language: str = "english"
+    stream: bool = False  # Relay token deltas as Server-Sent Events
+
+class DocumentBatchRequest(BaseModel):
+    queries: List[str]
+    document_ids: List[str] = []  # IDs returned by /upload_documents
+    documents: List[Dict] = []  # Legacy: full documents with content and metadata
+    session_id: Optional[str] = None  # Server-side history and uploaded documents
+    chat_history: List[Dict[str, str]] = []
+    language: str = "english"
+    concurrency: Optional[int] = None  # Model calls in flight (capped at BATCH_CONCURRENCY)
+    pack: bool = False  # Answer several questions per model call when the documents fit in one prompt
 
 async def transcribe_audio(file: UploadFile, selected_language: str = "english"):
-    # Save uploaded file
-    with tempfile.NamedTemporaryFile(delete=False) as tmp_in:
-        content = await file.read()
-        tmp_in.write(content)
-        tmp_in_path = tmp_in.name
+    # Unrecognized containers are left to ffmpeg; documents and images are rejected
+    content, _ = await read_upload(file, AUDIO_TYPES | {None})
+    return await transcribe_audio_bytes(content, selected_language)
 
-    # Output WAV path
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as tmp_out:
-        tmp_out_path = tmp_out.name
 
-    try:
-        # Convert to WAV (16kHz mono)
-        subprocess.run([
-            "ffmpeg", "-y", "-i", tmp_in_path, "-ar", "16000", "-ac", "1", tmp_out_path
-        ], check=True)
-
-        # whisper_lang = "hi" if selected_language.lower() == "hindi" else "en"
-        # Force Whisper language
-        lang = selected_language.lower()
-        if lang == "hindi":
-            whisper_lang = "hi"
-        elif lang == "arabic":
-            whisper_lang = "ar"
-        else:
-            whisper_lang = "en"
+async def transcribe_audio_bytes(content: bytes, selected_language: str = "english"):
+    """Returns (text, language, speech stats); raises a 400 for clips without speech"""
+    # Convert to 16kHz mono in memory (no temp files, no ffmpeg for matching WAVs) and trim silence
+    audio_bytes, audio_filename, speech = await prepare_audio_for_whisper(content)
+    if not speech["has_speech"]:
+        # Silent or noise-only clips never reach Whisper
+        raise HTTPException(status_code=400, detail="No speech detected in the recording")
+
+    text, language = await whisper_transcribe(audio_bytes, audio_filename, selected_language)
+    return text, language, speech
 
 
-        with open(tmp_out_path, "rb") as audio_file:
-            transcription = openai_client.audio.transcriptions.create(
-                file=audio_file,
+async def whisper_transcribe(audio_bytes, audio_filename, selected_language, prompt=None):
+    # Force Whisper language
+    whisper_lang = get_language_code(selected_language)
+    # Earlier text of the same utterance keeps spelling and casing consistent across segments
+    extra = {"prompt": prompt} if prompt else {}
+
+    async with stage_semaphore("transcribe"):
+        with stage("whisper"):
+            transcription = await gateway.call(
+                "whisper-1",
+                openai_client.audio.transcriptions.create,
+                file=(audio_filename, audio_bytes),
                 model="whisper-1",
                 language=whisper_lang,  # Force script
-                response_format="verbose_json"
+                response_format="verbose_json",
+                **extra
             )
-        return transcription.text, transcription.language
-    finally:
-        os.remove(tmp_in_path)
-        os.remove(tmp_out_path)
+    return transcription.text, transcription.language
 
 
-def get_ai_response(prompt, chat_history, model="gpt-4o-mini"):
+async def summarize_history(previous_summary, turns):
+    """Fold older conversation turns into the rolling summary used by history compaction"""
+    transcript = "\n".join(f"User: {user_text}\nAssistant: {assistant_text}" for user_text, assistant_text in turns)
+    content = f"Existing summary:\n{previous_summary}\n\n" if previous_summary else ""
+    content += f"New conversation turns:\n{transcript}"
+    messages = [
+        {"role": "system", "content": "Summarize the conversation so far in a few sentences. Keep names, numbers, decisions and open questions. Write the summary in the language of the conversation."},
+        {"role": "user", "content": content}
+    ]
+    async with stage_semaphore("chat"):
+        with stage("summarize"):
+            response = await gateway.call("gpt-4o-mini", openai_client.chat.completions.create, model="gpt-4o-mini", messages=messages, max_tokens=300)
+    return response.choices[0].message.content
+
+def history_messages(chat_history, history_field, model):
+    """Chat history compacted to the model's token budget, as chat messages"""
+    summary, turns = history_manager.compact(chat_history, history_field, model, summarize=summarize_history)
+    messages = []
+    if summary:
+        messages.append({"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"})
+    for user_text, assistant_text in turns:
+        messages.append({"role": "user", "content": user_text})
+        messages.append({"role": "assistant", "content": assistant_text})
+    return messages
+
+def build_chat_messages(prompt, chat_history, model="gpt-4o-mini"):
+    messages = [{"role": "system", "content": "You are a helpful AI assistant. Use the full conversation history to respond in the same language as the user's prompt."}]
+
+    # Only 'ai' responses (not 'document') belong to this conversation
+    messages.extend(history_messages(chat_history, "ai", model))
+
+    messages.append({"role": "user", "content": prompt})
+    return messages
+
+async def get_ai_response(prompt, chat_history, model="gpt-4o-mini"):
     try:
-        logger.debug("Received chat_history: %s", chat_history)
-        messages = [{"role": "system", "content": "You are a helpful AI assistant. Use the full conversation history to respond in the same language as the user's prompt."}]
-        
-        # Filter chat history to only include 'ai' responses (not 'document')
-        for chat in chat_history:
-            if "user" in chat and "ai" in chat:
-                messages.append({"role": "user", "content": chat["user"]})
-                messages.append({"role": "assistant", "content": chat["ai"]})
-        
-        messages.append({"role": "user", "content": prompt})
-        response = openai_client.chat.completions.create(model=model, messages=messages)
+        messages = build_chat_messages(prompt, chat_history, model)
+        async with stage_semaphore("chat"):
+            with stage("chat"):
+                response = await gateway.call(model, openai_client.chat.completions.create, model=model, messages=messages)
         return response.choices[0].message.content
     except APIError as e:
         logger.error("API Error: %s", str(e))
         raise HTTPException(status_code=400, detail=str(e))
 
-def generate_tts(text, language_code):
-    voice_map = {
-        "en": "alloy",
-        "hi": "alloy",  
-        "ar": "alloy",  
+async def stream_chat_completion(messages, model="gpt-4o-mini", usage=None, **kwargs):
+    """
+    Async generator yielding text deltas of the chat completion as they arrive.
+    If a `usage` dict is given it is filled with the token usage from the final chunk.
+    """
+    started = time.perf_counter()
+    first_delta = True
+    async with stage_semaphore("chat"):
+        with stage("chat_stream"):
+            stream = await gateway.call(
+                model,
+                openai_client.chat.completions.create,
+                model=model,
+                messages=messages,
+                stream=True,
+                stream_options={"include_usage": True},
+                **kwargs
+            )
+            async for chunk in stream:
+                if chunk.usage:
+                    record_usage(model, chunk.usage)
+                    if usage is not None:
+                        usage.update(chunk.usage.model_dump(exclude_none=True))
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if first_delta:
+                        record_stage("chat_first_delta", time.perf_counter() - started)
+                        first_delta = False
+                    yield chunk.choices[0].delta.content
+
+async def stream_ai_response(prompt, chat_history, model="gpt-4o-mini", usage=None):
+    """
+    Streaming variant of get_ai_response
+    """
+    messages = build_chat_messages(prompt, chat_history, model)
+    async for delta in stream_chat_completion(messages, model=model, usage=usage):
+        yield delta
+
+def get_language_code(language):
+    """Convert language name to the short code used for Whisper and TTS"""
+    language_codes = {
+        "english": "en",
+        "hindi": "hi",
+        "arabic": "ar"
     }
-    voice = voice_map.get(language_code, "alloy")
+    return language_codes.get(language.lower(), "en")
+
+TTS_MODEL = "tts-1"
+# Per-language voices (e.g. TTS_VOICE_HI=nova); a voice the model rejects falls back to TTS_FALLBACK_VOICE
+TTS_FALLBACK_VOICE = os.getenv("TTS_FALLBACK_VOICE", "alloy")
+TTS_VOICES = {code: os.getenv(f"TTS_VOICE_{code.upper()}", TTS_FALLBACK_VOICE) for code in ("en", "hi", "ar")}
+# Start a second, identical speech request if the first one is slower than this (0 disables hedging)
+TTS_HEDGE_AFTER = float(os.getenv("TTS_HEDGE_AFTER", "2.5"))
 
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as tmp_file:
-        speech_path = tmp_file.name
+async def synthesize_speech(text, language_code, response_format="wav", voice=None):
+    """Synthesize a single text chunk and return the audio bytes (served from the TTS cache when possible)"""
+    voice = voice or TTS_VOICES.get(language_code, TTS_FALLBACK_VOICE)
+    audio = await tts_cache.get(text, voice, TTS_MODEL, response_format)
+    if audio is not None:
+        return audio
+    TTS_CHARACTERS.inc(len(text))
+    async with stage_semaphore("tts"):
+        with stage("tts"):
+            response = await gateway.call(
+                TTS_MODEL,
+                openai_client.audio.speech.create,
+                hedge_after=TTS_HEDGE_AFTER or None,
+                model=TTS_MODEL,
+                voice=voice,
+                input=text,
+                response_format=response_format
+            )
+    await tts_cache.put(text, voice, TTS_MODEL, response_format, response.content)
+    return response.content
+
+async def synthesize_chunk(text, language_code, response_format="wav"):
+    voice = TTS_VOICES.get(language_code, TTS_FALLBACK_VOICE)
     try:
-        response = openai_client.audio.speech.create(
-            model="tts-1",
-            voice=voice,
-            input=text,
-            response_format="wav"
-        )
-        with open(speech_path, "wb") as f:
-            f.write(response.content)
-        return speech_path
+        return await synthesize_speech(text, language_code, response_format, voice=voice)
+    except BadRequestError as e:
+        # A configured voice the model does not offer: retry once with the fallback voice
+        if voice == TTS_FALLBACK_VOICE:
+            raise HTTPException(status_code=400, detail=f"TTS error: {str(e)}")
+        logger.warning(f"TTS voice {voice} rejected, falling back to {TTS_FALLBACK_VOICE}: {str(e)}")
+        try:
+            return await synthesize_speech(text, language_code, response_format, voice=TTS_FALLBACK_VOICE)
+        except APIError as e2:
+            raise HTTPException(status_code=400, detail=f"TTS error: {str(e2)}")
     except APIError as e:
-        # Retry once with 'alloy' if some other voice was chosen
-        if voice != "alloy":
-            try:
-                response = openai_client.audio.speech.create(
-                    model="tts-1",
-                    voice="alloy",
-                    input=text,
-                    response_format="wav"
-                )
-                with open(speech_path, "wb") as f:
-                    f.write(response.content)
-                return speech_path
-            except APIError as e2:
-                raise HTTPException(status_code=400, detail=f"TTS error: {str(e2)}")
         raise HTTPException(status_code=400, detail=f"TTS error: {str(e)}")
 
-def extract_text_from_pdf(file_content):
-    try:
-        pdf_content = ""
-        pdf_reader = PyPDF2.PdfReader(io.BytesIO(file_content))
-        for page_num in range(len(pdf_reader.pages)):
-            page = pdf_reader.pages[page_num]
-            pdf_content += page.extract_text()
-        return pdf_content
-    except Exception as e:
-        logger.error(f"Error extracting text from PDF: {str(e)}")
-        raise Exception(f"Failed to extract text from PDF: {str(e)}")
+async def tts_chunks(text, language_code, audio_format="wav"):
+    """
+    Synthesize `text` sentence by sentence (concurrently, bounded by TTS_PARALLELISM) and
+    yield the audio in order. "wav" is synthesized as raw PCM so the chunks can be joined.
+    """
+    response_format = "pcm" if audio_format == "wav" else audio_format
+    synthesize = lambda chunk: synthesize_chunk(chunk, language_code, response_format)
+    async for _, audio in synthesize_in_order(chunk_text(text), synthesize):
+        yield audio
 
-def extract_text_from_docx(file_content):
-    try:
-        doc = docx.Document(io.BytesIO(file_content))
-        return " ".join([paragraph.text for paragraph in doc.paragraphs])
-    except Exception as e:
-        logger.error(f"Error extracting text from DOCX: {str(e)}")
-        raise Exception(f"Failed to extract text from DOCX: {str(e)}")
+async def generate_tts(text, language_code, audio_format="wav"):
+    audio = b"".join([chunk async for chunk in tts_chunks(text, language_code, audio_format)])
+    if audio_format == "wav":
+        return wav_header(len(audio)) + audio
+    return audio
 
-def extract_text_from_image(file_content):
-    try:
-        # Open image from bytes
-        image = Image.open(io.BytesIO(file_content))
-        
-        # Convert to RGB if necessary (for PNG with transparency, etc.)
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
-        
-        # Configure tesseract for better OCR
-        custom_config = r'--oem 3 --psm 6 -c tessedit_char_whitelist=0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz!@#$%^&*()_+-=[]{}|;:,.<>?/~`" '
-        
-        # Extract text using OCR
-        extracted_text = pytesseract.image_to_string(image, config=custom_config)
-        
-        # Clean up the extracted text
-        extracted_text = extracted_text.strip()
-        
-        if not extracted_text:
-            # Try with different PSM mode if first attempt fails
-            custom_config = r'--oem 3 --psm 3'
-            extracted_text = pytesseract.image_to_string(image, config=custom_config).strip()
-        
-        if not extracted_text:
-            return "No text could be extracted from this image. The image might not contain readable text or the text might be too blurry/unclear for OCR processing."
-            
-        return extracted_text
-        
-    except Exception as e:
-        logger.error(f"Error extracting text from image: {str(e)}")
-        # Don't raise an exception, return a helpful message instead
-        return f"Error processing image: Could not extract text from the image. Please ensure the image contains clear, readable text. Error details: {str(e)}"
+def decode_text(content):
+    # A BOM names the encoding (UTF-16 files always start with one)
+    if content.startswith(codecs.BOM_UTF8):
+        return content.decode("utf-8-sig", errors="replace")
+    if content.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return content.decode("utf-16", errors="replace")
+    for encoding in ("utf-8", "cp1252"):
+        try:
+            return content.decode(encoding)
+        except UnicodeDecodeError:
+            pass
+    return content.decode("latin-1")
 
-def process_document(file: UploadFile) -> tuple:
+async def process_document(file: UploadFile, on_progress=None) -> tuple:
     """
-    Process document and return (text_content, is_image, image_base64)
+    Process document and return (text_content, is_image, image_base64, page_offsets)
+    `on_progress(done, total)` is called as PDF pages are extracted.
     """
+    # The type is sniffed from the content; oversized or unsupported files are rejected (413/415)
+    upload = await receive_upload(file)
     try:
-        # Read file content
-        content = file.file.read()
-        
-        # Reset file pointer for potential re-reading
-        file.file.seek(0)
-        
-        # Get file extension
-        file_extension = file.filename.split(".")[-1].lower() if file.filename else ""
-        
-        logger.info(f"Processing file: {file.filename}, extension: {file_extension}, size: {len(content)} bytes")
+        file_type = upload.file_type
+        logger.info("Processing file: %s, type: %s, size: %d bytes, spooled: %s", file.filename, file_type, upload.size, upload.path is not None)
         
         # Check if it's an image file
-        is_image = file_extension in ["jpg", "jpeg", "png", "bmp", "tiff", "tif", "webp"]
+        is_image = file_type in IMAGE_TYPES
         image_base64 = None
+        page_offsets = [0]
+        DOCUMENT_BYTES.inc(upload.size, type=file_type)
+
+        # Re-uploads of the same file (in any session) skip extraction
+        version = EXTRACTOR_VERSIONS["image" if is_image else "docx" if file_type == "doc" else file_type]
+        cache_key = extraction_cache_key(upload.sha256, file_type, version)
+        with stage("extraction_cache"):
+            cached = await extraction_cache.get(cache_key)
+        if cached is not None:
+            logger.info("Extraction cache hit for %s", file.filename)
+            return cached["text"], is_image, cached["image_data"], cached["page_offsets"]
+        cacheable = True
         
-        if file_extension == "pdf":
-            text_content = extract_text_from_pdf(content)
-        elif file_extension in ["docx", "doc"]:
-            text_content = extract_text_from_docx(content)
+        if file_type == "pdf":
+            with stage("pdf"):
+                pages, pdf_info = await extract_pdf_pages(upload.source, on_progress=on_progress)
+            text_content, page_offsets = join_pages(pages)
+            logger.info("Extracted %s: %s", file.filename, pdf_info)
+            # Pages cut off by the time budget (or failed, or whose OCR failed) may extract fine next time
+            cacheable = pdf_info["extracted_pages"] == min(pdf_info["page_count"], PDF_MAX_PAGES) and not pdf_info["ocr_failed"]
+        elif file_type in ["docx", "doc"]:
+            with stage("docx"):
+                text_content = await run_cpu("docx", extract_text_from_docx, upload.source)
         elif is_image:
-            # For images, extract text via OCR but also store the image data
-            text_content = extract_text_from_image(content)
-            # Convert image to base64 for vision API
-            image_base64 = base64.b64encode(content).decode('utf-8')
-        elif file_extension in ["txt"]:
-            # Handle text files
-            try:
-                text_content = content.decode("utf-8")
-            except UnicodeDecodeError:
-                try:
-                    text_content = content.decode("latin-1")
-                except UnicodeDecodeError:
-                    text_content = content.decode("utf-8", errors="ignore")
+            # For images, extract text via OCR and keep a downscaled JPEG for the vision API
+            with stage("ocr"):
+                text_content, image_base64 = await run_blocking("ocr", extract_image, upload.read())
+            cacheable = image_base64 is not None and not text_content.startswith(OCR_ERROR_PREFIX)
         else:
-            # For unsupported files, attempt text extraction as fallback
-            try:
-                text_content = content.decode("utf-8", errors="ignore")
-            except Exception:
-                raise Exception(f"Unsupported file format: {file_extension}")
+            text_content = decode_text(upload.read())
+
+        if cacheable:
+            await extraction_cache.put(cache_key, {"text": text_content, "image_data": image_base64, "page_offsets": page_offsets})
         
-        return text_content, is_image, image_base64
+        return text_content, is_image, image_base64, page_offsets
                 
     except Exception as e:
         logger.error(f"Error processing document: {str(e)}")
         raise HTTPException(status_code=400, detail=f"Cannot process this document: {str(e)}")
+    finally:
+        upload.close()
 
 def get_language_name(language_code):
     """Convert language code to full name for better prompts"""
@@ -266,198 +393,212 @@ def get_language_name(language_code):
     }
     return language_map.get(language_code.lower(), "English")
 
-def is_meaningful_query(query):
+def fits_full_context(documents):
+    """Whether the documents go into the prompt in full (the context then does not depend on the query)"""
+    return sum(len(doc.get("content", "")) for doc in documents) <= FULL_CONTEXT_CHARS
+
+async def build_document_context(query, documents):
     """
-    Check if the query is meaningful and not just gibberish or very short unclear text
+    Build the document text placed in the system prompt.
+    Small document sets are included in full; larger ones are reduced to the
+    top-k retrieved chunks, each labelled with its filename and page.
+    Returns (context_heading, consolidated_content).
     """
-    query = query.strip().lower()
-    
-    # Check if query is too short and doesn't contain meaningful words
-    if len(query) <= 2:
-        return False
-    
-    # List of common gibberish patterns or very unclear single words
-    gibberish_patterns = [
-        'otay', 'emjgr', 'thik', 'hmm', 'uhh', 'umm', 'err', 'ahh', 'ohh',
-        'xyz', 'abc', 'qwe', 'asd', 'zxc', 'dfg', 'hjk', 'vbn', 'mnb',
-        'test', 'testing', '123', 'hello', 'hi', 'hey'
+    if fits_full_context(documents):
+        # Canonical order keeps the prompt prefix identical whatever order the client sent
+        consolidated_content = "".join(
+            f"\n\n=== {doc.get('filename', f'Document {i}')} ===\n{doc.get('content', '')}"
+            for i, doc in enumerate(canonical_documents(documents), 1)
+        )
+        return "Available Documents:", consolidated_content
+
+    with stage("retrieval"):
+        chunks = await retrieve_chunks(query, documents, client=openai_client)
+    chunks.sort(key=lambda chunk: (chunk["filename"], chunk["position"]))
+    consolidated_content = "".join(
+        f"\n\n=== {format_chunk_citation(chunk)} ===\n{chunk['text']}" for chunk in chunks
+    )
+    return "Relevant Document Excerpts (the passages most relevant to the question):", consolidated_content
+
+async def build_document_messages(query, documents, chat_history, model="gpt-4o-mini", language="english", context=None):
+    """
+    Build the chat messages for a document query; returns (messages, model).
+    `context` is a (heading, content) pair already built by build_document_context.
+    """
+    # Get the full language name for better prompts
+    language_name = get_language_name(language)
+
+    context_heading, consolidated_content = context or await build_document_context(query, documents)
+
+    image_contents = [
+        {
+            "filename": doc.get("filename", f"Document {i}"),
+            "image_data": doc["image_data"]
+        }
+        for i, doc in enumerate(canonical_documents(documents), 1)
+        if doc.get("is_image", False) and doc.get("image_data")
     ]
-    
-    # Check if query is just gibberish
-    if query in gibberish_patterns:
-        return False
-    
-    # Check if query has at least one vowel (basic language structure check)
-    vowels = 'aeiou'
-    if not any(vowel in query for vowel in vowels) and len(query) > 2:
-        # Allow some exceptions for valid consonant-only words
-        valid_consonant_words = ['by', 'my', 'try', 'why', 'sky', 'dry', 'fly', 'cry']
-        if query not in valid_consonant_words:
-            return False
-    
-    # Check for random character sequences (more than 3 consecutive consonants)
-    consonants = 'bcdfghjklmnpqrstvwxyz'
-    consonant_count = 0
-    for char in query:
-        if char in consonants:
-            consonant_count += 1
-            if consonant_count > 3:
-                return False
-        else:
-            consonant_count = 0
-    
-    return True
 
-def get_ai_response_from_documents(query, documents, chat_history=None, model="gpt-4o-mini", language="english"):
+    # Only 'document' responses belong to this conversation
+    messages = assemble_document_messages(
+        query, language_name, context_heading, consolidated_content, image_contents,
+        history_messages(chat_history, "document", model)
+    )
+    return messages, model
+
+def document_response_cache_key(query, documents, chat_history, language):
+    return response_cache_key(document_set_fingerprint(documents), query, language, chat_history)
+
+async def get_ai_response_from_documents(query, documents, chat_history=None, model="gpt-4o-mini", language="english", usage=None, context=None):
     """
-    Function to handle queries across multiple documents
+    Function to handle queries across multiple documents.
+    If a `usage` dict is given it is filled with the token usage of the model call (if one was made).
     """
     try:
         if chat_history is None:
             chat_history = []
         
-        # Check if the query is meaningful
-        if not is_meaningful_query(query):
-            language_name = get_language_name(language)
-            if language_name == "Hindi":
-                return "कृपया अपना प्रश्न स्पष्ट रूप से पूछें। आपका प्रश्न समझ में नहीं आया। कृपया दस्तावेज़ के बारे में कोई स्पष्ट प्रश्न पूछें।"
-            elif language_name == "Arabic":
-                return "يرجى توضيح سؤالك. لم أفهم استفسارك. يرجى طرح سؤال واضح حول الوثيقة."
-            else:
-                return "Please clarify your question. I didn't understand your query. Please ask a clear question about the document(s)."
-        
-        # Get the full language name for better prompts
-        language_name = get_language_name(language)
+        # Acknowledgements, greetings and gibberish are answered without calling the model
+        reply = local_reply(query, language, "documents", chat_history)
+        if reply is not None:
+            return reply
         
-        # Build consolidated document content
-        consolidated_content = ""
-        has_images = False
-        image_contents = []
+        # Repeated questions about the same documents are answered from the cache
+        cache_key = document_response_cache_key(query, documents, chat_history, language)
+        cached_response = response_cache.get(cache_key)
+        if cached_response is not None:
+            return cached_response
         
-        for i, doc in enumerate(documents, 1):
-            filename = doc.get("filename", f"Document {i}")
-            content = doc.get("content", "")
-            is_image = doc.get("is_image", False)
-            image_data = doc.get("image_data")
-            
-            if is_image and image_data:
-                has_images = True
-                image_contents.append({
-                    "filename": filename,
-                    "content": content,
-                    "image_data": image_data
-                })
-            
-            consolidated_content += f"\n\n=== {filename} ===\n{content}"
+        messages, model = await build_document_messages(query, documents, chat_history, model=model, language=language, context=context)
         
-        # Build messages array
-        messages = []
-        
-        if has_images:
-            # Use vision model for handling images
-            model = "gpt-4o-mini"
-            
-            system_prompt = f"""You are a multi-document analysis assistant. You can analyze both text documents and images. Your job is to answer questions based STRICTLY on the provided documents.
-
-CRITICAL RULES:
-1. RESPOND ONLY IN {language_name.upper()} - This is mandatory regardless of what language appears in the documents
-2. ONLY use information from the provided documents (text and images)
-3. When referencing information, mention which document it comes from
-4. If the documents don't contain the requested information, clearly state: "The documents do not contain information about [topic]" (translate this message to {language_name})
-5. For image content, only describe what you can directly observe
-6. Never provide general knowledge or information from outside the documents
-7. Always respond in {language_name}
-8. If a query is unclear, vague, or doesn't make sense in the context of the documents, ask for clarification in {language_name}
-9. Do NOT provide previous responses or generic answers for unclear queries
-
-Available Documents:
-{consolidated_content}
-
-Remember: Answer ONLY from the provided documents and ALWAYS respond in {language_name}. If the query is unclear or not related to the document content, ask for a clearer question."""
-
-            messages.append({"role": "system", "content": system_prompt})
-            
-            # Filter chat history to only include 'document' responses
-            for chat in chat_history:
-                if "user" in chat and "document" in chat:
-                    messages.append({"role": "user", "content": chat["user"]})
-                    messages.append({"role": "assistant", "content": chat["document"]})
-            
-            # Add the current query with images
-            user_content = [{"type": "text", "text": f"Please respond in {language_name}. {query}"}]
-            
-            # Add images to the message
-            for img in image_contents:
-                user_content.append({
-                    "type": "image_url",
-                    "image_url": {
-                        "url": f"data:image/jpeg;base64,{img['image_data']}"
-                    }
-                })
-            
-            messages.append({"role": "user", "content": user_content})
-            
-        else:
-            # Text-only documents
-            system_prompt = f"""You are a multi-document analysis assistant. Your ONLY job is to answer questions based STRICTLY on the provided documents.
-
-CRITICAL RULES:
-1. RESPOND ONLY IN {language_name.upper()} - This is mandatory regardless of what language the documents are written in
-2. ONLY use information from the provided documents
-3. When referencing information, mention which document it comes from (e.g., "According to [filename]...")
-4. If the documents don't contain the requested information, clearly state: "The documents do not contain information about [topic]" (translate this message to {language_name})
-5. Never provide general knowledge or information from outside the documents
-6. Always quote or reference specific parts of the documents when answering
-7. Always respond in {language_name}
-8. If a query is unclear, vague, or doesn't make sense in the context of the documents, ask for clarification in {language_name}
-9. Do NOT provide previous responses or generic answers for unclear queries
-10. If the user's question seems to be gibberish or completely unrelated to the document content, politely ask them to rephrase their question
-
-Available Documents:
-{consolidated_content}
-
-Remember: Answer ONLY from these documents and ALWAYS respond in {language_name}. If information is not in any document, say so clearly in {language_name}. If the query is unclear or seems meaningless, ask for clarification."""
-
-            messages.append({"role": "system", "content": system_prompt})
-            
-            # Filter chat history to only include 'document' responses
-            for chat in chat_history:
-                if "user" in chat and "document" in chat:
-                    messages.append({"role": "user", "content": chat["user"]})
-                    messages.append({"role": "assistant", "content": chat["document"]})
-            
-            # Add the current query with language instruction
-            messages.append({"role": "user", "content": f"Please respond in {language_name}. {query}"})
-        
-        response = openai_client.chat.completions.create(model=model, messages=messages, max_tokens=2000)
-        return response.choices[0].message.content
+        async with stage_semaphore("chat"):
+            with stage("chat"):
+                response = await gateway.call(model, openai_client.chat.completions.create, model=model, messages=messages, max_tokens=2000)
+        if usage is not None and response.usage:
+            usage.update(response.usage.model_dump(exclude_none=True))
+        ai_response = response.choices[0].message.content
+        response_cache.put(cache_key, ai_response)
+        return ai_response
         
     except APIError as e:
         logger.error(f"API Error: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
 
+async def stream_ai_response_from_documents(query, documents, chat_history=None, model="gpt-4o-mini", language="english", usage=None):
+    """
+    Streaming variant of get_ai_response_from_documents
+    """
+    if chat_history is None:
+        chat_history = []
+    reply = local_reply(query, language, "documents", chat_history)
+    if reply is not None:
+        yield reply
+        return
+    cache_key = document_response_cache_key(query, documents, chat_history, language)
+    cached_response = response_cache.get(cache_key)
+    if cached_response is not None:
+        yield cached_response
+        return
+    messages, model = await build_document_messages(query, documents, chat_history, model=model, language=language)
+    parts = []
+    async for delta in stream_chat_completion(messages, model=model, usage=usage, max_tokens=2000):
+        parts.append(delta)
+        yield delta
+    response_cache.put(cache_key, "".join(parts))
+
+async def single_delta(text):
+    yield text
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def sse_response(deltas, usage, language):
+    """
+    Relay text deltas as Server-Sent Events: a "delta" event per chunk, then a final
+    "done" event with the full response, token usage and timing (or an "error" event)
+    """
+    async def events():
+        started = time.perf_counter()
+        first_delta_at = None
+        parts = []
+        try:
+            async for delta in deltas:
+                if first_delta_at is None:
+                    first_delta_at = time.perf_counter()
+                parts.append(delta)
+                yield sse_event("delta", {"delta": delta})
+        except Exception as e:
+            logger.error(f"Error while streaming response: {str(e)}")
+            yield sse_event("error", {"detail": str(e)})
+            return
+        finished = time.perf_counter()
+        yield sse_event("done", {
+            "response": "".join(parts),
+            "language": language,
+            "usage": usage or None,
+            "timing": {
+                "first_delta_ms": round((first_delta_at - started) * 1000, 1) if first_delta_at else None,
+                "total_ms": round((finished - started) * 1000, 1)
+            }
+        })
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def load_session(session_id):
+    session = await session_store.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired session ID. Please start a new session.")
+    return session
+
+async def resolve_chat_history(session_id, chat_history):
+    """The server-side history when a session is given, otherwise the history sent by the client"""
+    if session_id:
+        return (await load_session(session_id))["chat_history"]
+    return chat_history
+
+async def record_turn(session_id, user_text, response_field, response_text):
+    if session_id:
+        await session_store.append_turn(session_id, user_text, response_field, response_text)
+
+async def recorded_deltas(deltas, session_id, user_text, response_field):
+    """Relay deltas and append the completed turn to the session once the stream finishes"""
+    parts = []
+    async for delta in deltas:
+        parts.append(delta)
+        yield delta
+    await record_turn(session_id, user_text, response_field, "".join(parts))
+
 from fastapi import Form
 
-# List of generic acknowledgments and unclear expressions
-GENERIC_ACKS = [
-    'ok', 'okay', 'thank you', 'thanks', 'thx', 'k', 'kk', 'cool', 'great', 'nice', 'alright', 'sure', 'fine', 'noted', 'got it', 'roger', 'yup', 'yes', 'ya', 'yaar', 'acha', 'shukriya', 'dhanyavad', 'done', 'welcome', 'no', 'bye', 'see you', 'see ya', 'goodbye', 'good bye', 'ciao', 'tata', 'tc', 'take care', 'hmm', 'uhh', 'umm', 'err', 'ahh', 'ohh'
-]
+@app.post("/sessions")
+async def create_session_endpoint():
+    return {"session_id": await session_store.create()}
+
+@app.get("/sessions/{session_id}")
+async def get_session_endpoint(session_id: str):
+    return await load_session(session_id)
 
-def is_generic_ack(text):
-    normalized = text.strip().lower()
-    return any(normalized == ack or normalized.startswith(ack + ' ') for ack in GENERIC_ACKS)
+@app.delete("/sessions/{session_id}")
+async def delete_session_endpoint(session_id: str):
+    await session_store.delete(session_id)
+    return {"success": True}
 
 @app.post("/transcribe")
 async def transcribe_endpoint(
     file: UploadFile = File(...),
     language: str = Form("english")  # default English
 ):
-    print("Using OpenAI API for transcription")
     try:
-        text, detected_language = await transcribe_audio(file, language)
+        text, detected_language, speech = await transcribe_audio(file, language)
         if not text.strip():
             raise HTTPException(status_code=400, detail="Transcription is empty")
-        return {"transcription": text, "language": detected_language}
+        return {"transcription": text, "language": detected_language, "speech": speech}
+    except HTTPException:
+        raise
     except APIError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
@@ -472,9 +613,24 @@ async def generate_response_endpoint(request: PromptRequest):
         
         # Force AI to respond in the chosen language
         language_instruction = f"Respond ONLY in {request.language}. Do not switch languages."
-        ai_text = get_ai_response(f"{language_instruction}\n{request.prompt}", request.chat_history)
+        prompt = f"{language_instruction}\n{request.prompt}"
+
+        chat_history = await resolve_chat_history(request.session_id, request.chat_history)
+        # Thanks, greetings and gibberish are answered without calling the model
+        reply = local_reply(request.prompt, request.language, "chat", chat_history)
+
+        if request.stream:
+            usage = {}
+            deltas = single_delta(reply) if reply is not None else stream_ai_response(prompt, chat_history, usage=usage)
+            deltas = recorded_deltas(deltas, request.session_id, request.prompt, "ai")
+            return sse_response(deltas, usage, request.language)
+
+        ai_text = reply if reply is not None else await get_ai_response(prompt, chat_history)
+        await record_turn(request.session_id, request.prompt, "ai", ai_text)
         
         return {"response": ai_text, "language": request.language}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -484,123 +640,797 @@ async def tts_endpoint(request: PromptRequest):
         if not request.prompt.strip():
             raise HTTPException(status_code=422, detail="Text cannot be empty")
 
-        lang_lower = request.language.lower()
-        if lang_lower == "english":
-            language_code = "en"
-        elif lang_lower == "hindi":
-            language_code = "hi"
-        elif lang_lower == "arabic":   # NEW
-            language_code = "ar"
-        else:
-            language_code = "en"
+        audio_format = request.audio_format.lower()
+        if audio_format not in STREAM_MEDIA_TYPES:
+            raise HTTPException(status_code=422, detail=f"Unsupported audio format: {request.audio_format}")
 
-        speech_path = generate_tts(request.prompt, language_code)
-        return FileResponse(speech_path, media_type="audio/wav", filename="response.wav")
+        language_code = get_language_code(request.language)
+        headers = {"Content-Disposition": f'attachment; filename="response.{audio_format}"'}
+        if request.stream:
+            chunks = tts_chunks(request.prompt, language_code, audio_format)
+            # Wait for the first chunk so synthesis errors still get a proper status code
+            first_chunk = await chunks.__anext__()
+
+            async def body():
+                if audio_format == "wav":
+                    yield wav_header()
+                yield first_chunk
+                async for chunk in chunks:
+                    yield chunk
+
+            return StreamingResponse(body(), media_type=STREAM_MEDIA_TYPES[audio_format], headers=headers)
+
+        audio = await generate_tts(request.prompt, language_code, audio_format)
+        return Response(
+            content=audio,
+            media_type=STREAM_MEDIA_TYPES[audio_format],
+            headers=headers
+        )
     except HTTPException as e:
         # keep the original status (avoid turning 400 into 500)
         raise e
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/upload_documents")
-async def upload_documents_endpoint(
-    files: List[UploadFile] = File(...),
-    query: str = Form(""),
-    language: str = Form("english"),
-    chat_history: str = Form("[]")  # JSON string of chat history
-):
+def document_summary(document):
+    """Document metadata returned to clients instead of the full extracted content"""
+    return {
+        "document_id": document["document_id"],
+        "filename": document["filename"],
+        "is_image": document["is_image"],
+        "text_length": document["text_length"],
+        "page_count": len(document.get("page_offsets") or [0])
+    }
+
+async def resolve_documents(request: DocumentRequest, session=None):
+    """
+    Load the documents referenced by ID (or, without IDs, those uploaded in the session),
+    falling back to inline documents for legacy clients
+    """
+    document_ids = request.document_ids
+    if not document_ids and session is not None:
+        document_ids = session["document_ids"]
+    if not document_ids:
+        return request.documents
+    documents = await document_store.get_many(document_ids)
+    missing = [document_id for document_id, document in zip(document_ids, documents) if document is None]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired document IDs: {', '.join(missing)}. Please upload the documents again.")
+    return documents
+
+@app.get("/query_documents/cache_stats")
+async def response_cache_stats_endpoint():
+    return response_cache.stats()
+
+@app.get("/upload_documents/cache_stats")
+async def extraction_cache_stats_endpoint():
+    return extraction_cache.stats()
+
+@app.get("/tts/cache_stats")
+async def tts_cache_stats_endpoint():
+    return tts_cache.stats()
+
+@app.get("/openai/stats")
+async def openai_stats_endpoint():
+    return gateway.stats()
+
+@app.get("/healthz")
+async def liveness_endpoint():
+    """Liveness: the worker's event loop is responding"""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readiness_endpoint():
+    """Readiness: started, not draining, and the document and session stores respond"""
+    status = lifecycle.status()
     try:
-        import json
-        # Parse chat history from string
-        chat_history_parsed = json.loads(chat_history)
+        await document_store.get("readiness")
+        await session_store.get("readiness")
+    except Exception as e:
+        logger.error(f"Readiness check failed: {str(e)}")
+        status = {**status, "ready": False, "detail": str(e)}
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
 
-        processed_documents = []
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus metrics: stage and request histograms, usage counters and cache/gateway stats"""
+    extra = (
+        render_stats("openai_gateway", gateway.stats())
+        + render_stats("tts_cache", tts_cache.stats())
+        + render_stats("response_cache", response_cache.stats())
+        + render_stats("extraction_cache", extraction_cache.stats())
+    )
+    return PlainTextResponse(render(extra), media_type="text/plain; version=0.0.4")
 
-        # Process each document
-        for file in files:
-            logger.info(f"Processing file: {file.filename}, content_type: {file.content_type}")
+async def ingest_document(file: UploadFile, on_progress=None):
+    """
+    Extract, index and store one uploaded file.
+    Returns the stored document, or None if no text could be extracted.
+    """
+    logger.info("Processing file: %s, content_type: %s", file.filename, file.content_type)
 
-            try:
-                # Extract text from document and check if it's an image
-                document_text, is_image, image_base64 = process_document(file)
+    # Extract text from document and check if it's an image
+    document_text, is_image, image_base64, page_offsets = await process_document(file, on_progress)
 
-                if not document_text.strip() and not is_image:
-                    logger.warning(f"Could not extract text from {file.filename}")
-                    continue
+    if not document_text.strip() and not is_image:
+        logger.warning("Could not extract text from %s", file.filename)
+        return None
+
+    document = {
+        "filename": file.filename,
+        "content": document_text,
+        "is_image": is_image,
+        "image_data": image_base64,
+        "page_offsets": page_offsets,
+        "text_length": len(document_text)
+    }
+    document["content_hash"] = document_fingerprint(document)
+    # Chunk and index once at upload so queries only send the relevant passages
+    with stage("index"):
+        chunks = await run_blocking("index", chunk_document, document)
+    with stage("embed"):
+        document["chunks"] = await embed_chunks(openai_client, chunks)
+    document["document_id"] = await document_store.put(document)
 
-                processed_documents.append({
-                    "filename": file.filename,
-                    "content": document_text,
-                    "is_image": is_image,
-                    "image_data": image_base64,
-                    "text_length": len(document_text)
-                })
+    logger.info("Successfully processed %s: %d characters, is_image: %s", file.filename, len(document_text), is_image)
+    return document
 
-                logger.info(f"Successfully processed {file.filename}: {len(document_text)} characters, is_image: {is_image}")
+def start_ingestion(files: List[UploadFile], on_progress=None):
+    """
+    Start processing all uploaded files concurrently (at most UPLOAD_CONCURRENCY at a time).
+    Returns one task per file, in input order; each resolves to (index, document, error)
+    so a failing or slow file never affects the others. error is a {"status_code", "detail"}
+    dict (413/415 for rejected uploads). `on_progress(index, done, total)` is called as
+    the pages of PDFs are extracted.
+    """
+    semaphore = asyncio.Semaphore(UPLOAD_CONCURRENCY)
 
+    async def ingest(index, file):
+        progress = (lambda done, total: on_progress(index, done, total)) if on_progress else None
+        async with semaphore:
+            try:
+                document = await asyncio.wait_for(ingest_document(file, progress), timeout=UPLOAD_FILE_TIMEOUT)
+                if document is None:
+                    return index, None, {"status_code": 400, "detail": "Could not extract text from this document"}
+                return index, document, None
+            except asyncio.TimeoutError:
+                logger.error(f"Timed out processing {file.filename}")
+                return index, None, {"status_code": 400, "detail": f"Processing timed out after {UPLOAD_FILE_TIMEOUT:g} seconds"}
             except Exception as e:
                 logger.error(f"Error processing {file.filename}: {str(e)}")
-                continue
+                if isinstance(e, HTTPException):
+                    return index, None, {"status_code": e.status_code, "detail": e.detail}
+                return index, None, {"status_code": 400, "detail": str(e)}
 
-        if not processed_documents:
-            raise HTTPException(status_code=400, detail="Could not process any of the uploaded documents")
-
-        # If there's a query, get AI response from all documents
-        if query.strip():
-            if is_generic_ack(query):
-                ai_response = "Let me know if you have a question about the document(s)."
-            else:
-                ai_response = get_ai_response_from_documents(
-                    query,
-                    processed_documents,
-                    chat_history_parsed,
-                    language=language
-                )
-            return {
-                "success": True,
-                "documents": processed_documents,
-                "response": ai_response,
-                "language": language,
-                "document_count": len(processed_documents)
-            }
+    return [asyncio.create_task(ingest(index, file)) for index, file in enumerate(files)]
+
+def response_document(document, include_content):
+    # Clients reference documents by ID afterwards, so only metadata is returned by default
+    if include_content:
+        return {key: value for key, value in document.items() if key != "chunks"}
+    return document_summary(document)
+
+async def answer_upload_query(query, processed_documents, chat_history, language):
+    # If there's a query, get AI response from all documents
+    if query.strip():
+        return await get_ai_response_from_documents(
+            query,
+            processed_documents,
+            chat_history,
+            language=language
+        )
+    return f"Successfully processed {len(processed_documents)} document(s). You can ask questions about them now."
+
+async def record_upload(session_id, processed_documents, query, ai_response):
+    """Remember the uploaded documents (and the answer to the query, if any) in the session"""
+    if not session_id:
+        return
+    await session_store.add_documents(session_id, [document["document_id"] for document in processed_documents])
+    if query.strip():
+        await record_turn(session_id, query, "document", ai_response)
+
+async def stream_upload_results(tasks, events, files, query, chat_history, language, include_content, session_id=None):
+    """
+    NDJSON stream for /upload_documents?stream=true: "progress" lines while PDF pages
+    are extracted, one line per file as soon as it finishes, then a final "done"
+    line with the answer to the query (if any). `events` is the queue the
+    ingestion progress callback writes to; finished tasks are added to it too.
+    """
+    for task in tasks:
+        task.add_done_callback(events.put_nowait)
+    results = {}
+    while len(results) < len(tasks):
+        event = await events.get()
+        if not isinstance(event, asyncio.Task):
+            yield json.dumps(event) + "\n"
+            continue
+        index, document, error = event.result()
+        results[index] = document
+        if document is not None:
+            line = {"type": "document", "index": index, "document": response_document(document, include_content)}
         else:
-            # Just return processed documents if no query
-            return {
-                "success": True,
-                "documents": processed_documents,
-                "response": f"Successfully processed {len(processed_documents)} document(s). You can ask questions about them now.",
-                "language": language,
-                "document_count": len(processed_documents)
-            }
+            line = {"type": "error", "index": index, "filename": files[index].filename, **error}
+        yield json.dumps(line) + "\n"
+
+    processed_documents = [results[index] for index in sorted(results) if results[index] is not None]
+    if not processed_documents:
+        yield json.dumps({"type": "done", "success": False, "detail": "Could not process any of the uploaded documents"}) + "\n"
+        return
+    try:
+        ai_response = await answer_upload_query(query, processed_documents, chat_history, language)
+        await record_upload(session_id, processed_documents, query, ai_response)
+    except Exception as e:
+        logger.error(f"Error answering upload query: {str(e)}")
+        yield json.dumps({"type": "done", "success": False, "detail": e.detail if isinstance(e, HTTPException) else str(e)}) + "\n"
+        return
+    yield json.dumps({
+        "type": "done",
+        "success": True,
+        "response": ai_response,
+        "language": language,
+        "document_count": len(processed_documents)
+    }) + "\n"
+
+def all_uploads_failed(failed_documents):
+    """
+    Error response when no file could be processed: the files' own status when they
+    all share it (413 too large, 415 unsupported), else 400, with every file's reason
+    """
+    statuses = {failure["status_code"] for failure in failed_documents}
+    status_code = statuses.pop() if len(statuses) == 1 else 400
+    if len(failed_documents) == 1:
+        detail = failed_documents[0]["detail"]
+    else:
+        reasons = "; ".join(f"{failure['filename']}: {failure['detail']}" for failure in failed_documents)
+        detail = f"Could not process any of the uploaded documents ({reasons})"
+    return JSONResponse(status_code=status_code, content={"detail": detail, "failed_documents": failed_documents})
+
+@app.post("/upload_documents")
+async def upload_documents_endpoint(
+    files: List[UploadFile] = File(...),
+    query: str = Form(""),
+    language: str = Form("english"),
+    chat_history: str = Form("[]"),  # JSON string of chat history
+    session_id: Optional[str] = Form(None),  # Server-side history; replaces chat_history
+    include_content: bool = Form(False),  # Echo extracted text/image data back (legacy clients)
+    stream: bool = Form(False)  # Stream per-document results as NDJSON
+):
+    try:
+        if session_id:
+            chat_history_parsed = await resolve_chat_history(session_id, [])
+        else:
+            # Parse chat history from string
+            chat_history_parsed = json.loads(chat_history)
+
+        # Process all documents concurrently
+        if stream:
+            events = asyncio.Queue()
+            tasks = start_ingestion(files, on_progress=lambda index, done, total: events.put_nowait({
+                "type": "progress", "index": index, "filename": files[index].filename, "pages_done": done, "pages_total": total
+            }))
+            return StreamingResponse(
+                stream_upload_results(tasks, events, files, query, chat_history_parsed, language, include_content, session_id),
+                media_type="application/x-ndjson"
+            )
+
+        tasks = start_ingestion(files)
+        results = await asyncio.gather(*tasks)
+        processed_documents = [document for _, document, _ in results if document is not None]
+        failed_documents = [
+            {"filename": files[index].filename, **error}
+            for index, document, error in results if document is None
+        ]
+
+        if not processed_documents:
+            return all_uploads_failed(failed_documents)
 
+        ai_response = await answer_upload_query(query, processed_documents, chat_history_parsed, language)
+        await record_upload(session_id, processed_documents, query, ai_response)
+        return {
+            "success": True,
+            "documents": [response_document(document, include_content) for document in processed_documents],
+            "failed_documents": failed_documents,
+            "response": ai_response,
+            "language": language,
+            "document_count": len(processed_documents)
+        }
+
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in upload_multiple_documents: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def load_query_documents(request):
+    """(chat_history, documents) for a document query, from the session when one is given"""
+    session = await load_session(request.session_id) if request.session_id else None
+    chat_history = session["chat_history"] if session else request.chat_history
+    documents = await resolve_documents(request, session)
+    if not documents:
+        raise HTTPException(status_code=422, detail="No documents have been uploaded in this session")
+    return chat_history, documents
+
 @app.post("/query_documents")
 async def query_documents_endpoint(request: DocumentRequest):
     try:
-        if not request.query.strip() or not request.documents:
+        if not request.query.strip() or not (request.document_ids or request.documents or request.session_id):
             raise HTTPException(status_code=422, detail="Query and documents cannot be empty")
 
-        if is_generic_ack(request.query):
-            ai_response = "Let me know if you have a question about the document(s)."
-        else:
-            ai_response = get_ai_response_from_documents(
+        chat_history, documents = await load_query_documents(request)
+
+        if request.stream:
+            usage = {}
+            deltas = stream_ai_response_from_documents(
                 request.query,
-                request.documents,
-                request.chat_history,
-                language=request.language
+                documents,
+                chat_history,
+                language=request.language,
+                usage=usage
             )
+            deltas = recorded_deltas(deltas, request.session_id, request.query, "document")
+            return sse_response(deltas, usage, request.language)
+
+        ai_response = await get_ai_response_from_documents(
+            request.query,
+            documents,
+            chat_history,
+            language=request.language
+        )
+        await record_turn(request.session_id, request.query, "document", ai_response)
 
         return {"response": ai_response, "language": request.language}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in query_documents: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def add_usage(total, usage):
+    for key in ("prompt_tokens", "completion_tokens", "total_tokens"):
+        total[key] = total.get(key, 0) + (usage.get(key) or 0)
+
+async def answer_batch_query(query, documents, chat_history, language, context):
+    """One query of a batch; failures are reported in the result instead of failing the batch"""
+    started = time.perf_counter()
+    usage = {}
+    result = {"query": query, "response": None, "error": None, "packed": False}
+    try:
+        if not query.strip():
+            raise HTTPException(status_code=422, detail="Query cannot be empty")
+        result["response"] = await get_ai_response_from_documents(
+            query, documents, chat_history, language=language, usage=usage, context=context
+        )
+    except HTTPException as e:
+        result["error"] = e.detail
+    except Exception as e:
+        logger.error(f"Error answering batch query: {str(e)}")
+        result["error"] = str(e)
+    result["usage"] = usage or None
+    result["timing"] = {"total_ms": round((time.perf_counter() - started) * 1000, 1)}
+    return result
+
+async def answer_packed_queries(queries, documents, chat_history, language, context, model="gpt-4o-mini"):
+    """
+    Answer several questions with one model call over the shared document context.
+    Returns (answers, usage); raises ValueError when the reply is not one answer per question.
+    """
+    numbered = "\n".join(f"{i}. {query}" for i, query in enumerate(queries, 1))
+    prompt = (
+        f"Answer each of the following {len(queries)} questions separately, as if it had been asked on its own. "
+        'Reply with a JSON object {"answers": [...]} holding exactly one answer string per question, in the same order.\n'
+        f"{numbered}"
+    )
+    messages, model = await build_document_messages(prompt, documents, chat_history, model=model, language=language, context=context)
+    try:
+        async with stage_semaphore("chat"):
+            with stage("chat_packed"):
+                response = await gateway.call(
+                    model,
+                    openai_client.chat.completions.create,
+                    model=model,
+                    messages=messages,
+                    max_tokens=min(16000, 1000 * len(queries)),
+                    response_format={"type": "json_object"}
+                )
+    except APIError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        answers = json.loads(response.choices[0].message.content)["answers"]
+    except (TypeError, KeyError, json.JSONDecodeError):
+        answers = None
+    if not isinstance(answers, list) or len(answers) != len(queries) or not all(isinstance(answer, str) for answer in answers):
+        raise ValueError("packed reply does not hold one answer per question")
+    return answers, response.usage.model_dump(exclude_none=True) if response.usage else {}
+
+@app.post("/query_documents/batch")
+async def query_documents_batch_endpoint(request: DocumentBatchRequest):
+    """
+    Answer many questions about one document set. The document context is built
+    once and the questions are answered concurrently (at most `concurrency` model
+    calls at a time), or, with `pack` and documents small enough to be sent in
+    full, several questions per model call. Results come back in query order with
+    their own timing and token usage; one failing query does not fail the batch.
+    Batch answers are not added to the session history.
+    """
+    try:
+        if not request.queries or not (request.document_ids or request.documents or request.session_id):
+            raise HTTPException(status_code=422, detail="Queries and documents cannot be empty")
+        if len(request.queries) > BATCH_MAX_QUERIES:
+            raise HTTPException(status_code=422, detail=f"At most {BATCH_MAX_QUERIES} queries per batch")
+
+        started = time.perf_counter()
+        chat_history, documents = await load_query_documents(request)
+        # With the documents in full, every query shares one context; otherwise each retrieves its own passages
+        context = await build_document_context(None, documents) if fits_full_context(documents) else None
+        context_ms = round((time.perf_counter() - started) * 1000, 1)
+
+        slots = asyncio.Semaphore(max(1, min(request.concurrency or BATCH_CONCURRENCY, BATCH_CONCURRENCY)))
+        results = [None] * len(request.queries)
+
+        async def answer(index):
+            async with slots:
+                results[index] = await answer_batch_query(request.queries[index], documents, chat_history, request.language, context)
+
+        async def answer_packed(indices):
+            async with slots:
+                group_started = time.perf_counter()
+                try:
+                    answers, usage = await answer_packed_queries(
+                        [request.queries[index] for index in indices], documents, chat_history, request.language, context
+                    )
+                except (ValueError, HTTPException) as e:
+                    logger.warning("Packed batch of %d queries failed (%s), answering them one by one", len(indices), e)
+                    answers = None
+            if answers is None:
+                await asyncio.gather(*(answer(index) for index in indices))
+                return
+            timing = {"total_ms": round((time.perf_counter() - group_started) * 1000, 1)}
+            for index, response in zip(indices, answers):
+                cache_key = document_response_cache_key(request.queries[index], documents, chat_history, request.language)
+                response_cache.put(cache_key, response)
+                # Usage and timing are those of the shared call
+                results[index] = {"query": request.queries[index], "response": response, "error": None, "packed": True, "usage": usage, "timing": timing}
+
+        model_indices = list(range(len(request.queries)))
+        tasks = []
+        if request.pack and context is not None:
+            # Cached answers are returned as they are, and trivial or empty queries answered on their own; the rest are packed
+            model_indices = []
+            for index, query in enumerate(request.queries):
+                if not query.strip() or classify(query) != QUERY:
+                    tasks.append(answer(index))
+                elif (cached := response_cache.get(document_response_cache_key(query, documents, chat_history, request.language))) is not None:
+                    results[index] = {"query": query, "response": cached, "error": None, "packed": False, "usage": None, "timing": {"total_ms": 0.0}}
+                else:
+                    model_indices.append(index)
+            groups = [model_indices[i:i + BATCH_PACK_SIZE] for i in range(0, len(model_indices), BATCH_PACK_SIZE)]
+            tasks.extend(answer_packed(group) if len(group) > 1 else answer(group[0]) for group in groups)
+        else:
+            tasks.extend(answer(index) for index in model_indices)
+        await asyncio.gather(*tasks)
+
+        usage = {}
+        counted_packs = set()
+        for result in results:
+            if result["usage"] and not (result["packed"] and id(result["usage"]) in counted_packs):
+                add_usage(usage, result["usage"])
+                if result["packed"]:
+                    counted_packs.add(id(result["usage"]))
+        return {
+            "results": results,
+            "language": request.language,
+            "document_count": len(documents),
+            "usage": usage or None,
+            "timing": {"context_ms": context_ms, "total_ms": round((time.perf_counter() - started) * 1000, 1)}
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error in query_documents_batch: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def voice_chat_history(websocket, options):
+    """History for a voice socket (from the session, if given); None after reporting an unknown session"""
+    session_id = options.get("session_id")
+    if not session_id:
+        return options.get("chat_history", [])
+    session = await session_store.get(session_id)
+    if session is None:
+        await websocket.send_json({"type": "error", "detail": "Unknown or expired session ID. Please start a new session."})
+        return None
+    return session["chat_history"]
+
+# Audio of the fixed local replies (a few dozen clips at most), kept for the life of the process
+local_reply_audio_cache = {}
+
+async def local_reply_audio(text, language_code, audio_format):
+    key = (text, language_code, audio_format)
+    if key not in local_reply_audio_cache:
+        local_reply_audio_cache[key] = await synthesize_speech(text, language_code, audio_format)
+    return local_reply_audio_cache[key]
+
+def send_lock(websocket):
+    """
+    Per-socket lock for frames sent from concurrent tasks (text deltas, partial
+    transcripts): an audio header and its binary frame must arrive back to back.
+    """
+    lock = getattr(websocket.state, "send_lock", None)
+    if lock is None:
+        lock = websocket.state.send_lock = asyncio.Lock()
+    return lock
+
+async def send_audio(websocket, header, audio):
+    async with send_lock(websocket):
+        await websocket.send_json(header)
+        await websocket.send_bytes(audio)
+
+async def stream_voice_response(websocket, text, language, chat_history, audio_format):
+    """
+    Response stage of the voice sockets: relay text deltas and synthesize each sentence
+    as soon as it is complete, sending the audio in order. Returns the full response.
+    """
+    language_code = get_language_code(language)
+    reply = local_reply(text, language, "chat", chat_history)
+    if reply is not None:
+        # Trivial turn: fixed reply, with audio synthesized once per process
+        await websocket.send_json({"type": "text_delta", "delta": reply})
+        audio = await local_reply_audio(reply, language_code, audio_format)
+        await send_audio(websocket, {"type": "audio", "index": 0, "text": reply, "format": audio_format}, audio)
+        return reply
+
+    language_instruction = f"Respond ONLY in {language}. Do not switch languages."
+    parts = []
+
+    async def sentences():
+        buffer = ""
+        async for delta in stream_ai_response(f"{language_instruction}\n{text}", chat_history):
+            parts.append(delta)
+            # Runs concurrently with the audio sends below
+            async with send_lock(websocket):
+                await websocket.send_json({"type": "text_delta", "delta": delta})
+            complete, buffer = split_sentences(buffer + delta)
+            for sentence in complete:
+                yield sentence
+        if buffer.strip():
+            yield buffer.strip()
+
+    # Sentences are synthesized as soon as they are complete; audio is sent in order
+    synthesize = lambda sentence: synthesize_speech(sentence, language_code, audio_format)
+    index = 0
+    async for sentence, audio_chunk in synthesize_in_order(sentences(), synthesize):
+        await send_audio(websocket, {"type": "audio", "index": index, "text": sentence, "format": audio_format}, audio_chunk)
+        index += 1
+    full_text = "".join(parts)
+    return full_text
+
+@app.websocket("/voice_turn")
+async def voice_turn_endpoint(websocket: WebSocket):
+    """
+    Single round-trip voice pipeline: audio in, text deltas and audio chunks out.
+
+    Protocol:
+      client -> {"language": "english", "session_id": ..., "audio_format": "wav"}  (optional text frame;
+                "chat_history": [...] may be sent instead of a session_id)
+      client -> <binary frame with the recorded audio>
+      server -> {"type": "transcription", "text": ..., "language": ..., "speech": {...VAD stats}}
+      server -> {"type": "text_delta", "delta": ...}  (repeated)
+      server -> {"type": "audio", "index": n, "text": ..., "format": ...} followed by a binary frame
+      server -> {"type": "done", "response": ..., "timing": {stage: ms}} or {"type": "error", "detail": ...}
+    """
+    if lifecycle.draining:
+        # Shutting down: the client reconnects to another worker
+        await websocket.close(code=1013)
+        return
+    await websocket.accept()
+    try:
+        options = {}
+        message = await websocket.receive()
+        if message.get("text") is not None:
+            options = json.loads(message["text"])
+            message = await websocket.receive()
+        audio = message.get("bytes")
+        if not audio:
+            await websocket.send_json({"type": "error", "detail": "Expected a binary audio frame"})
+            return
+
+        language = options.get("language", "english")
+        session_id = options.get("session_id")
+        # Check the session before spending a transcription on the audio
+        chat_history = await voice_chat_history(websocket, options)
+        if chat_history is None:
+            return
+        audio_format = options.get("audio_format", "wav")
+
+        try:
+            text, detected_language, speech = await transcribe_audio_bytes(audio, language)
+        except HTTPException as e:
+            await websocket.send_json({"type": "error", "detail": e.detail})
+            return
+        if not text.strip():
+            await websocket.send_json({"type": "error", "detail": "Transcription is empty"})
+            return
+        await websocket.send_json({"type": "transcription", "text": text, "language": detected_language, "speech": speech})
+
+        full_text = await stream_voice_response(websocket, text, language, chat_history, audio_format)
+
+        await record_turn(session_id, text, "ai", full_text)
+        await websocket.send_json({"type": "done", "response": full_text, "timing": current_trace().timings_ms()})
+    except WebSocketDisconnect:
+        logger.info("Client disconnected from voice_turn")
+    except Exception as e:
+        logger.error(f"Error in voice_turn: {str(e)}")
+        try:
+            await websocket.send_json({"type": "error", "detail": str(e)})
+        except Exception:
+            pass
+
+
+@app.websocket("/voice_stream")
+async def voice_stream_endpoint(websocket: WebSocket):
+    """
+    Streaming voice pipeline: audio is sent while the user speaks, segmented by
+    endpointing and transcribed segment by segment, so transcription overlaps
+    with speaking. Each finished utterance goes straight to the response stage;
+    the socket then accepts the next utterance.
+
+    Protocol:
+      client -> {"language": "english", "session_id": ..., "input_format": "pcm16", "audio_format": "wav"}
+                (first frame; "pcm16" is 16 kHz mono s16le, anything else e.g. "webm" is decoded with ffmpeg)
+      client -> <binary audio frames as they are captured>
+      client -> {"type": "end"}  (optional: force the end of the utterance, e.g. push-to-talk release;
+                                   ignored if a pause has already ended it)
+      server -> {"type": "partial", "index": n, "text": ...}  (per closed segment; "text" is the transcript so far)
+      server -> {"type": "final", "text": ..., "language": ...}
+      server -> text_delta / audio / done events as in /voice_turn, or {"type": "error", "detail": ...}
+    """
+    if lifecycle.draining:
+        # Shutting down: the client reconnects to another worker
+        await websocket.close(code=1013)
+        return
+    await websocket.accept()
+    decoder = None
+    receiver = None
+    drain_watcher = None
+    try:
+        options = await websocket.receive_json()
+        language = options.get("language", "english")
+        session_id = options.get("session_id")
+        input_format = options.get("input_format", "pcm16")
+        audio_format = options.get("audio_format", "wav")
+        chat_history = await voice_chat_history(websocket, options)
+        if chat_history is None:
+            return
+        chat_history = list(chat_history)
+
+        endpointer = StreamingEndpointer()
+        events = asyncio.Queue()
+
+        async def receive_audio():
+            nonlocal decoder
+            try:
+                while True:
+                    # A fresh decoder per utterance: recorders restart the container on each recording
+                    decoder = StreamingDecoder(input_format)
+                    await decoder.start()
+                    pump = asyncio.create_task(pump_pcm(decoder))
+                    try:
+                        while True:
+                            message = await websocket.receive()
+                            if message["type"] == "websocket.disconnect":
+                                await events.put(("closed", None))
+                                return
+                            if message.get("bytes"):
+                                await decoder.write(message["bytes"])
+                            elif message.get("text") and json.loads(message["text"]).get("type") == "end":
+                                break
+                        # Flush whatever the decoder still holds, then end the utterance
+                        await decoder.close()
+                        await pump
+                        for event in endpointer.flush():
+                            await events.put(event)
+                    finally:
+                        pump.cancel()
+                        await decoder.aclose()
+            except Exception as e:
+                await events.put(("error", str(e)))
+
+        async def pump_pcm(stream):
+            while True:
+                pcm = await stream.read()
+                if not pcm:
+                    return
+                for event in endpointer.feed(pcm):
+                    await events.put(event)
+
+        async def watch_drain():
+            await lifecycle.wait_for_drain()
+            await events.put(("draining", None))
+
+        receiver = asyncio.create_task(receive_audio())
+        drain_watcher = asyncio.create_task(watch_drain())
+        segments = []
+        trace = current_trace()
+
+        async def transcribe_segment(index, pcm, previous):
+            # Segments are transcribed in order, each prompted with the text before it
+            prompt = await previous if previous else None
+            with stage("encode"):
+                audio_bytes, audio_filename = await encode_for_upload(pcm)
+            text, _ = await whisper_transcribe(audio_bytes, audio_filename, language, prompt=prompt)
+            transcript = " ".join(part for part in (prompt, text.strip()) if part)
+            async with send_lock(websocket):
+                await websocket.send_json({"type": "partial", "index": index, "text": transcript})
+            return transcript
+
+        async def respond(transcript):
+            try:
+                text = await transcript
+            except Exception as e:
+                logger.error(f"Error transcribing voice_stream segment: {str(e)}")
+                await websocket.send_json({"type": "error", "detail": str(e)})
+                return
+            if not text.strip():
+                await websocket.send_json({"type": "error", "detail": "Transcription is empty"})
+                return
+            await websocket.send_json({"type": "final", "text": text, "language": language})
+            full_text = await stream_voice_response(websocket, text, language, chat_history, audio_format)
+            chat_history.append({"user": text, "ai": full_text})
+            await record_turn(session_id, text, "ai", full_text)
+            await websocket.send_json({"type": "done", "response": full_text, "timing": trace.timings_ms()})
+
+        while True:
+            kind, pcm = await events.get()
+            if kind == "closed":
+                break
+            if kind == "error":
+                await websocket.send_json({"type": "error", "detail": pcm})
+                break
+            if kind == "draining":
+                if segments or endpointer.in_utterance:
+                    # The user is speaking: answer this utterance first (the socket is closed after it)
+                    continue
+                # Idle: let the client reconnect to another worker now
+                await websocket.close(code=1001)
+                break
+            if kind == "segment":
+                previous = segments[-1] if segments else None
+                segments.append(asyncio.create_task(transcribe_segment(len(segments), pcm, previous)))
+                continue
+
+            # End of utterance
+            if not segments:
+                await websocket.send_json({"type": "error", "detail": "No speech detected in the recording"})
+                continue
+            pending, segments = segments, []
+            try:
+                await respond(pending[-1])
+            finally:
+                # Stage timings are per utterance; the trace ID stays the socket's
+                trace = start_trace(trace.trace_id)
+            if lifecycle.draining:
+                # Finish the current utterance, then let the client move to another worker
+                await websocket.close(code=1012)
+                break
+    except WebSocketDisconnect:
+        logger.info("Client disconnected from voice_stream")
+    except Exception as e:
+        logger.error(f"Error in voice_stream: {str(e)}")
+        try:
+            await websocket.send_json({"type": "error", "detail": str(e)})
+        except Exception:
+            pass
+    finally:
+        if receiver is not None:
+            receiver.cancel()
+        if drain_watcher is not None:
+            drain_watcher.cancel()
+        if decoder is not None:
+            await decoder.aclose()
+
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8001)
+    import serve
+    serve.main()
 
 
 
@@ -0,0 +1,162 @@
+import os
+import io
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Pillow and pytesseract are imported on first use (see extractors.py)
+
+# Bump when preprocessing or Tesseract settings change so cached results are not reused
+OCR_VERSION = "3"
+
+# Tesseract is most accurate around 300 DPI; for unknown scans we normalize the pixel size instead
+OCR_MIN_SIDE = int(os.getenv("OCR_MIN_SIDE", "1000"))
+OCR_MAX_SIDE = int(os.getenv("OCR_MAX_SIDE", "2500"))
+OCR_CACHE_SIZE = int(os.getenv("OCR_CACHE_SIZE", "256"))
+
+# Single uniform block of text (screenshots, receipts, photos of a paragraph).
+# pytesseract shlex-splits the config, so the whitelist must not contain quotes or spaces.
+BLOCK_CONFIG = r'--oem 3 --psm 6 -c tessedit_char_whitelist=0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz!@#$%^&*()_+-=[]{}|;:,.<>?/~`'
+# Fully automatic page segmentation (scanned pages with columns, headings, tables)
+PAGE_CONFIG = r'--oem 3 --psm 3'
+
+
+def normalize_size(image):
+    """Scale the image so its longest side is within [OCR_MIN_SIDE, OCR_MAX_SIDE]"""
+    from PIL import Image
+
+    longest = max(image.size)
+    if longest > OCR_MAX_SIDE:
+        scale = OCR_MAX_SIDE / longest
+    elif longest < OCR_MIN_SIDE:
+        scale = OCR_MIN_SIDE / longest
+    else:
+        return image
+    size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    # reducing_gap lets Pillow shrink by whole factors first, which is much faster for 12 MP photos
+    return image.resize(size, Image.LANCZOS, reducing_gap=3.0)
+
+
+def otsu_threshold(histogram):
+    """Pick the global threshold that best separates a 256-bin grayscale histogram"""
+    total = sum(histogram)
+    weighted_total = sum(i * count for i, count in enumerate(histogram))
+    background_weight = 0
+    background_sum = 0
+    best_threshold = 127
+    best_variance = 0.0
+    for threshold, count in enumerate(histogram):
+        background_weight += count
+        if background_weight == 0:
+            continue
+        foreground_weight = total - background_weight
+        if foreground_weight == 0:
+            break
+        background_sum += threshold * count
+        background_mean = background_sum / background_weight
+        foreground_mean = (weighted_total - background_sum) / foreground_weight
+        variance = background_weight * foreground_weight * (background_mean - foreground_mean) ** 2
+        if variance > best_variance:
+            best_variance = variance
+            best_threshold = threshold
+    return best_threshold
+
+
+def preprocess(image):
+    """Downscale or upscale, grayscale, stretch contrast and binarize an image for OCR"""
+    from PIL import ImageOps
+
+    image = ImageOps.exif_transpose(image)
+    # Grayscale first so resizing works on one channel instead of three
+    image = normalize_size(image.convert("L"))
+    image = ImageOps.autocontrast(image)
+    threshold = otsu_threshold(image.histogram())
+    return image.point(lambda value: 255 if value > threshold else 0, mode="1")
+
+
+def choose_config(image):
+    """
+    Pick the page segmentation mode up front instead of always running both:
+    large portrait images look like scanned pages, everything else like a text block.
+    """
+    width, height = image.size
+    if height >= width and max(width, height) >= OCR_MIN_SIDE * 1.5:
+        return PAGE_CONFIG, BLOCK_CONFIG
+    return BLOCK_CONFIG, PAGE_CONFIG
+
+
+def image_hash(file_content):
+    return hashlib.sha256(file_content).hexdigest()
+
+
+class OCRCache:
+    """Thread-safe LRU of OCR results keyed by image hash (OCR runs on worker threads)"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, text):
+        with self._lock:
+            self._entries[key] = text
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+        }
+
+
+ocr_cache = OCRCache(OCR_CACHE_SIZE)
+
+
+def ocr_image(file_content, image=None):
+    """
+    Run Tesseract on image bytes and return the stripped text ('' if nothing was found).
+    Results are cached by image hash; pass an already decoded `image` to avoid decoding twice.
+    """
+    from PIL import Image
+    import pytesseract
+
+    key = f"{OCR_VERSION}:{image_hash(file_content)}"
+    cached = ocr_cache.get(key)
+    if cached is not None:
+        return cached
+
+    if image is None:
+        image = Image.open(io.BytesIO(file_content))
+    prepared = preprocess(image)
+
+    primary, fallback = choose_config(prepared)
+    try:
+        extracted_text = pytesseract.image_to_string(prepared, config=primary).strip()
+    except Exception as e:
+        logger.warning("OCR with %r failed, retrying with %r: %s", primary, fallback, e)
+        extracted_text = ""
+    if not extracted_text:
+        # Only fall back to the other segmentation mode when the first one found nothing (or failed)
+        extracted_text = pytesseract.image_to_string(prepared, config=fallback).strip()
+
+    ocr_cache.put(key, extracted_text)
+    return extracted_text
@@ -0,0 +1,98 @@
+"""
+Message assembly for document queries.
+
+Messages are laid out so that everything that does not depend on the
+question or the response language comes first and is byte-identical
+between calls: the instructions, then the documents in a canonical order,
+then the document images, then the chat history. The per-language rules
+and the question come last. This keeps the provider-side prompt prefix
+cache warm across questions, languages and turns of the same session.
+"""
+import hashlib
+
+TEXT_DOCUMENT_INSTRUCTIONS = """You are a multi-document analysis assistant. Your ONLY job is to answer questions based STRICTLY on the provided documents.
+
+CRITICAL RULES:
+1. RESPOND ONLY IN THE RESPONSE LANGUAGE given in the final instructions - This is mandatory regardless of what language the documents are written in
+2. ONLY use information from the provided documents
+3. When referencing information, mention which document it comes from (e.g., "According to [filename], page [n]...")
+4. If the documents don't contain the requested information, clearly state: "The documents do not contain information about [topic]" (translated to the response language)
+5. Never provide general knowledge or information from outside the documents
+6. Always quote or reference specific parts of the documents when answering
+7. Always respond in the response language
+8. If a query is unclear, vague, or doesn't make sense in the context of the documents, ask for clarification in the response language
+9. Do NOT provide previous responses or generic answers for unclear queries
+10. If the user's question seems to be gibberish or completely unrelated to the document content, politely ask them to rephrase their question"""
+
+IMAGE_DOCUMENT_INSTRUCTIONS = """You are a multi-document analysis assistant. You can analyze both text documents and images. Your job is to answer questions based STRICTLY on the provided documents.
+
+CRITICAL RULES:
+1. RESPOND ONLY IN THE RESPONSE LANGUAGE given in the final instructions - This is mandatory regardless of what language appears in the documents
+2. ONLY use information from the provided documents (text and images)
+3. When referencing information, mention which document (and page, where given) it comes from
+4. If the documents don't contain the requested information, clearly state: "The documents do not contain information about [topic]" (translated to the response language)
+5. For image content, only describe what you can directly observe
+6. Never provide general knowledge or information from outside the documents
+7. Always respond in the response language
+8. If a query is unclear, vague, or doesn't make sense in the context of the documents, ask for clarification in the response language
+9. Do NOT provide previous responses or generic answers for unclear queries"""
+
+
+def language_instructions(language_name, has_images):
+    """The language-specific rules, sent after the documents and history"""
+    if has_images:
+        reminder = "If the query is unclear or not related to the document content, ask for a clearer question."
+    else:
+        reminder = f"If information is not in any document, say so clearly in {language_name}. If the query is unclear or seems meaningless, ask for clarification."
+    return (
+        f"RESPONSE LANGUAGE: {language_name}. RESPOND ONLY IN {language_name.upper()}.\n"
+        f"Remember: Answer ONLY from the provided documents and ALWAYS respond in {language_name}. {reminder}"
+    )
+
+
+def document_fingerprint(document):
+    """Content hash of a document (precomputed at upload, derived on the fly for inline documents)"""
+    fingerprint = document.get("content_hash")
+    if fingerprint:
+        return fingerprint
+    digest = hashlib.sha256(document.get("content", "").encode("utf-8"))
+    if document.get("image_data"):
+        digest.update(document["image_data"].encode("utf-8"))
+    return digest.hexdigest()
+
+
+def document_set_fingerprint(documents):
+    """Order-independent hash of a set of documents"""
+    digest = hashlib.sha256()
+    for fingerprint in sorted(document_fingerprint(document) for document in documents):
+        digest.update(fingerprint.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def canonical_documents(documents):
+    """Documents in a stable order, independent of upload or request order"""
+    return sorted(documents, key=lambda document: (document.get("filename", ""), document_fingerprint(document)))
+
+
+def assemble_document_messages(query, language_name, context_heading, consolidated_content, image_contents, history):
+    """Build the prefix-stable message list for a document query; `history` is a list of chat messages"""
+    instructions = IMAGE_DOCUMENT_INSTRUCTIONS if image_contents else TEXT_DOCUMENT_INSTRUCTIONS
+    messages = [{"role": "system", "content": f"{instructions}\n\n{context_heading}\n{consolidated_content}"}]
+
+    if image_contents:
+        image_message = [{"type": "text", "text": "Document images:"}]
+        for img in image_contents:
+            image_message.append({"type": "text", "text": f"=== {img['filename']} ==="})
+            image_message.append({
+                "type": "image_url",
+                "image_url": {
+                    "url": f"data:image/jpeg;base64,{img['image_data']}"
+                }
+            })
+        messages.append({"role": "user", "content": image_message})
+
+    messages.extend(history)
+
+    messages.append({"role": "system", "content": language_instructions(language_name, bool(image_contents))})
+    messages.append({"role": "user", "content": f"Please respond in {language_name}. {query}"})
+    return messages
@@ -0,0 +1,82 @@
+import os
+import re
+import time
+import json
+import hashlib
+from collections import OrderedDict
+
+# Number of trailing chat turns that are part of the key (older turns rarely change the answer)
+HISTORY_TAIL_TURNS = int(os.getenv("RESPONSE_CACHE_HISTORY_TURNS", "2"))
+
+_PUNCTUATION_RE = re.compile(r"[\s?!.,;:।؟،]+")
+
+
+def normalize_query(query):
+    """Case-fold and collapse whitespace/punctuation so trivially different phrasings share a key"""
+    return _PUNCTUATION_RE.sub(" ", query.casefold()).strip()
+
+
+def response_cache_key(document_set_hash, query, language, chat_history, history_field="document"):
+    turns = [[chat["user"], chat[history_field]] for chat in chat_history if "user" in chat and history_field in chat]
+    tail = turns[-HISTORY_TAIL_TURNS:] if HISTORY_TAIL_TURNS > 0 else []
+    payload = json.dumps([document_set_hash, normalize_query(query), language.lower(), tail], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Exact-match cache of model answers with TTL expiry and LRU eviction.
+    A max_entries of 0 disables caching.
+    """
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+
+    def get(self, key):
+        if not self.max_entries:
+            return None
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, response = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            self.expired += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return response
+
+    def put(self, key, response):
+        if not self.max_entries:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, response)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "expired": self.expired,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+        }
+
+
+response_cache = ResponseCache(
+    max_entries=int(os.getenv("RESPONSE_CACHE_SIZE", "512")),
+    ttl=int(os.getenv("RESPONSE_CACHE_TTL", "3600")),
+)
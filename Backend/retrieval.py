@@ -0,0 +1,170 @@
+import os
+import re
+import math
+import bisect
+import logging
+from collections import Counter
+
+from gateway import gateway
+
+logger = logging.getLogger(__name__)
+
+CHUNK_CHARS = int(os.getenv("RAG_CHUNK_CHARS", "1200"))
+CHUNK_OVERLAP = int(os.getenv("RAG_CHUNK_OVERLAP", "200"))
+TOP_K = int(os.getenv("RAG_TOP_K", "8"))
+# Below this many characters across all documents the full text is sent instead of chunks
+FULL_CONTEXT_CHARS = int(os.getenv("RAG_FULL_CONTEXT_CHARS", "8000"))
+EMBEDDINGS_MODEL = os.getenv("RAG_EMBEDDINGS_MODEL")  # e.g. text-embedding-3-small; unset = BM25 only
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# \w alone splits Devanagari and Arabic words at their combining marks
+TOKEN_RE = re.compile(r"[\w\u0900-\u097F\u0600-\u06FF]+")
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+def split_into_chunks(text):
+    """
+    Split text into overlapping windows of about CHUNK_CHARS characters,
+    preferring to break at paragraph, sentence or word boundaries.
+    Returns a list of (start_offset, chunk_text).
+    """
+    chunks = []
+    start = 0
+    length = len(text)
+    while start < length:
+        end = min(start + CHUNK_CHARS, length)
+        if end < length:
+            window = text[start:end]
+            for separator in ("\n\n", "\n", ". ", "। ", " "):
+                cut = window.rfind(separator)
+                if cut > CHUNK_CHARS // 2:
+                    end = start + cut + len(separator)
+                    break
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append((start, chunk))
+        if end >= length:
+            break
+        start = max(end - CHUNK_OVERLAP, start + 1)
+    return chunks
+
+
+def chunk_document(document):
+    """Chunk a processed document and precompute the term frequencies used by BM25"""
+    content = document.get("content", "")
+    page_offsets = document.get("page_offsets") or [0]
+    chunks = []
+    for start, text in split_into_chunks(content):
+        tokens = tokenize(text)
+        chunks.append({
+            "text": text,
+            "page": bisect.bisect_right(page_offsets, start),
+            "length": len(tokens),
+            "tf": dict(Counter(tokens)),
+        })
+    return chunks
+
+
+def bm25_rank(query, chunks):
+    """Return (score, chunk) pairs for the chunks, highest score first"""
+    query_terms = set(tokenize(query))
+    if not chunks or not query_terms:
+        return []
+    average_length = sum(chunk["length"] for chunk in chunks) / len(chunks) or 1
+    document_frequency = Counter()
+    for chunk in chunks:
+        for term in query_terms:
+            if term in chunk["tf"]:
+                document_frequency[term] += 1
+    scored = []
+    for chunk in chunks:
+        score = 0.0
+        for term in query_terms:
+            tf = chunk["tf"].get(term)
+            if not tf:
+                continue
+            idf = math.log(1 + (len(chunks) - document_frequency[term] + 0.5) / (document_frequency[term] + 0.5))
+            norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * chunk["length"] / average_length)
+            score += idf * tf * (BM25_K1 + 1) / norm
+        scored.append((score, chunk))
+    scored.sort(key=lambda pair: pair[0], reverse=True)
+    return scored
+
+
+def cosine_similarity(a, b):
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+def reciprocal_rank_fusion(*rankings, k=60):
+    """Merge several rankings of the same chunks (lists of chunk indexes)"""
+    scores = Counter()
+    for ranking in rankings:
+        for rank, index in enumerate(ranking):
+            scores[index] += 1.0 / (k + rank + 1)
+    return [index for index, _ in scores.most_common()]
+
+
+async def embed_texts(client, texts):
+    response = await gateway.call(EMBEDDINGS_MODEL, client.embeddings.create, model=EMBEDDINGS_MODEL, input=texts)
+    return [item.embedding for item in response.data]
+
+
+async def embed_chunks(client, chunks):
+    """Attach embeddings to chunks when RAG_EMBEDDINGS_MODEL is configured"""
+    if not EMBEDDINGS_MODEL or not chunks:
+        return chunks
+    embeddings = await embed_texts(client, [chunk["text"] for chunk in chunks])
+    for chunk, embedding in zip(chunks, embeddings):
+        chunk["embedding"] = embedding
+    return chunks
+
+
+async def retrieve_chunks(query, documents, top_k=TOP_K, client=None):
+    """
+    Pick the top-k chunks across all documents for the query.
+    Each returned chunk carries the filename and page it came from.
+    """
+    candidates = []
+    for i, doc in enumerate(documents, 1):
+        chunks = doc.get("chunks")
+        if chunks is None:
+            # Inline documents from legacy clients are chunked on the fly
+            chunks = chunk_document(doc)
+        filename = doc.get("filename", f"Document {i}")
+        is_paged = len(doc.get("page_offsets") or [0]) > 1
+        for position, chunk in enumerate(chunks):
+            candidates.append({**chunk, "filename": filename, "is_paged": is_paged, "position": position})
+
+    ranked = bm25_rank(query, candidates)
+    index_of = {id(chunk): index for index, chunk in enumerate(candidates)}
+    order = [index_of[id(chunk)] for score, chunk in ranked if score > 0]
+
+    if EMBEDDINGS_MODEL and client is not None and all("embedding" in chunk for chunk in candidates):
+        try:
+            query_embedding = (await embed_texts(client, [query]))[0]
+            by_similarity = sorted(
+                range(len(candidates)),
+                key=lambda index: cosine_similarity(query_embedding, candidates[index]["embedding"]),
+                reverse=True,
+            )
+            order = reciprocal_rank_fusion(order, by_similarity[:top_k * 4])
+        except Exception as e:
+            logger.warning("Embedding retrieval failed, using BM25 only: %s", e)
+
+    if not order:
+        # No lexical overlap (e.g. "summarize this"): fall back to the opening chunks of every document
+        order = sorted(range(len(candidates)), key=lambda index: candidates[index]["position"])
+    return [candidates[index] for index in order[:top_k]]
+
+
+def format_chunk_citation(chunk):
+    if chunk.get("is_paged"):
+        return f"{chunk['filename']}, page {chunk['page']}"
+    return chunk["filename"]
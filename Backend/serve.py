@@ -0,0 +1,91 @@
+"""
+Production entry point.
+
+    cd Backend && python serve.py --workers 4
+    cd Backend && WEB_CONCURRENCY=4 PORT=8001 python serve.py
+
+Runs uvicorn with WEB_CONCURRENCY worker processes. Workers share nothing in
+memory, so with more than one worker (or with SHARED_STATE_DIR set) documents
+and sessions default to SQLite databases, and the extraction and TTS caches to
+a database and a directory, under SHARED_STATE_DIR; explicitly configured
+stores are left alone. For several nodes, point those settings at storage all
+nodes share (DOCUMENT_STORE=directory works on a shared volume). The provider
+rate limits are split evenly between the workers (see gateway.py).
+
+Probes: GET /healthz (liveness) and GET /readyz (readiness). On SIGTERM every
+worker drains first (see lifecycle.py), then uvicorn waits up to
+GRACEFUL_SHUTDOWN_SECONDS for the remaining connections.
+"""
+import os
+import logging
+import argparse
+
+import uvicorn
+from dotenv import load_dotenv
+
+logger = logging.getLogger("serve")
+
+
+def shared_state_defaults(state_dir):
+    """Default the stores and caches to files under state_dir (workers inherit the environment)"""
+    os.makedirs(state_dir, exist_ok=True)
+    defaults = {
+        "DOCUMENT_STORE": "sqlite",
+        "DOCUMENT_STORE_PATH": os.path.join(state_dir, "documents.sqlite3"),
+        "SESSION_STORE": "sqlite",
+        "SESSION_STORE_PATH": os.path.join(state_dir, "sessions.sqlite3"),
+        "EXTRACTION_CACHE_PATH": os.path.join(state_dir, "extractions.sqlite3"),
+        "TTS_CACHE_DIR": os.path.join(state_dir, "tts_cache"),
+    }
+    applied = {name: value for name, value in defaults.items() if not os.getenv(name)}
+    # A configured store keeps its own path setting
+    for store in ("DOCUMENT_STORE", "SESSION_STORE"):
+        if store not in applied:
+            applied.pop(f"{store}_PATH", None)
+    os.environ.update(applied)
+    return applied
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8001")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "1")))
+    parser.add_argument("--state-dir", default=os.getenv("SHARED_STATE_DIR"), help="directory for shared stores and caches")
+    parser.add_argument(
+        "--graceful-shutdown", type=float, default=float(os.getenv("GRACEFUL_SHUTDOWN_SECONDS", "30")),
+        help="seconds uvicorn waits for open connections after the drain",
+    )
+    parser.add_argument(
+        "--limit-concurrency", type=int, default=int(os.getenv("LIMIT_CONCURRENCY", "0")) or None,
+        help="per-worker connection limit beyond which requests get a 503",
+    )
+    parser.add_argument("--log-level", default=os.getenv("LOG_LEVEL", "info").lower())
+    return parser.parse_args()
+
+
+def main():
+    load_dotenv()
+    args = parse_args()
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s %(levelname)s %(name)s %(message)s")
+    # Workers read their share of the provider rate limits from this
+    os.environ["WEB_CONCURRENCY"] = str(args.workers)
+    if args.workers > 1 or args.state_dir:
+        applied = shared_state_defaults(args.state_dir or "state")
+        if applied:
+            logger.info("Shared state: %s", ", ".join(f"{name}={value}" for name, value in sorted(applied.items())))
+    uvicorn.run(
+        "main:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        timeout_graceful_shutdown=args.graceful_shutdown,
+        limit_concurrency=args.limit_concurrency,
+        proxy_headers=True,
+        forwarded_allow_ips=os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1"),
+        log_level=args.log_level,
+    )
+
+
+if __name__ == "__main__":
+    main()
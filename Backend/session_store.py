@@ -0,0 +1,225 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+
+from history import drop_oldest_turns
+
+logger = logging.getLogger(__name__)
+
+# Per-session bounds so one long conversation cannot grow without limit. Dropped turns
+# leave their hash on the first remaining turn, so history compaction keeps using the
+# summary that covers them (see history.drop_oldest_turns)
+SESSION_MAX_TURNS = int(os.getenv("SESSION_MAX_TURNS", "100"))
+SESSION_MAX_CHARS = int(os.getenv("SESSION_MAX_CHARS", "200000"))
+SESSION_MAX_DOCUMENTS = int(os.getenv("SESSION_MAX_DOCUMENTS", "50"))
+
+
+def new_session_id():
+    return uuid.uuid4().hex
+
+
+def new_session(session_id):
+    return {"session_id": session_id, "chat_history": [], "document_ids": []}
+
+
+def trim_session(session):
+    """Drop the oldest turns and documents beyond the per-session limits"""
+    history = session["chat_history"]
+    drop = max(0, len(history) - SESSION_MAX_TURNS)
+    total_chars = sum(len(value) for turn in history[drop:] for value in turn.values())
+    while drop < len(history) - 1 and total_chars > SESSION_MAX_CHARS:
+        total_chars -= sum(len(value) for value in history[drop].values())
+        drop += 1
+    drop_oldest_turns(history, drop)
+    document_ids = session["document_ids"]
+    if len(document_ids) > SESSION_MAX_DOCUMENTS:
+        del document_ids[:len(document_ids) - SESSION_MAX_DOCUMENTS]
+    return session
+
+
+class SessionStore:
+    """
+    Server-side conversation state, keyed by session ID.
+
+    A session holds the chat history (the same {"user": ..., "ai"/"document": ...}
+    turns clients used to send) and the IDs of the documents uploaded in it.
+    Sessions expire `ttl` seconds after they were last used. Subclasses implement
+    the synchronous `_create`/`_get`/`_update`/`_delete`/`_evict_expired`; `_update`
+    applies a read-modify-write atomically, so concurrent turns (or several
+    workers sharing a SQLite file) never lose an append.
+    """
+
+    blocking = False
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+
+    async def _call(self, func, *args):
+        if self.blocking:
+            return await asyncio.to_thread(func, *args)
+        return func(*args)
+
+    async def create(self):
+        session_id = new_session_id()
+        await self._call(self._create, session_id, time.time() + self.ttl)
+        return session_id
+
+    async def get(self, session_id):
+        """Return the session (a copy), or None if it is unknown or expired"""
+        return await self._call(self._get, session_id, time.time())
+
+    async def append_turn(self, session_id, user_text, response_field, response_text):
+        def append(session):
+            session["chat_history"].append({"user": user_text, response_field: response_text})
+        return await self._call(self._update, session_id, append, time.time())
+
+    async def add_documents(self, session_id, document_ids):
+        def add(session):
+            known = session["document_ids"]
+            known.extend(document_id for document_id in dict.fromkeys(document_ids) if document_id not in known)
+        return await self._call(self._update, session_id, add, time.time())
+
+    async def delete(self, session_id):
+        await self._call(self._delete, session_id)
+
+    async def evict_expired(self):
+        return await self._call(self._evict_expired, time.time())
+
+
+class MemorySessionStore(SessionStore):
+    def __init__(self, ttl, max_sessions=10000):
+        super().__init__(ttl)
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+
+    def _create(self, session_id, expires_at):
+        self._sessions[session_id] = (expires_at, new_session(session_id))
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+
+    def _live(self, session_id, now):
+        entry = self._sessions.get(session_id)
+        if entry is None:
+            return None
+        expires_at, session = entry
+        if expires_at < now:
+            del self._sessions[session_id]
+            return None
+        self._sessions[session_id] = (now + self.ttl, session)
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def _get(self, session_id, now):
+        session = self._live(session_id, now)
+        if session is None:
+            return None
+        return {**session, "chat_history": list(session["chat_history"]), "document_ids": list(session["document_ids"])}
+
+    def _update(self, session_id, func, now):
+        session = self._live(session_id, now)
+        if session is None:
+            return False
+        func(session)
+        trim_session(session)
+        return True
+
+    def _delete(self, session_id):
+        self._sessions.pop(session_id, None)
+
+    def _evict_expired(self, now):
+        expired = [key for key, (expires_at, _) in self._sessions.items() if expires_at < now]
+        for key in expired:
+            del self._sessions[key]
+        return len(expired)
+
+
+class SQLiteSessionStore(SessionStore):
+    """Sessions in a SQLite file, so several uvicorn workers can share them"""
+
+    blocking = True
+
+    def __init__(self, ttl, path):
+        super().__init__(ttl)
+        self.path = path
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "session_id TEXT PRIMARY KEY, expires_at REAL NOT NULL, body TEXT NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS sessions_expires_at ON sessions (expires_at)")
+
+    def _connection(self):
+        # sqlite3 connections may not be shared across threads; keep one per worker thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _create(self, session_id, expires_at):
+        self._connection().execute(
+            "INSERT INTO sessions (session_id, expires_at, body) VALUES (?, ?, ?)",
+            (session_id, expires_at, json.dumps(new_session(session_id))),
+        )
+
+    def _get(self, session_id, now):
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT body FROM sessions WHERE session_id = ? AND expires_at >= ?", (session_id, now)
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute("UPDATE sessions SET expires_at = ? WHERE session_id = ?", (now + self.ttl, session_id))
+        return json.loads(row[0])
+
+    def _update(self, session_id, func, now):
+        conn = self._connection()
+        # Take the write lock before reading so concurrent appends from other workers serialize
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT body FROM sessions WHERE session_id = ? AND expires_at >= ?", (session_id, now)
+            ).fetchone()
+            if row is None:
+                conn.execute("ROLLBACK")
+                return False
+            session = json.loads(row[0])
+            func(session)
+            trim_session(session)
+            conn.execute(
+                "UPDATE sessions SET expires_at = ?, body = ? WHERE session_id = ?",
+                (now + self.ttl, json.dumps(session), session_id),
+            )
+            conn.execute("COMMIT")
+            return True
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _delete(self, session_id):
+        self._connection().execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def _evict_expired(self, now):
+        return self._connection().execute("DELETE FROM sessions WHERE expires_at < ?", (now,)).rowcount
+
+
+def create_session_store():
+    """Build the store selected by SESSION_STORE (memory or sqlite)"""
+    backend = os.getenv("SESSION_STORE", "memory").lower()
+    ttl = int(os.getenv("SESSION_TTL_SECONDS", str(2 * 3600)))
+    if backend == "sqlite":
+        return SQLiteSessionStore(ttl, os.getenv("SESSION_STORE_PATH", "sessions.sqlite3"))
+    if backend != "memory":
+        logger.warning("Unknown SESSION_STORE %r, falling back to memory", backend)
+    return MemorySessionStore(ttl, int(os.getenv("SESSION_STORE_MAX_SESSIONS", "10000")))
+
+
+session_store = create_session_store()
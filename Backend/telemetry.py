@@ -0,0 +1,285 @@
+"""
+Request tracing, stage timing and metrics.
+
+Every HTTP request and WebSocket gets a trace ID (taken from an incoming W3C
+`traceparent` or `X-Request-ID` header, or generated), which is added to its
+log records and returned in the `X-Trace-Id` header. `stage(name)` times one
+pipeline stage (decode, whisper, chat, tts, pdf, ocr, ...) into the
+`stage_seconds` histogram and into the current trace, whose breakdown is sent
+back as `Server-Timing` and logged for slow requests. Counters track API
+tokens, audio seconds and document bytes. `render()` produces the Prometheus
+text format served on /metrics. When opentelemetry is installed, stages are
+also recorded as spans.
+"""
+import os
+import time
+import uuid
+import bisect
+import random
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager, nullcontext
+
+try:
+    from opentelemetry import trace as otel_trace
+except ImportError:  # optional
+    otel_trace = None
+
+logger = logging.getLogger(__name__)
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# HTTP client libraries log one INFO line per provider request
+LIBRARY_LOG_LEVEL = os.getenv("LIBRARY_LOG_LEVEL", "WARNING").upper()
+LIBRARY_LOGGERS = ("httpx", "httpx2", "httpcore", "httpcore2", "openai", "multipart", "PIL")
+# Fraction of traces whose INFO/DEBUG records are written; warnings and errors always are
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "1.0"))
+# Requests slower than this are logged with their per-stage breakdown
+SLOW_REQUEST_SECONDS = float(os.getenv("SLOW_REQUEST_SECONDS", "5"))
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_tracer = otel_trace.get_tracer(__name__) if otel_trace is not None else None
+REGISTRY = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, amount=1.0, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(labels.get(name, "") for name in self.labelnames), 0.0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            lines.append(f"{self.name}{_labels(self.labelnames, key)} {value:g}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._values = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            if index < len(self.buckets):
+                state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            values = sorted((key, list(state)) for key, state in self._values.items())
+        for key, state in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                le = 'le="%g"' % bound
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {state[-1]}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {state[-2]:g}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {state[-1]}")
+        return lines
+
+
+REQUEST_SECONDS = Histogram("http_request_duration_seconds", "HTTP request duration (until the response body is complete)", ("method", "route", "status"))
+STAGE_SECONDS = Histogram("stage_seconds", "Duration of pipeline stages", ("stage",))
+OPENAI_CALL_SECONDS = Histogram("openai_call_seconds", "OpenAI API call duration, retries included", ("model", "outcome"))
+OPENAI_TOKENS = Counter("openai_tokens_total", "Tokens reported by the OpenAI API", ("model", "kind"))
+AUDIO_SECONDS = Counter("audio_seconds_total", "Seconds of audio received from clients and uploaded to Whisper", ("kind",))
+TTS_CHARACTERS = Counter("tts_characters_total", "Characters sent to speech synthesis (cache misses only)")
+DOCUMENT_BYTES = Counter("document_bytes_total", "Bytes of uploaded documents", ("type",))
+LOCAL_REPLIES = Counter("local_replies_total", "Turns answered by the local intent gate without calling the model", ("intent",))
+
+
+def record_usage(model, usage):
+    """Count tokens from an SDK usage object or a usage dict"""
+    if usage is None:
+        return
+    for kind in ("prompt_tokens", "completion_tokens"):
+        tokens = usage.get(kind) if isinstance(usage, dict) else getattr(usage, kind, None)
+        if isinstance(tokens, (int, float)) and tokens:
+            OPENAI_TOKENS.inc(tokens, model=model, kind=kind.split("_")[0])
+
+
+def render_stats(prefix, stats):
+    """Expose a component's stats() dict as gauges (nested dicts become a "key" label)"""
+    lines = []
+    for name, value in stats.items():
+        metric = f"{prefix}_{name}"
+        if isinstance(value, dict):
+            lines.append(f"# TYPE {metric} gauge")
+            for key, item in sorted(value.items()):
+                if isinstance(item, str):
+                    lines.append(f'{metric}{{key="{_escape(key)}",value="{_escape(item)}"}} 1')
+                elif isinstance(item, (int, float)):
+                    lines.append(f'{metric}{{key="{_escape(key)}"}} {item:g}')
+        elif isinstance(value, (int, float)):
+            lines.append(f"# TYPE {metric} gauge")
+            lines.append(f"{metric} {value:g}")
+    return lines
+
+
+def render(extra_lines=()):
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    lines.extend(extra_lines)
+    return "\n".join(lines) + "\n"
+
+
+class Trace:
+    """Per-request (or per voice turn) trace ID and stage breakdown"""
+
+    def __init__(self, trace_id=None):
+        self.trace_id = trace_id or uuid.uuid4().hex
+        self.started = time.perf_counter()
+        self.stages = {}  # stage -> [total seconds, calls]; concurrent calls add up
+        self.sampled = LOG_SAMPLE_RATE >= 1.0 or random.random() < LOG_SAMPLE_RATE
+
+    def add(self, stage, seconds):
+        entry = self.stages.setdefault(stage, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+
+    def timings_ms(self):
+        return {stage: round(total * 1000, 1) for stage, (total, _) in self.stages.items()}
+
+    def server_timing(self):
+        return ", ".join(f"{stage};dur={total * 1000:.1f}" for stage, (total, _) in self.stages.items())
+
+
+_current_trace = contextvars.ContextVar("trace", default=None)
+
+
+def start_trace(trace_id=None):
+    trace = Trace(trace_id)
+    _current_trace.set(trace)
+    return trace
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+def record_stage(name, seconds):
+    STAGE_SECONDS.observe(seconds, stage=name)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(name, seconds)
+
+
+@contextmanager
+def stage(name):
+    """Time a pipeline stage; usable around sync code and awaits alike"""
+    span = _tracer.start_as_current_span(name) if _tracer is not None else nullcontext()
+    start = time.perf_counter()
+    with span:
+        try:
+            yield
+        finally:
+            record_stage(name, time.perf_counter() - start)
+
+
+def incoming_trace_id(headers):
+    """Trace ID from a W3C traceparent or X-Request-ID header (raw ASGI headers)"""
+    for name, value in headers:
+        if name == b"traceparent":
+            parts = value.decode("latin-1").split("-")
+            if len(parts) >= 4 and len(parts[1]) == 32:
+                return parts[1]
+        elif name == b"x-request-id" and value:
+            return value.decode("latin-1")[:64]
+    return None
+
+
+class TelemetryMiddleware:
+    """ASGI middleware: starts the trace, adds trace headers and records request durations"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            return await self.app(scope, receive, send)
+        trace = start_trace(incoming_trace_id(scope.get("headers", [])))
+        if scope["type"] == "websocket":
+            return await self.app(scope, receive, send)
+
+        status = 500
+
+        async def send_with_headers(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"x-trace-id", trace.trace_id.encode("latin-1")))
+                timing = trace.server_timing()
+                if timing:
+                    headers.append((b"server-timing", timing.encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_headers)
+        finally:
+            seconds = time.perf_counter() - trace.started
+            route = getattr(scope.get("route"), "path", "unmatched")
+            REQUEST_SECONDS.observe(seconds, method=scope["method"], route=route, status=str(status))
+            if seconds >= SLOW_REQUEST_SECONDS:
+                logger.warning("Slow request %s %s: %.2fs, stages (ms): %s", scope["method"], route, seconds, trace.timings_ms())
+
+
+class TraceLogFilter(logging.Filter):
+    """Adds the trace ID to log records and drops INFO/DEBUG records of unsampled traces"""
+
+    def filter(self, record):
+        trace = _current_trace.get()
+        record.trace_id = trace.trace_id if trace is not None else "-"
+        return trace is None or trace.sampled or record.levelno >= logging.WARNING
+
+
+def configure_logging():
+    # force: replace handlers an entry point (e.g. serve.py) may have installed before importing the app
+    logging.basicConfig(level=LOG_LEVEL, format="%(asctime)s %(levelname)s %(name)s [%(trace_id)s] %(message)s", force=True)
+    for handler in logging.getLogger().handlers:
+        handler.addFilter(TraceLogFilter())
+    for name in LIBRARY_LOGGERS:
+        logging.getLogger(name).setLevel(LIBRARY_LOG_LEVEL)
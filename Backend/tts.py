@@ -0,0 +1,138 @@
+import os
+import re
+import struct
+import asyncio
+
+# Maximum number of chunks of one answer being synthesized at the same time
+TTS_PARALLELISM = int(os.getenv("TTS_PARALLELISM", "4"))
+# Chunks shorter than this take on the following sentence (except the first chunk,
+# which stays short so the first audio arrives quickly)
+TTS_CHUNK_MIN_CHARS = int(os.getenv("TTS_CHUNK_MIN_CHARS", "60"))
+# The speech endpoint accepts at most 4096 characters per request
+TTS_CHUNK_MAX_CHARS = int(os.getenv("TTS_CHUNK_MAX_CHARS", "1000"))
+
+# Sentence terminators: Latin, Devanagari danda/double danda, Arabic question mark and Urdu full stop
+SENTENCE_END_RE = re.compile(r'(?<=[.!?।॥؟۔])\s+')
+# Fallback split points for overlong sentences: commas (Latin and Arabic), semicolons, then spaces
+CLAUSE_END_RE = re.compile(r'(?<=[,;:،؛])\s+')
+
+# Formats whose chunks can be concatenated into one playable stream
+# ("wav" is streamed as PCM behind a single WAV header)
+STREAM_MEDIA_TYPES = {
+    "mp3": "audio/mpeg",
+    "opus": "audio/ogg",
+    "aac": "audio/aac",
+    "pcm": "audio/pcm",
+    "wav": "audio/wav",
+}
+PCM_SAMPLE_RATE = 24000  # raw "pcm" from the speech endpoint: 24 kHz mono 16-bit little-endian
+
+
+def split_sentences(buffer):
+    """
+    Split buffered text into (complete_sentences, remainder).
+    The remainder is the trailing text that has not been terminated yet.
+    """
+    parts = SENTENCE_END_RE.split(buffer)
+    return [p.strip() for p in parts[:-1] if p.strip()], parts[-1]
+
+
+def split_long(sentence, max_chars):
+    """Break a sentence longer than max_chars at clause boundaries, then at spaces"""
+    if len(sentence) <= max_chars:
+        return [sentence]
+    pieces = []
+    for clause in CLAUSE_END_RE.split(sentence):
+        while len(clause) > max_chars:
+            cut = clause.rfind(" ", 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            pieces.append(clause[:cut].strip())
+            clause = clause[cut:].strip()
+        if pieces and len(pieces[-1]) + len(clause) + 1 <= max_chars:
+            pieces[-1] = f"{pieces[-1]} {clause}"
+        elif clause:
+            pieces.append(clause)
+    return pieces
+
+
+def chunk_text(text, min_chars=TTS_CHUNK_MIN_CHARS, max_chars=TTS_CHUNK_MAX_CHARS):
+    """Split a complete answer into synthesis chunks at sentence boundaries"""
+    sentences, remainder = split_sentences(text.strip())
+    if remainder.strip():
+        sentences.append(remainder.strip())
+    chunks = []
+    for sentence in sentences:
+        for piece in split_long(sentence, max_chars):
+            # Top up chunks that are still short, except the first one
+            if len(chunks) > 1 and len(chunks[-1]) < min_chars and len(chunks[-1]) + len(piece) + 1 <= max_chars:
+                chunks[-1] = f"{chunks[-1]} {piece}"
+            else:
+                chunks.append(piece)
+    return chunks
+
+
+async def _iterate(chunks):
+    if hasattr(chunks, "__aiter__"):
+        async for chunk in chunks:
+            yield chunk
+    else:
+        for chunk in chunks:
+            yield chunk
+
+
+async def synthesize_in_order(chunks, synthesize, parallelism=None):
+    """
+    Synthesize text chunks concurrently and yield (text, audio) in input order.
+
+    `chunks` may be a list or an async iterable (e.g. sentences cut from a
+    streaming chat completion); synthesis of a chunk starts as soon as it is
+    available, with at most `parallelism` (default TTS_PARALLELISM) chunks in flight.
+    """
+    slots = asyncio.Semaphore(parallelism or TTS_PARALLELISM)
+    queue = asyncio.Queue()
+    failure = []
+
+    async def produce():
+        try:
+            async for text in _iterate(chunks):
+                await slots.acquire()
+                await queue.put((text, asyncio.create_task(synthesize(text))))
+        except Exception as e:
+            failure.append(e)
+        finally:
+            await queue.put(None)
+
+    producer = asyncio.create_task(produce())
+    try:
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            text, task = item
+            try:
+                audio = await task
+            finally:
+                slots.release()
+            yield text, audio
+        if failure:
+            raise failure[0]
+    finally:
+        producer.cancel()
+        # Drop any synthesis still in flight (client went away or a chunk failed)
+        while not queue.empty():
+            item = queue.get_nowait()
+            if item is not None:
+                item[1].cancel()
+
+
+def wav_header(data_size=0xFFFFFFFF - 36, sample_rate=PCM_SAMPLE_RATE):
+    """
+    WAV header for mono 16-bit PCM. The default size marks a stream of unknown
+    length, which players accept for progressive playback.
+    """
+    byte_rate = sample_rate * 2
+    return (
+        b"RIFF" + struct.pack("<I", min(0xFFFFFFFF, data_size + 36)) + b"WAVE"
+        + b"fmt " + struct.pack("<IHHIIHH", 16, 1, 1, sample_rate, byte_rate, 2, 16)
+        + b"data" + struct.pack("<I", data_size)
+    )
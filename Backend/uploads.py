@@ -0,0 +1,258 @@
+"""
+Bounded upload ingestion.
+
+Uploads are read in chunks and never as a whole: the type is sniffed from the
+first bytes (the filename only matters for non-UTF-8 text), each type has its
+own size limit (a 413 as soon as it is exceeded, before the rest is read), and
+files above UPLOAD_SPOOL_BYTES are copied to a temp file so extractors get a
+path instead of a copy of the body. UploadLimitMiddleware caps whole request bodies before
+they are parsed.
+"""
+import os
+import hashlib
+import logging
+import tempfile
+
+from fastapi import HTTPException
+
+from executor import run_blocking
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+UPLOAD_CHUNK_BYTES = 256 * 1024
+# Uploads up to this size are kept in memory; larger ones are spooled to UPLOAD_SPOOL_DIR
+UPLOAD_SPOOL_BYTES = int(os.getenv("UPLOAD_SPOOL_BYTES", str(2 * MB)))
+UPLOAD_SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR") or None
+UPLOAD_MAX_REQUEST_BYTES = int(os.getenv("UPLOAD_MAX_REQUEST_MB", "200")) * MB
+
+IMAGE_TYPES = {"png", "jpeg", "bmp", "tiff", "webp"}
+# Extensions that declare a file as text, so non-UTF-8 text (latin-1, cp1252, UTF-16) is accepted too
+TEXT_EXTENSIONS = {
+    "txt", "text", "csv", "tsv", "md", "markdown", "rst", "json", "jsonl", "log", "xml", "html", "htm",
+    "yaml", "yml", "ini", "cfg", "conf", "srt", "vtt", "tex", "rtf", "sql",
+    "py", "js", "ts", "java", "c", "h", "cpp", "cs", "go", "rb", "php", "sh",
+}
+TEXT_BOMS = (b"\xef\xbb\xbf", b"\xff\xfe", b"\xfe\xff")
+AUDIO_TYPES = {"wav", "mp3", "ogg", "flac", "webm", "m4a"}
+DOCUMENT_UPLOAD_TYPES = {"pdf", "docx", "doc", "txt"} | IMAGE_TYPES
+
+# Per-category limits in MB, overridable with e.g. UPLOAD_LIMIT_MB_PDF=100
+DEFAULT_UPLOAD_LIMITS_MB = {
+    "pdf": 50,
+    "docx": 20,
+    "image": 20,
+    "txt": 10,
+    "audio": 25,  # Whisper's own upload limit
+}
+
+
+def upload_category(file_type):
+    if file_type in IMAGE_TYPES:
+        return "image"
+    if file_type in AUDIO_TYPES or file_type is None:
+        return "audio"
+    if file_type == "doc":
+        return "docx"
+    return file_type
+
+
+def upload_limit(file_type):
+    category = upload_category(file_type)
+    return int(os.getenv(f"UPLOAD_LIMIT_MB_{category.upper()}", DEFAULT_UPLOAD_LIMITS_MB[category])) * MB
+
+
+def looks_like_text(head):
+    if b"\x00" in head:
+        return False
+    try:
+        head.decode("utf-8")
+        return True
+    except UnicodeDecodeError as e:
+        # A multi-byte character cut off at the end of the sniffed bytes is still text
+        # (only when the head is not the whole file)
+        return len(head) >= UPLOAD_CHUNK_BYTES and e.reason == "unexpected end of data"
+
+
+def declared_text(filename):
+    return bool(filename) and filename.rsplit(".", 1)[-1].lower() in TEXT_EXTENSIONS
+
+
+def sniff_type(head, filename=None):
+    """
+    File type from its magic bytes; None if unrecognized. The filename is only
+    used to accept text in single-byte encodings or with a BOM as "txt".
+    """
+    if head.startswith(b"%PDF-"):
+        return "pdf"
+    if head.startswith(b"PK\x03\x04"):
+        return "docx"
+    if head.startswith(b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"):
+        return "doc"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if head.startswith(b"BM"):
+        return "bmp"
+    if head.startswith((b"II*\x00", b"MM\x00*")):
+        return "tiff"
+    if head.startswith(b"RIFF") and head[8:12] == b"WEBP":
+        return "webp"
+    if head.startswith(b"RIFF") and head[8:12] == b"WAVE":
+        return "wav"
+    if head.startswith(b"ID3") or head[:2] in (b"\xff\xfb", b"\xff\xf3", b"\xff\xf2"):
+        return "mp3"
+    if head.startswith(b"OggS"):
+        return "ogg"
+    if head.startswith(b"fLaC"):
+        return "flac"
+    if head.startswith(b"\x1a\x45\xdf\xa3"):
+        return "webm"
+    if head[4:8] == b"ftyp":
+        return "m4a"
+    if head and looks_like_text(head):
+        return "txt"
+    if head and declared_text(filename) and (head.startswith(TEXT_BOMS) or b"\x00" not in head):
+        return "txt"
+    return None
+
+
+class Upload:
+    """A received upload: in memory (`data`) or spooled to a temp file (`path`), with its SHA-256"""
+
+    def __init__(self, filename, file_type, size, sha256, data=None, path=None):
+        self.filename = filename
+        self.file_type = file_type
+        self.size = size
+        self.sha256 = sha256
+        self.data = data
+        self.path = path
+
+    @property
+    def source(self):
+        """What extractors are given: the temp file path, or the bytes if the upload is in memory"""
+        return self.path if self.path is not None else self.data
+
+    def read(self):
+        if self.data is not None:
+            return self.data
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def close(self):
+        if self.path is not None:
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+            self.path = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def too_large(filename, file_type):
+    return HTTPException(
+        status_code=413,
+        detail=f"{filename or 'Upload'} is larger than the {upload_limit(file_type) // MB} MB limit for {upload_category(file_type)} files"
+    )
+
+
+def copy_upload(fileobj, filename, accept, spool_bytes, size_hint):
+    """Read an upload in chunks within its limit; runs on the blocking pool"""
+    head = fileobj.read(UPLOAD_CHUNK_BYTES)
+    file_type = sniff_type(head, filename)
+    if file_type not in accept:
+        raise HTTPException(status_code=415, detail=f"Unsupported file format: {filename or 'upload'}")
+    limit = upload_limit(file_type)
+    if (size_hint or 0) > limit:
+        raise too_large(filename, file_type)
+
+    chunks = [head]
+    size = len(head)
+    digest = hashlib.sha256(head)
+    spool = None
+    try:
+        while chunk := fileobj.read(UPLOAD_CHUNK_BYTES):
+            size += len(chunk)
+            digest.update(chunk)
+            if size > limit:
+                raise too_large(filename, file_type)
+            if spool is None and size > spool_bytes:
+                spool = tempfile.NamedTemporaryFile(prefix="upload-", suffix=f".{file_type}", dir=UPLOAD_SPOOL_DIR, delete=False)
+                spool.writelines(chunks)
+                chunks = None
+            if spool is not None:
+                spool.write(chunk)
+            else:
+                chunks.append(chunk)
+    except BaseException:
+        if spool is not None:
+            spool.close()
+            os.unlink(spool.name)
+        raise
+    if spool is not None:
+        spool.close()
+        return Upload(filename, file_type, size, digest.hexdigest(), path=spool.name)
+    return Upload(filename, file_type, size, digest.hexdigest(), data=b"".join(chunks))
+
+
+async def receive_upload(file, accept=DOCUMENT_UPLOAD_TYPES, spool_bytes=UPLOAD_SPOOL_BYTES):
+    """
+    Read an UploadFile into an Upload, sniffing its type, hashing it and enforcing its size limit.
+    Raises a 415 for types not in `accept` (None accepts unrecognized content) and a 413
+    for oversized files; call close() (or use it as a context manager) when done.
+    """
+    return await run_blocking("upload", copy_upload, file.file, file.filename, accept, spool_bytes, file.size)
+
+
+async def read_upload(file, accept):
+    """Read an upload fully into memory (within its size limit); returns (bytes, file_type)"""
+    upload = await receive_upload(file, accept, spool_bytes=float("inf"))
+    return upload.data, upload.file_type
+
+
+class UploadLimitMiddleware:
+    """ASGI middleware: rejects request bodies over UPLOAD_MAX_REQUEST_BYTES with a 413 before they are parsed"""
+
+    def __init__(self, app, max_bytes=UPLOAD_MAX_REQUEST_BYTES):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        detail = f"Request body is larger than {self.max_bytes // MB} MB"
+        for name, value in scope.get("headers", []):
+            if name == b"content-length" and value.isdigit() and int(value) > self.max_bytes:
+                logger.warning("Rejected %s %s: Content-Length %s", scope["method"], scope["path"], value.decode())
+                await send_413(send, detail)
+                return
+
+        received = 0
+
+        async def limited_receive():
+            # Chunked bodies have no Content-Length; count as they arrive
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+async def send_413(send, detail):
+    body = ('{"detail": "%s"}' % detail).encode()
+    await send({
+        "type": "http.response.start",
+        "status": 413,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
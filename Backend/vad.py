@@ -0,0 +1,211 @@
+import os
+import array
+import math
+import warnings
+from collections import deque
+
+with warnings.catch_warnings():
+    # audioop is deprecated (removed in Python 3.13); it is only used to speed up frame energies
+    warnings.simplefilter("ignore", DeprecationWarning)
+    try:
+        import audioop
+    except ImportError:
+        audioop = None
+
+VAD_ENABLED = os.getenv("VAD_ENABLED", "true").lower() != "false"
+VAD_FRAME_MS = 30
+# A frame is speech when its energy is this many times the clip's noise floor...
+VAD_NOISE_RATIO = float(os.getenv("VAD_NOISE_RATIO", "2.5"))
+# ...and above this absolute RMS (16-bit scale; ~-44 dBFS), so near-digital silence never counts
+VAD_MIN_RMS = int(os.getenv("VAD_MIN_RMS", "200"))
+# Speech kept around each segment so word onsets and tails are not clipped
+VAD_PADDING_MS = int(os.getenv("VAD_PADDING_MS", "200"))
+# Pauses longer than this are shortened to VAD_PADDING_MS on each side
+VAD_MAX_GAP_MS = int(os.getenv("VAD_MAX_GAP_MS", "600"))
+# Bursts shorter than this (clicks, taps) are not speech
+VAD_MIN_SEGMENT_MS = int(os.getenv("VAD_MIN_SEGMENT_MS", "90"))
+# Clips with less speech than this are rejected before any API call
+VAD_MIN_SPEECH_MS = int(os.getenv("VAD_MIN_SPEECH_MS", "250"))
+
+# Streaming endpointing: a pause this long closes a segment (sent for transcription while
+# the user keeps talking), a pause this long ends the utterance
+VAD_SEGMENT_SILENCE_MS = int(os.getenv("VAD_SEGMENT_SILENCE_MS", "400"))
+VAD_END_SILENCE_MS = int(os.getenv("VAD_END_SILENCE_MS", "1000"))
+VAD_MAX_SEGMENT_MS = int(os.getenv("VAD_MAX_SEGMENT_MS", "15000"))
+
+
+def frame_rms(frame):
+    """RMS of a frame of 16-bit samples"""
+    if audioop is not None:
+        return audioop.rms(frame, 2)
+    samples = array.array("h", frame)
+    return math.sqrt(sum(sample * sample for sample in samples) / len(samples)) if samples else 0
+
+
+def speech_segments(energies):
+    """Return (start, end) frame ranges whose energy stands out from the clip's noise floor"""
+    if not energies:
+        return []
+    # The quietest tenth of the clip approximates the background noise
+    noise_floor = sorted(energies)[len(energies) // 10]
+    threshold = max(VAD_MIN_RMS, noise_floor * VAD_NOISE_RATIO)
+
+    segments = []
+    start = None
+    for index, energy in enumerate(energies + [0]):
+        if energy > threshold and start is None:
+            start = index
+        elif energy <= threshold and start is not None:
+            segments.append((start, index))
+            start = None
+
+    min_frames = max(1, VAD_MIN_SEGMENT_MS // VAD_FRAME_MS)
+    return [(start, end) for start, end in segments if end - start >= min_frames]
+
+
+def trim_silence(pcm, sample_rate=16000):
+    """
+    Cut leading/trailing silence and long pauses out of mono 16-bit PCM.
+
+    Returns (trimmed_pcm, stats) where stats has the original duration, the
+    detected speech duration, their ratio, the duration of the trimmed audio
+    and `has_speech` (False for silent or noise-only clips).
+    """
+    frame_bytes = sample_rate * VAD_FRAME_MS // 1000 * 2
+    frame_count = len(pcm) // frame_bytes
+    energies = [frame_rms(pcm[i * frame_bytes:(i + 1) * frame_bytes]) for i in range(frame_count)]
+    segments = speech_segments(energies)
+
+    padding = VAD_PADDING_MS // VAD_FRAME_MS
+    max_gap = VAD_MAX_GAP_MS // VAD_FRAME_MS
+    kept = []
+    for start, end in segments:
+        start, end = max(0, start - padding), min(frame_count, end + padding)
+        if kept and start - kept[-1][1] <= max_gap:
+            kept[-1] = (kept[-1][0], end)
+        else:
+            kept.append((start, end))
+
+    trimmed = b"".join(pcm[start * frame_bytes:end * frame_bytes] for start, end in kept)
+    frame_seconds = VAD_FRAME_MS / 1000
+    bytes_per_second = sample_rate * 2
+    duration = len(pcm) / bytes_per_second
+    speech_seconds = sum(end - start for start, end in segments) * frame_seconds
+    stats = {
+        "duration_seconds": round(duration, 2),
+        "speech_seconds": round(speech_seconds, 2),
+        "speech_ratio": round(speech_seconds / duration, 3) if duration else 0.0,
+        "uploaded_seconds": round(len(trimmed) / bytes_per_second, 2),
+        "has_speech": speech_seconds * 1000 >= VAD_MIN_SPEECH_MS,
+    }
+    return trimmed, stats
+
+
+class StreamingEndpointer:
+    """
+    Incremental endpointing over a live mono 16-bit PCM stream.
+
+    feed() returns a list of events: ("segment", pcm) when a stretch of speech
+    is followed by a short pause, so it can be transcribed while the user keeps
+    talking, and ("end", None) once the pause is long enough to end the
+    utterance. The noise floor adapts during non-speech frames.
+    """
+
+    def __init__(self, sample_rate=16000):
+        self.frame_bytes = sample_rate * VAD_FRAME_MS // 1000 * 2
+        self._pending = b""
+        self._noise_floor = None
+        self._preroll = deque(maxlen=VAD_PADDING_MS // VAD_FRAME_MS)
+        self._segment = None
+        self._speech_frames = 0
+        self._silence_frames = 0
+        self._has_speech = False
+        # The pause already ended the utterance and nothing has been said since
+        self._ended = False
+
+    @property
+    def in_utterance(self):
+        """Speech has started and the utterance has not ended yet"""
+        return self._segment is not None or self._has_speech
+
+    def feed(self, pcm):
+        data = self._pending + pcm
+        usable = len(data) - len(data) % self.frame_bytes
+        self._pending = data[usable:]
+        events = []
+        for offset in range(0, usable, self.frame_bytes):
+            self._feed_frame(data[offset:offset + self.frame_bytes], events)
+        return events
+
+    def flush(self):
+        """
+        End of input: close any open segment and end the utterance. Returns no
+        events if the pause already ended it (e.g. the client's end-of-utterance
+        message arrives just after the endpointer's).
+        """
+        events = []
+        if self._segment is not None:
+            self._close_segment(events)
+        if not self._ended:
+            events.append(("end", None))
+        self._reset()
+        return events
+
+    def _reset(self):
+        self._pending = b""
+        self._preroll.clear()
+        self._segment = None
+        self._speech_frames = 0
+        self._silence_frames = 0
+        self._has_speech = False
+        self._ended = False
+
+    def _is_speech(self, frame):
+        energy = frame_rms(frame)
+        if self._noise_floor is None:
+            self._noise_floor = energy
+        is_speech = energy > max(VAD_MIN_RMS, self._noise_floor * VAD_NOISE_RATIO)
+        if not is_speech:
+            # Follow the background down immediately, up slowly
+            if energy < self._noise_floor:
+                self._noise_floor = energy
+            else:
+                self._noise_floor += (energy - self._noise_floor) * 0.05
+        return is_speech
+
+    def _feed_frame(self, frame, events):
+        is_speech = self._is_speech(frame)
+        if self._segment is None:
+            if is_speech:
+                self._segment = bytearray(b"".join(self._preroll))
+                self._segment += frame
+                self._speech_frames = 1
+                self._silence_frames = 0
+                self._preroll.clear()
+                return
+            self._preroll.append(frame)
+            if self._has_speech:
+                self._silence_frames += 1
+                if self._silence_frames * VAD_FRAME_MS >= VAD_END_SILENCE_MS:
+                    events.append(("end", None))
+                    self._has_speech = False
+                    self._ended = True
+            return
+
+        self._segment += frame
+        if is_speech:
+            self._speech_frames += 1
+            self._silence_frames = 0
+        else:
+            self._silence_frames += 1
+        segment_ms = len(self._segment) // self.frame_bytes * VAD_FRAME_MS
+        if self._silence_frames * VAD_FRAME_MS >= VAD_SEGMENT_SILENCE_MS or segment_ms >= VAD_MAX_SEGMENT_MS:
+            self._close_segment(events)
+
+    def _close_segment(self, events):
+        if self._speech_frames * VAD_FRAME_MS >= VAD_MIN_SPEECH_MS:
+            events.append(("segment", bytes(self._segment)))
+            self._has_speech = True
+            self._ended = False
+        self._segment = None
+        self._speech_frames = 0
@@ -652,7 +652,7 @@ const HindiTTSApp = () => {
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({
           query,
-          documents: documents,
+          document_ids: documents.map(doc => doc.document_id),
           chat_history: relevantHistory,
           language: selectedLanguage.toLowerCase()
         }),